@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Local Overpass API stand-in for tests and load benchmarks
+
+Serves /api/interpreter (POST or GET, `data` parameter) and /api/status
+like overpass-api.de, answering the query shapes of src/extractors from a
+SyntheticTurkey dataset or from responses recorded in an OverpassCache
+directory. Latency, 429s, 504s and query timeouts can be injected, and
+the number of slots limits concurrent queries like the public server.
+
+    python benchmarks/overpass_server.py --port 8088 --latency 0.2 --error-rate-429 0.05
+    OVERPASS_URL=http://127.0.0.1:8088/api/interpreter python -m src.extractors.extract_streets
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from benchmarks.synthetic import SyntheticTurkey
+from src.utils.overpass_cache import OverpassCache, normalize_query
+from src.utils.overpass_client import DEFAULT_URL
+
+logger = logging.getLogger(__name__)
+
+# Bytes written to the socket at a time
+CHUNK_SIZE = 2**16
+
+_TOO_MANY_REQUESTS = (b'<!DOCTYPE html><html><body><p>The server is probably too busy to handle '
+                      b'your request.</p></body></html>')
+_GATEWAY_TIMEOUT = (b'<!DOCTYPE html><html><body><p>The server is probably too busy to handle '
+                    b'your request.</p></body></html>')
+_BAD_REQUEST = (b'<!DOCTYPE html><html><body><p><strong style="color:#FF0000">Error</strong>: '
+                b'line 1: parse error: No query given </p></body></html>')
+
+
+def synthetic_responder(dataset: SyntheticTurkey) -> Callable[[str], Optional[bytes]]:
+    """Answer queries from a synthetic dataset (JSON bytes rendered once per query)"""
+    responses: Dict[str, bytes] = {}
+    lock = threading.Lock()
+
+    def respond(query: str) -> bytes:
+        key = normalize_query(query)
+        with lock:
+            if key not in responses:
+                responses[key] = json.dumps(dataset.respond(query), ensure_ascii=False).encode('utf-8')
+            return responses[key]
+
+    return respond
+
+
+def recorded_responder(directory, url: str = DEFAULT_URL) -> Callable[[str], Optional[bytes]]:
+    """Answer queries with responses recorded in an OverpassCache directory (None if not recorded)"""
+    cache = OverpassCache(directory, ttls={kind: float('inf')
+                                           for kind in ('admin', 'streets', 'poi', 'query')})
+    lock = threading.Lock()
+
+    def respond(query: str) -> Optional[bytes]:
+        with lock:
+            return cache.get(url, query)
+
+    return respond
+
+
+class OverpassStandIn(ThreadingHTTPServer):
+    """
+    HTTP server answering Overpass queries with a responder function.
+
+    Every query takes one of `slots` slots (a 429 if none is free, None
+    for no limit), waits latency plus up to jitter seconds and then fails
+    with the configured probabilities: a 429, a 504, or a 200 whose JSON
+    ends in a "runtime error: Query timed out" remark, as Overpass sends
+    when a query exceeds its [timeout:]. Faults are drawn from a seeded
+    random generator, so a run is reproducible. While all slots are
+    taken, /api/status says when the first one frees up; 429 and 504
+    answers carry a Retry-After header if retry_after is set. Status
+    counts are kept in `stats`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responder: Callable[[str], Optional[bytes]], host: str = '127.0.0.1',
+                 port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 slots: Optional[int] = 2, error_rate_429: float = 0.0,
+                 error_rate_504: float = 0.0, timeout_rate: float = 0.0, seed: int = 0,
+                 retry_after: Optional[float] = None):
+        super().__init__((host, port), _Handler)
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.slots = slots
+        self.error_rate_429 = error_rate_429
+        self.error_rate_504 = error_rate_504
+        self.timeout_rate = timeout_rate
+        self.retry_after = retry_after
+        self.stats: Counter = Counter()
+        self.running = 0
+        # Expected end (time.monotonic()) of the running queries, by slot
+        self._ends: Dict[int, float] = {}
+        self._slot_ids = itertools.count()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/interpreter"
+
+    def _draw(self):
+        """Fault and delay of the next query"""
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if roll < self.error_rate_429:
+            return '429', delay
+        roll -= self.error_rate_429
+        if roll < self.error_rate_504:
+            return '504', delay
+        roll -= self.error_rate_504
+        if roll < self.timeout_rate:
+            return 'timeout', delay
+        return None, delay
+
+    def acquire_slot(self) -> Optional[int]:
+        """Id of the slot taken, None if all are busy"""
+        with self._lock:
+            if self.slots is not None and self.running >= self.slots:
+                return None
+            self.running += 1
+            slot = next(self._slot_ids)
+            self._ends[slot] = time.monotonic()
+            return slot
+
+    def expect(self, slot: int, delay: float) -> None:
+        """The query in slot will answer after delay seconds"""
+        with self._lock:
+            self._ends[slot] = time.monotonic() + delay
+
+    def release_slot(self, slot: int) -> None:
+        with self._lock:
+            self.running -= 1
+            self._ends.pop(slot, None)
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def status_text(self) -> str:
+        """/api/status in the format of the public server"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            free = 'unlimited' if self.slots is None else max(self.slots - self.running, 0)
+            remaining = sorted(max(end - time.monotonic(), 0) for end in self._ends.values())
+        lines = ["Connected as: 2130706433",
+                 f"Current time: {now:%Y-%m-%dT%H:%M:%SZ}",
+                 "Announced endpoint: none",
+                 f"Rate limit: {self.slots or 0}"]
+        if free == 0:
+            lines += [f"Slot available after: {now + timedelta(seconds=seconds):%Y-%m-%dT%H:%M:%SZ}, "
+                      f"in {math.ceil(seconds)} seconds." for seconds in remaining]
+        else:
+            lines.append(f"{free} slots available now.")
+        lines.append("Currently running queries (pid, space limit, time limit, start time):")
+        return '\n'.join(lines) + '\n'
+
+    def start(self) -> 'OverpassStandIn':
+        self._thread = threading.Thread(target=self.serve_forever, name='overpass-stand-in',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'OverpassStandIn':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: OverpassStandIn
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # the client dropped a kept-alive connection
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/html; charset=utf-8') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if status in (429, 504) and self.server.retry_after is not None:
+            self.send_header('Retry-After', str(math.ceil(self.server.retry_after)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        view = memoryview(body)
+        try:
+            for i in range(0, len(body), CHUNK_SIZE):
+                self.wfile.write(view[i:i + CHUNK_SIZE])
+        except BrokenPipeError:
+            # The client stopped reading, e.g. after an error in its element callback
+            self.close_connection = True
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == '/api/status':
+            self._send(200, self.server.status_text().encode('utf-8'), 'text/plain; charset=utf-8')
+        elif parts.path == '/api/interpreter':
+            self._interpret(parse_qs(parts.query).get('data', [''])[0])
+        else:
+            self._send(404, b'Not found')
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/api/interpreter':
+            self._send(404, b'Not found')
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        # A form with a data field, or the bare query as overpy sends it
+        data = parse_qs(body).get('data') if body.startswith('data=') else None
+        self._interpret(data[0] if data else body)
+
+    def _interpret(self, query: str) -> None:
+        server = self.server
+        if not query.strip():
+            server.count('400')
+            self._send(400, _BAD_REQUEST)
+            return
+        slot = server.acquire_slot()
+        if slot is None:
+            server.count('429')
+            self._send(429, _TOO_MANY_REQUESTS)
+            return
+        try:
+            fault, delay = server._draw()
+            server.expect(slot, delay)
+            time.sleep(delay)
+            if fault == '429':
+                server.count('429')
+                self._send(429, _TOO_MANY_REQUESTS)
+            elif fault == '504':
+                server.count('504')
+                self._send(504, _GATEWAY_TIMEOUT)
+            elif fault == 'timeout':
+                server.count('timeout')
+                self._send(200, json.dumps({
+                    'version': 0.6, 'generator': 'Overpass stand-in', 'elements': [],
+                    'remark': 'runtime error: Query timed out in "query" at line 3 after 1 seconds.'
+                }).encode('utf-8'), 'application/json')
+            else:
+                body = server.responder(query)
+                if body is None:
+                    # Not recorded: an empty result, as Overpass returns for no matches
+                    body = json.dumps({'version': 0.6, 'generator': 'Overpass stand-in',
+                                       'elements': []}).encode('utf-8')
+                server.count('200')
+                self._send(200, body, 'application/json')
+        finally:
+            server.release_slot(slot)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Run a local Overpass API stand-in")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8088, help="Port to listen on (default: 8088)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--scale', type=float, default=1.0,
+                        help="Synthetic dataset size multiplier (default: 1.0)")
+    source.add_argument('--recorded', type=Path,
+                        help="Answer from responses recorded in this OverpassCache directory "
+                             "(e.g. data/cache/overpass) instead of synthetic data")
+    parser.add_argument('--recorded-url', default=DEFAULT_URL,
+                        help="Endpoint the recorded responses were fetched from")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed of the synthetic dataset and the fault injection")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before every answer")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Up to this many random extra seconds of latency")
+    parser.add_argument('--slots', type=int, default=2,
+                        help="Concurrent queries before answering 429 (0 for no limit, default: 2)")
+    parser.add_argument('--error-rate-429', type=float, default=0.0,
+                        help="Share of queries answered with 429 Too Many Requests")
+    parser.add_argument('--error-rate-504', type=float, default=0.0,
+                        help="Share of queries answered with 504 Gateway Timeout")
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help="Share of queries ending in a 'Query timed out' runtime error")
+    parser.add_argument('--retry-after', type=float,
+                        help="Retry-After seconds sent with 429 and 504 answers (default: none)")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = parse_args()
+
+    if args.recorded is not None:
+        responder = recorded_responder(args.recorded, args.recorded_url)
+    else:
+        start = time.perf_counter()
+        dataset = SyntheticTurkey(args.scale, args.seed)
+        logger.info(f"Generated dataset in {time.perf_counter() - start:.1f}s: {dataset.counts()}")
+        responder = synthetic_responder(dataset)
+
+    server = OverpassStandIn(
+        responder, args.host, args.port, latency=args.latency, jitter=args.jitter,
+        slots=args.slots or None, error_rate_429=args.error_rate_429,
+        error_rate_504=args.error_rate_504, timeout_rate=args.timeout_rate, seed=args.seed,
+        retry_after=args.retry_after
+    )
+    logger.info(f"Overpass stand-in listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Answered: {dict(server.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks on synthetic Turkey-like data
+
+Times the PBF extraction (TurkeyExtractor), the three Overpass extractors
+(answered by SyntheticOverpass instead of the live API), the street
+extractor over HTTP against the local Overpass stand-in (with latency and
+429s injected), save_json and build_hierarchy, and compares the results
+with a JSON baseline. Timings only compare on the machine that recorded
+them, so the baseline is not committed: record it on the commit to compare
+against, then run the benchmarks on the change.
+
+    python benchmarks/run_benchmarks.py --save-baseline   # record the baseline (e.g. on main)
+    python benchmarks/run_benchmarks.py                   # compare with baseline.json
+    python benchmarks/run_benchmarks.py --scale 5 --only pbf_extract
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+# Add the project root and scripts/ to Python path
+ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+import build_hierarchy
+import extract_from_pbf
+from benchmarks.overpass_server import OverpassStandIn, synthetic_responder
+from benchmarks.synthetic import PROVINCES, SyntheticOverpass, SyntheticTurkey
+from src.extractors import extract_administrative, extract_poi, extract_streets
+from src.utils.admin_locator import AdminLocator
+from src.utils.metrics import process_stats
+from src.utils.overpass_client import OverpassClient
+from src.utils.utils import save_json
+
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = Path(__file__).parent / 'baseline.json'
+
+# A benchmark is slower than its baseline if its fastest run got slower by more
+# than this (the fastest run is the least affected by other load on the machine)
+REGRESSION_THRESHOLD = 0.25
+
+# Stand-in server behavior of the HTTP benchmark: seconds per query and share of 429s
+HTTP_LATENCY = 0.02
+HTTP_ERROR_RATE_429 = 0.05
+
+# Extractor modules writing to config.OUTPUT_DIR
+OVERPASS_MODULES = (extract_administrative, extract_poi, extract_streets)
+
+
+class Context:
+    """Dataset and scratch files shared by the benchmarks"""
+
+    def __init__(self, dataset: SyntheticTurkey, work_dir: Path):
+        self.dataset = dataset
+        self.work_dir = work_dir
+        self.pbf_file = dataset.write_pbf(work_dir / 'synthetic.osm.pbf')
+        self.polygons_file = work_dir / extract_from_pbf.ADMIN_POLYGONS_FILE
+        self.responder = synthetic_responder(dataset)
+
+        # Reference outputs of one PBF extraction (inputs of save_json/build_hierarchy)
+        reference_dir = work_dir / 'reference'
+        reference_dir.mkdir()
+        handler = extract_from_pbf.run_extraction(str(self.pbf_file),
+                                                  polygons_file=self.polygons_file)
+        extract_from_pbf.save_boundaries_file(reference_dir, handler.admin_boundaries)
+        self.admin_boundaries = build_hierarchy.load_administrative_boundaries(
+            reference_dir / 'turkey_administrative.json'
+        )
+        # Streets as the Overpass pipeline has them (no admin areas yet)
+        self.streets = [
+            {k: v for k, v in street.items()
+             if k not in extract_from_pbf.ADMIN_LEVEL_FIELDS.values()}
+            for streets in handler.streets.values() for street in streets
+        ]
+
+    def scratch(self, name: str) -> Path:
+        directory = self.work_dir / name
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir()
+        return directory
+
+
+def bench_pbf_extract(ctx):
+    """TurkeyExtractor over the whole file, records kept in memory"""
+    handler = extract_from_pbf.run_extraction(
+        str(ctx.pbf_file), polygons_file=ctx.polygons_file, build_polygons=False
+    )
+    return handler.stats['streets'] + handler.stats['pois']
+
+
+def bench_pbf_extract_parquet(ctx):
+    """TurkeyExtractor streaming to Parquet"""
+    output = extract_from_pbf.ParquetOutput(ctx.scratch('parquet'))
+    handler = extract_from_pbf.run_extraction(
+        str(ctx.pbf_file), output=output, polygons_file=ctx.polygons_file, build_polygons=False
+    )
+    return handler.stats['streets'] + handler.stats['pois']
+
+
+def _overpass_extractor(ctx, extractor_class, client=None):
+    # setup_logging() adds handlers on every construction; drop the previous ones
+    log = logging.getLogger('osm_extractor')
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+    extractor = extractor_class()
+    extractor.client = client or SyntheticOverpass(ctx.dataset)
+    log.setLevel(logging.WARNING)
+    return extractor
+
+
+def bench_overpass_admin(ctx):
+    """AdministrativeExtractor: country hierarchy and per-province boundaries"""
+    extractor = _overpass_extractor(ctx, extract_administrative.AdministrativeExtractor)
+    items = len(extractor.extract_turkey_admin_hierarchy())
+    boundaries = extractor.extract_all_regions_admin_boundaries(list(PROVINCES))
+    return items + sum(len(region) for region in boundaries.values())
+
+
+def bench_overpass_streets(ctx):
+    """StreetExtractor for every province"""
+    extractor = _overpass_extractor(ctx, extract_streets.StreetExtractor)
+    summary = extractor.extract_all_regions_streets()
+    return sum(region['streets_count'] for region in summary.values())
+
+
+def bench_overpass_poi(ctx):
+    """POIExtractor for every province and category"""
+    extractor = _overpass_extractor(ctx, extract_poi.POIExtractor)
+    summary = extractor.extract_all_regions_poi()
+    return sum(region['total_pois'] for region in summary.values())
+
+
+def bench_overpass_http(ctx):
+    """StreetExtractor over HTTP against the Overpass stand-in (2 slots, latency, some 429s)"""
+    with OverpassStandIn(ctx.responder, latency=HTTP_LATENCY, slots=2,
+                         error_rate_429=HTTP_ERROR_RATE_429) as server:
+        client = OverpassClient(url=server.url, concurrency=2, rate=0, cache=False, retry_delay=0)
+        extractor = _overpass_extractor(ctx, extract_streets.StreetExtractor, client)
+        try:
+            summary = extractor.extract_all_regions_streets()
+        finally:
+            client.close()
+    return sum(region['streets_count'] for region in summary.values())
+
+
+def bench_save_json(ctx):
+    """save_json of all street records"""
+    save_json(ctx.streets, ctx.scratch('save_json') / 'streets.json')
+    return len(ctx.streets)
+
+
+def bench_build_hierarchy(ctx):
+    """build_hierarchy_simple with admin polygon lookups, then save_hierarchy"""
+    streets = copy.deepcopy(ctx.streets)
+    locator = AdminLocator.from_geojson(ctx.polygons_file)
+    hierarchy = build_hierarchy.build_hierarchy_simple(streets, ctx.admin_boundaries, locator)
+    build_hierarchy.save_hierarchy(hierarchy, ctx.scratch('hierarchy') / 'turkey_hierarchy.json')
+    return len(streets)
+
+
+BENCHMARKS = {
+    'pbf_extract': bench_pbf_extract,
+    'pbf_extract_parquet': bench_pbf_extract_parquet,
+    'overpass_admin': bench_overpass_admin,
+    'overpass_streets': bench_overpass_streets,
+    'overpass_poi': bench_overpass_poi,
+    'overpass_http': bench_overpass_http,
+    'save_json': bench_save_json,
+    'build_hierarchy': bench_build_hierarchy,
+}
+
+
+def run_benchmark(ctx, function, repeats):
+    """Run a benchmark repeats times (after one warm-up run); returns its timings"""
+    function(ctx)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        items = function(ctx)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        'items': items,
+        'median_seconds': round(median, 4),
+        'min_seconds': round(min(times), 4),
+        'items_per_second': round(items / median, 1) if median > 0 else None,
+    }
+
+
+def run_benchmarks(names, scale=1.0, seed=0, repeats=3):
+    """Generate the dataset and run the named benchmarks; returns the result document"""
+    work_dir = Path(tempfile.mkdtemp(prefix='osm-bench-'))
+    patches = [mock.patch.object(module, 'OUTPUT_DIR', work_dir / 'overpass')
+               for module in OVERPASS_MODULES]
+    # The extractors' own clients are replaced by SyntheticOverpass: don't open the response
+    # cache, and keep the synthetic area ids out of the real region index
+    patches.append(mock.patch.dict(extract_poi.CONFIG, {'cache_dir': None,
+                                                        'region_index': work_dir / 'region_areas.json'}))
+    try:
+        (work_dir / 'overpass').mkdir()
+        for patch in patches:
+            patch.start()
+
+        start = time.perf_counter()
+        dataset = SyntheticTurkey(scale, seed)
+        ctx = Context(dataset, work_dir)
+        logger.info(f"Generated dataset in {time.perf_counter() - start:.1f}s: {dataset.counts()}, "
+                    f"{ctx.pbf_file.stat().st_size / 2**20:.1f} MiB PBF")
+
+        results = {}
+        for name in names:
+            results[name] = run_benchmark(ctx, BENCHMARKS[name], repeats)
+            logger.info(f"{name:<22} {results[name]['median_seconds']:>9.3f}s "
+                        f"{results[name]['items_per_second'] or 0:>12,.0f} items/s")
+    finally:
+        for patch in patches:
+            patch.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'scale': scale,
+        'seed': seed,
+        'repeats': repeats,
+        'dataset': dataset.counts(),
+        'peak_rss_bytes': process_stats()['peak_rss_bytes'],
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return the names of benchmarks whose fastest run regressed beyond threshold"""
+    if (baseline.get('scale'), baseline.get('seed')) != (current['scale'], current['seed']):
+        logger.warning(f"Baseline was recorded at scale {baseline.get('scale')} / seed "
+                       f"{baseline.get('seed')}, not comparing")
+        return []
+    if baseline.get('machine') != current['machine']:
+        logger.warning(f"Baseline was recorded on another machine ({baseline.get('machine')}), "
+                       "not comparing; record it here with --save-baseline")
+        return []
+
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            logger.info(f"{name:<22} (no baseline)")
+            continue
+        change = result['min_seconds'] / reference['min_seconds'] - 1
+        marker = 'REGRESSION' if change > threshold else ''
+        logger.info(f"{name:<22} {reference['min_seconds']:>9.3f}s -> "
+                    f"{result['min_seconds']:>9.3f}s {change:>+8.1%} {marker}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Dataset size multiplier (1.0 is about 18k named streets and 5k POIs)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the dataset")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="Timed runs per benchmark, after one warm-up run (default: 3)")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE,
+                        help=f"Baseline file (default: {BASELINE_FILE.relative_to(ROOT)})")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Write the results to the baseline file instead of comparing")
+    parser.add_argument('--output', type=Path, help="Also write the results to this file")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Allowed slowdown before a benchmark counts as a regression "
+                             f"(default: {REGRESSION_THRESHOLD})")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s', force=True)
+    args = parse_args()
+    # Keep the extraction progress out of the benchmark report
+    logging.getLogger(extract_from_pbf.__name__).setLevel(logging.WARNING)
+    logging.getLogger(build_hierarchy.__name__).setLevel(logging.WARNING)
+
+    current = run_benchmarks(args.only, args.scale, args.seed, args.repeats)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(current, indent=2), encoding='utf-8')
+
+    if args.save_baseline:
+        if args.baseline.exists():
+            # Keep the baselines of benchmarks that were not run
+            previous = json.loads(args.baseline.read_text(encoding='utf-8'))
+            if (previous.get('scale'), previous.get('seed')) == (args.scale, args.seed):
+                current['results'] = {**previous['results'], **current['results']}
+        args.baseline.write_text(json.dumps(current, indent=2) + '\n', encoding='utf-8')
+        logger.info(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        logger.warning(f"No baseline at {args.baseline}, record one with --save-baseline "
+                       "(e.g. on the commit to compare against)")
+        return 0
+
+    logger.info("")
+    regressions = compare(current, json.loads(args.baseline.read_text(encoding='utf-8')),
+                          args.threshold)
+    if regressions:
+        logger.error(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Synthetic Turkey-like OSM data for offline benchmarks
+
+Generates a reproducible dataset (fixed seed) with the same shape as the
+real Turkey extract: 15 provinces at their approximate locations with a
+district/neighborhood grid, street counts proportional to population and
+clustered around the city centers, a realistic highway type mix and a POI
+mix drawn from config.POI_CATEGORIES. The dataset can be written as a PBF
+file (for TurkeyExtractor) or served as Overpass JSON (for the Overpass
+extractors, see SyntheticOverpass).
+"""
+
+import json
+import math
+import random
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import osmium
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from config import POI_CATEGORIES
+from src.utils.tag_rules import TagRules
+from src.utils.overpass_client import CHUNK_SIZE, OverpassClient
+from src.utils.overpass_geometry import GEOMETRY_MODES
+from src.utils.region_resolver import AREA_ID_OFFSET
+
+# Provinces with (min_lat, max_lat, min_lon, max_lon) and population in millions
+PROVINCES = {
+    'İstanbul': ((40.8, 41.3, 28.5, 29.5), 15.9),
+    'Ankara': ((39.7, 40.2, 32.5, 33.2), 5.8),
+    'İzmir': ((38.2, 38.6, 26.8, 27.4), 4.5),
+    'Bursa': ((40.0, 40.4, 28.7, 29.4), 3.2),
+    'Antalya': ((36.7, 37.2, 30.4, 31.2), 2.7),
+    'Adana': ((36.8, 37.2, 35.0, 35.6), 2.3),
+    'Konya': ((37.7, 38.2, 32.2, 33.0), 2.3),
+    'Gaziantep': ((36.9, 37.3, 37.2, 37.6), 2.2),
+    'Şanlıurfa': ((37.0, 37.4, 38.6, 39.2), 2.2),
+    'Diyarbakır': ((37.8, 38.0, 39.9, 40.4), 1.8),
+    'Mersin': ((36.6, 37.0, 34.4, 34.8), 1.9),
+    'Kayseri': ((38.6, 38.9, 35.3, 35.7), 1.4),
+    'Eskişehir': ((39.6, 39.9, 30.4, 31.0), 0.9),
+    'Trabzon': ((40.8, 41.2, 39.5, 40.0), 0.8),
+    'Erzurum': ((39.8, 40.1, 41.0, 41.5), 0.75),
+}
+
+# Districts and neighborhoods per province / district (grid cells per side)
+DISTRICT_GRID = 3
+NEIGHBORHOOD_GRID = 3
+
+# Highway types of named ways and their share
+HIGHWAY_MIX = {
+    'residential': 0.58, 'service': 0.08, 'unclassified': 0.07, 'tertiary': 0.08,
+    'secondary': 0.05, 'primary': 0.03, 'trunk': 0.01, 'living_street': 0.03,
+    'footway': 0.04, 'pedestrian': 0.02, 'track': 0.01,
+}
+
+# Relative frequency of the POI filters (1 if not listed)
+POI_MIX = {
+    'amenity=place_of_worship': 30, 'amenity=school': 18, 'amenity=pharmacy': 14,
+    'amenity=cafe': 14, 'amenity=restaurant': 14, 'shop=supermarket': 12,
+    'amenity=atm': 10, 'amenity=bank': 8, 'amenity=fuel': 8, 'amenity=kindergarten': 6,
+    'amenity=doctors': 4, 'amenity=clinic': 4, 'amenity=police': 3, 'amenity=post_office': 3,
+    'office=government': 3, 'amenity=hospital': 2, 'amenity=townhall': 2,
+    'amenity=taxi': 2, 'building=mosque': 2,
+}
+
+# Streets per million inhabitants at scale 1.0, POIs per street, way length
+STREETS_PER_MILLION = 500
+POIS_PER_STREET = 0.3
+MEAN_WAY_NODES = 6
+
+# Share of streets without a name (filtered out by the extractors) and of
+# POIs mapped as building outlines / multipolygons instead of nodes
+UNNAMED_SHARE = 0.25
+CLOSED_WAY_POI_SHARE = 0.12
+MULTIPOLYGON_POI_SHARE = 0.01
+
+STREET_WORDS = ['Atatürk', 'Cumhuriyet', 'İstiklal', 'Gazi', 'Fatih', 'Mevlana', 'Yıldız',
+                'Lale', 'Menekşe', 'Çınar', 'Şehit', 'Barış', 'Gül', 'Zafer', 'Kardeşlik']
+STREET_SUFFIXES = ['Sokak', 'Sokak', 'Sokak', 'Caddesi', 'Bulvarı']
+
+Point = Tuple[int, float, float]  # (node id, lat, lon)
+
+
+class SyntheticTurkey:
+    """
+    A generated dataset; scale multiplies the number of streets and POIs.
+
+    Elements are kept as plain tuples/dicts (nodes, ways, relations) so the
+    same data can be written to a PBF file or rendered as Overpass JSON.
+    """
+
+    def __init__(self, scale: float = 1.0, seed: int = 0):
+        self.scale = scale
+        self.seed = seed
+        self.rules = TagRules(POI_CATEGORIES)
+        self.nodes: Dict[int, Tuple[float, float, Dict]] = {}
+        self.ways: Dict[int, Tuple[List[int], Dict]] = {}
+        self.relations: Dict[int, Tuple[List[Tuple[str, int, str]], Dict]] = {}
+        # Element ids per province: streets, POIs by filter, admin relations
+        self.streets: Dict[str, List[int]] = {}
+        self.pois: Dict[str, Dict[str, List[Tuple[str, int]]]] = {}
+        self.admin: Dict[str, List[int]] = {}
+        self._next_id = {'n': 1, 'w': 1, 'r': 1}
+        self._rng = random.Random(seed)
+        self._generate()
+
+    def _id(self, kind: str) -> int:
+        value = self._next_id[kind]
+        self._next_id[kind] += 1
+        return value
+
+    def _node(self, lat: float, lon: float, tags: Optional[Dict] = None) -> int:
+        node_id = self._id('n')
+        self.nodes[node_id] = (round(lat, 7), round(lon, 7), tags or {})
+        return node_id
+
+    def _ring(self, min_lat, max_lat, min_lon, max_lon, tags=None) -> int:
+        corners = [(min_lat, min_lon), (min_lat, max_lon), (max_lat, max_lon), (max_lat, min_lon)]
+        refs = [self._node(lat, lon) for lat, lon in corners]
+        way_id = self._id('w')
+        self.ways[way_id] = (refs + refs[:1], tags or {})
+        return way_id
+
+    def _boundary(self, name: str, admin_level: str, bbox) -> int:
+        way_id = self._ring(*bbox)
+        relation_id = self._id('r')
+        self.relations[relation_id] = ([('w', way_id, 'outer')], {
+            'type': 'boundary', 'boundary': 'administrative',
+            'admin_level': admin_level, 'name': name,
+        })
+        return relation_id
+
+    def _generate(self) -> None:
+        rng = self._rng
+        all_bounds = [bbox for bbox, _ in PROVINCES.values()]
+        country = self._boundary('Türkiye', '2', (
+            min(b[0] for b in all_bounds), max(b[1] for b in all_bounds),
+            min(b[2] for b in all_bounds), max(b[3] for b in all_bounds)
+        ))
+        self.relations[country][1]['name:en'] = 'Turkey'
+
+        filters = [rule.filter for rule in self.rules]
+        weights = [POI_MIX.get(f, 1) for f in filters]
+        highways, highway_weights = zip(*HIGHWAY_MIX.items())
+
+        for province, (bbox, population) in PROVINCES.items():
+            self.admin[province] = [self._boundary(province, '4', bbox)]
+            self.admin[province] += self._subdivide(province, bbox)
+
+            min_lat, max_lat, min_lon, max_lon = bbox
+            center = ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+            spread = ((max_lat - min_lat) / 5, (max_lon - min_lon) / 5)
+
+            def point():
+                # Dense city center, thinning out towards the province border
+                lat = min(max(rng.gauss(center[0], spread[0]), min_lat), max_lat)
+                lon = min(max(rng.gauss(center[1], spread[1]), min_lon), max_lon)
+                return lat, lon
+
+            streets = self.streets[province] = []
+            for i in range(max(1, round(population * STREETS_PER_MILLION * self.scale))):
+                lat, lon = point()
+                count = 2 + min(int(rng.expovariate(1 / (MEAN_WAY_NODES - 2))), 60)
+                heading = rng.uniform(0, 2 * math.pi)
+                step = rng.uniform(0.0002, 0.001)
+                refs = [
+                    self._node(lat + k * step * math.sin(heading),
+                               lon + k * step * math.cos(heading))
+                    for k in range(count)
+                ]
+                tags = {'highway': rng.choices(highways, highway_weights)[0]}
+                if rng.random() >= UNNAMED_SHARE:
+                    tags['name'] = f"{rng.choice(STREET_WORDS)} {i} {rng.choice(STREET_SUFFIXES)}"
+                    if rng.random() < 0.3:
+                        tags['surface'] = rng.choice(['asphalt', 'paving_stones', 'concrete'])
+                    if rng.random() < 0.1:
+                        tags['maxspeed'] = rng.choice(['30', '50', '70'])
+                way_id = self._id('w')
+                self.ways[way_id] = (refs, tags)
+                if 'name' in tags:
+                    streets.append(way_id)
+
+            pois = self.pois[province] = {}
+            for i in range(round(len(streets) * POIS_PER_STREET)):
+                filter_str = rng.choices(filters, weights)[0]
+                key, value = filter_str.split('=', 1)
+                tags = {key: value, 'name': f"{value.replace('_', ' ').title()} {i}"}
+                if rng.random() < 0.3:
+                    tags['addr:city'] = province
+                lat, lon = point()
+                shape = rng.random()
+                if shape < MULTIPOLYGON_POI_SHARE:
+                    way_id = self._ring(lat, lat + 0.001, lon, lon + 0.001)
+                    element = ('relation', self._id('r'))
+                    tags['type'] = 'multipolygon'
+                    self.relations[element[1]] = ([('w', way_id, 'outer')], tags)
+                elif shape < MULTIPOLYGON_POI_SHARE + CLOSED_WAY_POI_SHARE:
+                    element = ('way', self._ring(lat, lat + 0.0003, lon, lon + 0.0003,
+                                                 {'building': 'yes', **tags}))
+                else:
+                    element = ('node', self._node(lat, lon, tags))
+                pois.setdefault(filter_str, []).append(element)
+
+    def _subdivide(self, province: str, bbox) -> List[int]:
+        """District and neighborhood boundaries on a regular grid"""
+        relations = []
+        for d, district_bbox in enumerate(_grid(bbox, DISTRICT_GRID)):
+            district = f"{province} İlçe {d + 1}"
+            relations.append(self._boundary(district, '6', district_bbox))
+            for n, neighborhood_bbox in enumerate(_grid(district_bbox, NEIGHBORHOOD_GRID)):
+                relations.append(self._boundary(f"{district} Mahalle {n + 1}", '8',
+                                                neighborhood_bbox))
+        return relations
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            'nodes': len(self.nodes),
+            'ways': len(self.ways),
+            'relations': len(self.relations),
+            'streets': sum(len(ids) for ids in self.streets.values()),
+            'pois': sum(len(ids) for f in self.pois.values() for ids in f.values()),
+        }
+
+    def write_pbf(self, filename) -> Path:
+        """Write the dataset as a (sorted) .osm.pbf file"""
+        filename = Path(filename)
+        if filename.exists():
+            filename.unlink()
+        writer = osmium.SimpleWriter(str(filename))
+        try:
+            for node_id, (lat, lon, tags) in self.nodes.items():
+                writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(lon, lat),
+                                                        tags=tags, version=1))
+            for way_id, (refs, tags) in self.ways.items():
+                writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=refs, tags=tags, version=1))
+            for relation_id, (members, tags) in self.relations.items():
+                writer.add_relation(osmium.osm.mutable.Relation(
+                    id=relation_id, members=members, tags=tags, version=1
+                ))
+        finally:
+            writer.close()
+        return filename
+
+    # Overpass JSON rendering in the geometry modes of src/utils/overpass_geometry
+    # ('full' is 'out body; >; out skel qt;')
+
+    def _node_json(self, node_id: int, body: bool) -> Dict:
+        lat, lon, tags = self.nodes[node_id]
+        element = {'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon}
+        if body and tags:
+            element['tags'] = tags
+        return element
+
+    def _points(self, way_id: int) -> List[Dict]:
+        return [{'lat': self.nodes[ref][0], 'lon': self.nodes[ref][1]} for ref in self.ways[way_id][0]]
+
+    @staticmethod
+    def _add_geometry(element: Dict, points: List[Dict], mode: str) -> None:
+        """Center / bounds of an element with the given points, as out center / bb / geom add them"""
+        if mode not in ('center', 'bbox', 'geom') or not points:
+            return
+        lats = [point['lat'] for point in points]
+        lons = [point['lon'] for point in points]
+        if mode == 'center':
+            element['center'] = {'lat': (min(lats) + max(lats)) / 2, 'lon': (min(lons) + max(lons)) / 2}
+        else:
+            element['bounds'] = {'minlat': min(lats), 'minlon': min(lons),
+                                 'maxlat': max(lats), 'maxlon': max(lons)}
+
+    def overpass_result(self, nodes=(), ways=(), relations=(), mode: str = 'full') -> Dict:
+        """Tagged elements, with their members below them in 'full' mode, as Overpass returns them"""
+        elements = [self._node_json(node_id, True) for node_id in nodes]
+        member_ways, member_nodes = [], []
+        for relation_id in relations:
+            members, tags = self.relations[relation_id]
+            element = {
+                'type': 'relation', 'id': relation_id, 'tags': tags,
+                'members': [{'type': {'w': 'way', 'n': 'node', 'r': 'relation'}[t],
+                             'ref': ref, 'role': role} for t, ref, role in members],
+            }
+            points = [point for t, ref, _ in members if t == 'w' for point in self._points(ref)]
+            self._add_geometry(element, points, mode)
+            if mode == 'geom':
+                for member in element['members']:
+                    if member['type'] == 'way':
+                        member['geometry'] = self._points(member['ref'])
+            elements.append(element)
+            member_ways += [ref for t, ref, _ in members if t == 'w']
+        for way_id in ways:
+            refs, tags = self.ways[way_id]
+            element = {'type': 'way', 'id': way_id, 'nodes': refs, 'tags': tags}
+            self._add_geometry(element, self._points(way_id), mode)
+            if mode == 'geom':
+                element['geometry'] = self._points(way_id)
+            elements.append(element)
+            member_nodes += refs
+        if mode == 'full':
+            for way_id in dict.fromkeys(member_ways):
+                refs, _ = self.ways[way_id]
+                elements.append({'type': 'way', 'id': way_id, 'nodes': refs})
+                member_nodes += refs
+            for node_id in dict.fromkeys(member_nodes):
+                elements.append(self._node_json(node_id, False))
+        return {'version': 0.6, 'generator': 'synthetic', 'elements': elements}
+
+    def admin_result(self, province: Optional[str] = None, mode: str = 'full') -> Dict:
+        if province is None:
+            relations = [r for ids in self.admin.values() for r in ids]
+        else:
+            relations = self.admin.get(province, [])
+        return self.overpass_result(relations=relations, mode=mode)
+
+    def streets_result(self, province: str, bbox: Optional[Tuple[float, ...]] = None,
+                       mode: str = 'full') -> Dict:
+        """Streets of a province; with a (south, west, north, east) bbox, those with a node inside"""
+        ways = self.streets.get(province, [])
+        if bbox is not None:
+            south, west, north, east = bbox
+            ways = [way_id for way_id in ways if any(
+                south <= self.nodes[ref][0] <= north and west <= self.nodes[ref][1] <= east
+                for ref in self.ways[way_id][0]
+            )]
+        return self.overpass_result(ways=ways, mode=mode)
+
+    def poi_result(self, province: str, filters: List[str], mode: str = 'full') -> Dict:
+        """Elements matching any of filters, in id order like an Overpass union"""
+        pois = self.pois.get(province, {})
+        elements = sorted({element for f in filters for element in pois.get(f, [])})
+        return self.overpass_result(
+            nodes=[i for t, i in elements if t == 'node'],
+            ways=[i for t, i in elements if t == 'way'],
+            relations=[i for t, i in elements if t == 'relation'],
+            mode=mode,
+        )
+
+    def _area_provinces(self) -> Dict[int, str]:
+        """Province names by boundary relation id"""
+        return {relations[0]: province for province, relations in self.admin.items()}
+
+    def respond(self, query: str) -> Dict:
+        """Overpass JSON for one of the queries built by src/extractors"""
+        if 'out ids bb;' in query:
+            # RegionResolver lookup of a province relation
+            name = re.search(r'relation\[[^;]*\["name"="([^"]+)"\]', query)
+            province = name.group(1) if name else None
+            if province not in self.admin:
+                return {'version': 0.6, 'generator': 'synthetic', 'elements': []}
+            min_lat, max_lat, min_lon, max_lon = PROVINCES[province][0]
+            return {'version': 0.6, 'generator': 'synthetic', 'elements': [{
+                'type': 'relation', 'id': self.admin[province][0],
+                'bounds': {'minlat': min_lat, 'minlon': min_lon, 'maxlat': max_lat, 'maxlon': max_lon}
+            }]}
+        area = re.search(r'area\["name"="([^"]+)"\]', query)
+        province = area.group(1) if area else None
+        area_id = re.search(r'area\((\d+)\)', query)
+        if area_id:
+            province = self._area_provinces().get(int(area_id.group(1)) - AREA_ID_OFFSET)
+        # 'full' first, its statements include those of 'none'
+        mode = next((mode for mode, statements in reversed(GEOMETRY_MODES.items())
+                     if all(statement in query for statement in statements)), 'none')
+        if '"boundary"="administrative"' in query:
+            return self.admin_result(province, mode)
+        if 'way["highway"]' in query:
+            bbox = re.search(r'\(area\.searchArea\)\(([-\d.,]+)\)', query)
+            return self.streets_result(
+                province, tuple(float(v) for v in bbox.group(1).split(',')) if bbox else None, mode
+            )
+        filters = [rule.filter for rule in self.rules if rule.overpass() in query]
+        if filters:
+            return self.poi_result(province, filters, mode)
+        return self.overpass_result()
+
+
+def _grid(bbox, cells: int):
+    min_lat, max_lat, min_lon, max_lon = bbox
+    dlat = (max_lat - min_lat) / cells
+    dlon = (max_lon - min_lon) / cells
+    for i in range(cells):
+        for j in range(cells):
+            yield (min_lat + i * dlat, min_lat + (i + 1) * dlat,
+                   min_lon + j * dlon, min_lon + (j + 1) * dlon)
+
+
+class SyntheticOverpass(OverpassClient):
+    """
+    Overpass API stand-in answering queries from a SyntheticTurkey dataset.
+
+    Responses are rendered to JSON bytes once and cached, so repeated runs
+    measure parsing and processing only. There is no rate limit and no
+    response cache.
+    """
+
+    def __init__(self, dataset: SyntheticTurkey):
+        super().__init__(url='synthetic', rate=0, cache=False)
+        self.dataset = dataset
+        self._responses: Dict[str, bytes] = {}
+
+    def _open(self, endpoint, query: str):
+        if query not in self._responses:
+            self._responses[query] = json.dumps(self.dataset.respond(query)).encode('utf-8')
+        body = memoryview(self._responses[query])
+        # Served in chunks like a streamed HTTP response
+        return 200, {'Content-Type': 'application/json'}, (
+            bytes(body[i:i + CHUNK_SIZE]) for i in range(0, len(body), CHUNK_SIZE)
+        )
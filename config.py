@@ -18,8 +18,31 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 CONFIG = {
     'timeout': 600,  # 10 minutes per query
     'max_retries': 3,
-    'retry_delay': 30,
-    'batch_size': 100
+    'retry_delay': 30,  # base of the exponential retry backoff (seconds)
+    'retry_max_delay': 300,  # longest wait before a retry
+    'batch_size': 100,
+    'output_format': 'json',  # 'json' or 'parquet'
+    'overpass_url': os.environ.get('OVERPASS_URL', 'https://overpass-api.de/api/interpreter'),  # primary endpoint, or a local stand-in
+    # Further endpoints queries fail over to and are balanced across: URLs or
+    # {'url', 'slots', 'rate'} dicts, e.g. a self-hosted instance
+    # {'url': 'http://localhost:12345/api/interpreter', 'slots': 8, 'rate': 0}
+    # or 'https://overpass.kumi.systems/api/interpreter'
+    'overpass_mirrors': [],
+    'overpass_concurrency': None,  # queries in flight at once (None: the slots of all endpoints)
+    'overpass_rate': 0.5,  # queries started per second (token bucket refill, 0 = unlimited)
+    'overpass_slots': 2,  # queries in flight and token bucket size per endpoint; the public server grants 2 slots per IP
+    'region_index': DATA_DIR / 'region_areas.json',  # Overpass area ids of REGIONS, resolved once
+    'tile_max_elements': 1_000_000,  # split a region query into quadtree tiles above this many elements
+    'tile_max_depth': 4,  # quadtree splits before a tile that still times out is given up
+    'poi_batching': 'region',  # POI queries: one union per 'region', per 'category' or per 'filter'
+    # Geometry Overpass returns, by query kind: 'none', 'center', 'bbox', 'geom' (inline
+    # coordinates) or 'full' (every member way and node); streets need 'geom' or 'full' for linestrings
+    'overpass_geometry': {'admin': 'none', 'streets': 'full', 'poi': 'center'},
+    'cache_dir': DATA_DIR / 'cache' / 'overpass',  # Overpass response cache (None disables it)
+    'cache_max_bytes': 2 * 2**30,  # compressed bytes kept before evicting least recently used
+    'cache_ttl': {'admin': 30 * 86400, 'streets': 7 * 86400, 'poi': 86400},  # seconds, by query kind
+    'metrics_file': None,  # e.g. LOG_DIR / 'metrics.prom' (Prometheus text) or 'metrics.json'
+    'metrics_interval': 30  # seconds between metrics exports
 }
 
 # Turkey regions to process
@@ -40,6 +63,8 @@ ADMIN_LEVELS = {
 }
 
 # POI categories
+# 'key=value' filters, compiled by src.utils.tag_rules.TagRules and used
+# by both the Overpass extractors and scripts/extract_from_pbf.py
 POI_CATEGORIES = {
     'education': {
         'filters': ['amenity=university', 'amenity=school', 'amenity=college', 'amenity=kindergarten'],
@@ -50,7 +75,8 @@ POI_CATEGORIES = {
         'tags': ['name', 'healthcare', 'beds']
     },
     'government': {
-        'filters': ['amenity=townhall', 'office=government', 'amenity=courthouse'],
+        'filters': ['amenity=townhall', 'office=government', 'amenity=courthouse',
+                    'amenity=police', 'amenity=post_office'],
         'tags': ['name', 'government']
     },
     'religious': {
@@ -58,11 +84,13 @@ POI_CATEGORIES = {
         'tags': ['name', 'religion', 'denomination']
     },
     'commercial': {
-        'filters': ['shop=supermarket', 'amenity=bank', 'amenity=restaurant', 'amenity=cafe'],
+        'filters': ['shop=supermarket', 'amenity=bank', 'amenity=restaurant', 'amenity=cafe',
+                    'amenity=atm', 'amenity=marketplace'],
         'tags': ['name', 'cuisine', 'operator']
     },
     'transportation': {
-        'filters': ['amenity=bus_station', 'railway=station', 'aeroway=airport'],
+        'filters': ['amenity=bus_station', 'railway=station', 'aeroway=airport',
+                    'amenity=ferry_terminal', 'amenity=taxi', 'amenity=fuel'],
         'tags': ['name', 'operator', 'public_transport']
     }
-}
\ No newline at end of file
+}
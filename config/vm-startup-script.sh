@@ -7,7 +7,7 @@ echo "Starting VM setup for OSM extraction..."
 apt update && apt upgrade -y
 
 # Install system dependencies
-apt install -y python3-pip python3-venv wget git curl htop
+apt install -y python3-pip python3-venv wget git curl htop osmium-tool
 
 # Format and mount data disk
 mkfs.ext4 -m 0 -E lazy_itable_init=0,lazy_journal_init=0,discard /dev/sdb
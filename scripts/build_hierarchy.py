@@ -5,12 +5,18 @@ Province -> District -> Neighborhood -> Street
 """
 
 import json
+import sys
 from pathlib import Path
 from collections import defaultdict
 from shapely.geometry import Point, Polygon, MultiPolygon
 from shapely.prepared import prep
 import logging
 
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from src.utils.admin_locator import AdminLocator
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -51,10 +57,20 @@ def load_streets(streets_file):
     logger.info(f"Loaded {data['total_count']:,} streets")
     return data['streets']
 
-def build_hierarchy_simple(streets, admin_boundaries):
+def load_all_streets(base_dir):
+    """Load the streets of every <city>_streets.json in base_dir"""
+    streets = []
+    for streets_file in sorted(Path(base_dir).glob("*_streets.json")):
+        streets.extend(load_streets(streets_file))
+    return streets
+
+def build_hierarchy_simple(streets, admin_boundaries, locator=None):
     """
     Build hierarchy based on street names and administrative boundaries
-    Since we don't have polygon geometries, we'll use a simpler approach
+
+    Streets extracted with admin polygons already carry province, district
+    and neighborhood. Otherwise they are located with the AdminLocator if
+    one is given, and as a last resort by approximate bounding boxes.
     """
     logger.info("Building address hierarchy...")
     
@@ -68,6 +84,19 @@ def build_hierarchy_simple(streets, admin_boundaries):
     
     logger.info(f"Processing {len(streets):,} streets...")
     
+    # Locate streets without admin areas in one batch
+    if locator is not None:
+        missing = [
+            street for street in streets
+            if 'province' not in street and street.get('center_lat') and street.get('center_lon')
+        ]
+        areas = locator.locate_many(
+            [street['center_lat'] for street in missing],
+            [street['center_lon'] for street in missing]
+        )
+        for street, street_areas in zip(missing, areas):
+            street.update(street_areas)
+    
     processed = 0
     for street in streets:
         # Try to determine location from coordinates
@@ -77,10 +106,15 @@ def build_hierarchy_simple(streets, admin_boundaries):
         if not lat or not lon:
             continue
         
-        # Approximate province based on coordinates
-        province = determine_province_by_coords(lat, lon)
-        district = "Unknown District"
-        neighborhood = "Unknown Neighborhood"
+        if 'province' in street:
+            province = street['province'] or "Other Province"
+            district = street.get('district') or "Unknown District"
+            neighborhood = street.get('neighborhood') or "Unknown Neighborhood"
+        else:
+            # Approximate province based on coordinates
+            province = determine_province_by_coords(lat, lon)
+            district = "Unknown District"
+            neighborhood = "Unknown Neighborhood"
         
         # Add street to hierarchy
         hierarchy[province][district][neighborhood].append({
@@ -154,7 +188,7 @@ def save_hierarchy(hierarchy, output_file):
     # Create summary
     result = {
         'extracted_at': '2025-10-21T03:51:38',
-        'method': 'Hierarchical organization by coordinates',
+        'method': 'Hierarchical organization by admin polygons (bounding boxes as fallback)',
         'statistics': {
             'total_provinces': len(output),
             'total_streets': total_streets
@@ -185,7 +219,7 @@ def main():
     # File paths
     base_dir = Path("turkey-osm-output")
     admin_file = base_dir / "turkey_administrative.json"
-    streets_file = base_dir / "Unknown_streets.json"
+    polygons_file = base_dir / "turkey_admin_polygons.geojson"
     output_file = base_dir / "turkey_hierarchy.json"
     
     # Check files exist
@@ -193,20 +227,29 @@ def main():
         logger.error(f"Administrative boundaries file not found: {admin_file}")
         return
     
-    if not streets_file.exists():
-        logger.error(f"Streets file not found: {streets_file}")
+    # Streets are split into one file per province (Unknown_streets.json
+    # holds those outside every province polygon)
+    if not any(base_dir.glob("*_streets.json")):
+        logger.error(f"No *_streets.json files found in {base_dir}")
         return
     
     # Load data
     admin_boundaries = load_administrative_boundaries(admin_file)
-    streets = load_streets(streets_file)
+    streets = load_all_streets(base_dir)
+    
+    locator = None
+    if polygons_file.exists():
+        logger.info(f"Loading admin polygons from {polygons_file}...")
+        locator = AdminLocator.from_geojson(polygons_file)
+    else:
+        logger.info("No admin polygons found, falling back to bounding boxes")
     
     # Build hierarchy (process subset for speed - can change to process all)
     logger.info("\nProcessing first 50,000 streets as a sample...")
     logger.info("   (Change code to process all 394K streets - takes longer)")
     sample_streets = streets[:50000]  # Change to streets to process all
     
-    hierarchy = build_hierarchy_simple(sample_streets, admin_boundaries)
+    hierarchy = build_hierarchy_simple(sample_streets, admin_boundaries, locator)
     
     # Save result
     save_hierarchy(hierarchy, output_file)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Clip a country PBF file to region polygons or bounding boxes
+Each region gets its own small PBF that can be extracted independently
+"""
+
+import osmium
+import json
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+import numpy as np
+import shapely
+from shapely.geometry import box, mapping
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from src.utils.admin_locator import AdminLocator
+from extract_from_pbf import (
+    ADMIN_POLYGONS_FILE, LOCATION_INDEX, OUTPUT_DIR, PBF_FILE, REGIONS,
+    make_output, run_extraction, safe_filename, write_outputs
+)
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Admin level of the region polygons (provinces)
+REGION_ADMIN_LEVEL = '4'
+
+# Nodes tested against the region polygons in one batch (pyosmium fallback)
+CLIP_BATCH_SIZE = 1_000_000
+
+
+def region_file(output_dir, name):
+    return Path(output_dir) / f"{safe_filename(name)}.osm.pbf"
+
+
+def load_region_polygons(polygons_file, names):
+    """Return {name: geometry} for the named provinces in a polygons file"""
+    locator = AdminLocator.from_geojson(polygons_file)
+    level = locator.levels.get(REGION_ADMIN_LEVEL)
+    available = dict(zip(level.names, level.geometries)) if level is not None else {}
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise ValueError(f"No level {REGION_ADMIN_LEVEL} polygon for {', '.join(missing)} "
+                         f"in {polygons_file}")
+    return {name: available[name] for name in names}
+
+
+def parse_bbox(value):
+    """Parse NAME=min_lon,min_lat,max_lon,max_lat"""
+    name, sep, coords = value.partition('=')
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(c) for c in coords.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Invalid bbox {value!r}, expected NAME=min_lon,min_lat,max_lon,max_lat"
+        )
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"Invalid bbox {value!r}, missing region name")
+    return name, box(min_lon, min_lat, max_lon, max_lat)
+
+
+def clip_with_osmium_tool(pbf_file, regions, output_dir, osmium_tool):
+    """
+    Clip all regions in a single pass with `osmium extract`.
+
+    Uses the complete_ways strategy, so ways crossing a region border keep
+    all their nodes and street centers/POI centroids stay correct.
+    """
+    extracts = []
+    for name, geometry in regions.items():
+        geojson = mapping(geometry)
+        extract = {'output': region_file(output_dir, name).name}
+        extract[geojson['type'].lower()] = geojson['coordinates']
+        extracts.append(extract)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump({'directory': str(output_dir), 'extracts': extracts}, f)
+        config_file = f.name
+    try:
+        subprocess.run(
+            [osmium_tool, 'extract', '--config', config_file, '--strategy', 'complete_ways',
+             '--overwrite', str(pbf_file)],
+            check=True
+        )
+    finally:
+        Path(config_file).unlink()
+
+
+class RegionNodeCollector(osmium.SimpleHandler):
+    """
+    Find the nodes inside each region (pyosmium fallback).
+
+    Node locations are collected in batches and tested against all region
+    polygons at once with a bounding box check and vectorized contains_xy.
+    """
+
+    def __init__(self, regions):
+        osmium.SimpleHandler.__init__(self)
+        self.names = list(regions)
+        self.geometries = list(regions.values())
+        for geometry in self.geometries:
+            shapely.prepare(geometry)
+        self.bounds = [geometry.bounds for geometry in self.geometries]
+        self.trackers = {name: osmium.IdTracker() for name in self.names}
+        self.any_region = osmium.IdTracker()  # Ids in at least one region
+        self._ids, self._xs, self._ys = [], [], []
+
+    def node(self, n):
+        self._ids.append(n.id)
+        self._xs.append(n.location.lon)
+        self._ys.append(n.location.lat)
+        if len(self._ids) >= CLIP_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._ids:
+            return
+        ids = np.array(self._ids, dtype=np.int64)
+        xs = np.array(self._xs)
+        ys = np.array(self._ys)
+        self._ids, self._xs, self._ys = [], [], []
+
+        for name, geometry, (min_x, min_y, max_x, max_y) in zip(self.names, self.geometries, self.bounds):
+            candidates = np.flatnonzero((xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y))
+            if len(candidates) == 0:
+                continue
+            inside = candidates[shapely.contains_xy(geometry, xs[candidates], ys[candidates])]
+            tracker = self.trackers[name]
+            for node_id in ids[inside].tolist():
+                tracker.add_node(node_id)
+                self.any_region.add_node(node_id)
+
+
+class RegionReferenceCollector(osmium.SimpleHandler):
+    """
+    Complete the references of all regions in one pass over ways and relations.
+
+    Adds the ways using a node of the region and the relations with such a
+    node or way as member to the region's tracker, like
+    IdTracker.complete_forward_references; the other nodes of those ways
+    (complete ways) go to a separate tracker so they don't pull in more
+    ways. parent_relations() then adds the relations with a member relation
+    in the region.
+    """
+
+    def __init__(self, trackers, any_region):
+        osmium.SimpleHandler.__init__(self)
+        self.trackers = trackers
+        self.way_nodes = {name: osmium.IdTracker() for name in trackers}
+        self.any_region = any_region
+        self._member_relations = []  # (relation id, ids of its member relations) in file order
+
+    def way(self, w):
+        refs = [n.ref for n in w.nodes]
+        for name, tracker in self.trackers.items():
+            nodes = tracker.node_ids()
+            if any(ref in nodes for ref in refs):
+                tracker.add_way(w.id)
+                self.any_region.add_way(w.id)
+                way_nodes = self.way_nodes[name]
+                for ref in refs:
+                    way_nodes.add_node(ref)
+                    self.any_region.add_node(ref)
+
+    def relation(self, r):
+        members = [(m.type, m.ref) for m in r.members]
+        children = [ref for member_type, ref in members if member_type == 'r']
+        if children:
+            self._member_relations.append((r.id, children))
+        for tracker in self.trackers.values():
+            nodes, ways = tracker.node_ids(), tracker.way_ids()
+            if any((member_type == 'n' and ref in nodes) or (member_type == 'w' and ref in ways)
+                   for member_type, ref in members):
+                tracker.add_relation(r.id)
+                self.any_region.add_relation(r.id)
+
+    def parent_relations(self, relation_depth=1):
+        """Add parent relations like complete_forward_references(relation_depth)"""
+        for tracker in self.trackers.values():
+            relations = tracker.relation_ids()
+            for _ in range(relation_depth):
+                for relation_id, children in self._member_relations:
+                    if relation_id not in relations and any(ref in relations for ref in children):
+                        tracker.add_relation(relation_id)
+                        self.any_region.add_relation(relation_id)
+
+
+class RegionWriters(osmium.SimpleHandler):
+    """Write every object to the files of the regions whose trackers hold it"""
+
+    def __init__(self, targets):
+        osmium.SimpleHandler.__init__(self)
+        # (nodes, way nodes, ways, relations, writer) per region
+        self.targets = targets
+
+    def node(self, n):
+        node_id = n.id
+        for nodes, way_nodes, _, _, writer in self.targets:
+            if node_id in nodes or node_id in way_nodes:
+                writer.add_node(n)
+
+    def way(self, w):
+        way_id = w.id
+        for _, _, ways, _, writer in self.targets:
+            if way_id in ways:
+                writer.add_way(w)
+
+    def relation(self, r):
+        relation_id = r.id
+        for _, _, _, relations, writer in self.targets:
+            if relation_id in relations:
+                writer.add_relation(r)
+
+
+def clip_with_pyosmium(pbf_file, regions, output_dir):
+    """
+    Clip the regions with pyosmium when osmium-tool is not installed.
+
+    Three passes whatever the number of regions: one finds the nodes inside
+    each region, one adds the ways and relations using them and the
+    remaining nodes of those ways (complete ways), and one writes all region
+    files, with one writer per region. Objects outside every region are
+    dropped by libosmium before they reach Python.
+    """
+    collector = RegionNodeCollector(regions)
+    osmium.apply(osmium.io.Reader(str(pbf_file), osmium.osm.NODE), collector)
+    collector.flush()
+
+    # Only ways with a node in some region reach Python
+    references = RegionReferenceCollector(collector.trackers, collector.any_region)
+    osmium.apply(osmium.io.Reader(str(pbf_file), osmium.osm.WAY | osmium.osm.RELATION),
+                 collector.any_region.contains_filter().enable_for(osmium.osm.WAY), references)
+    references.parent_relations(relation_depth=1)
+
+    targets = []
+    try:
+        for name, tracker in collector.trackers.items():
+            target = region_file(output_dir, name)
+            if target.exists():
+                target.unlink()
+            targets.append((tracker.node_ids(), references.way_nodes[name].node_ids(),
+                            tracker.way_ids(), tracker.relation_ids(), osmium.SimpleWriter(str(target))))
+        osmium.apply(osmium.io.Reader(str(pbf_file)), collector.any_region.id_filter(),
+                     RegionWriters(targets))
+    finally:
+        for *_, writer in targets:
+            writer.close()
+
+
+def clip_regions(pbf_file, regions, output_dir):
+    """Write one <region>.osm.pbf per region into output_dir; returns {name: path}"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    osmium_tool = shutil.which('osmium')
+    if osmium_tool is not None:
+        logger.info(f"Clipping {len(regions)} regions with osmium-tool...")
+        clip_with_osmium_tool(pbf_file, regions, output_dir, osmium_tool)
+    else:
+        logger.warning("osmium-tool not found, clipping with pyosmium (slower)")
+        clip_with_pyosmium(pbf_file, regions, output_dir)
+
+    files = {name: region_file(output_dir, name) for name in regions}
+    for name, path in files.items():
+        logger.info(f"   {name}: {path} ({path.stat().st_size / 2**20:,.1f} MiB)")
+    return files
+
+
+def _extract_region(name, pbf_file, output_dir, output_format, polygons_file):
+    """Run the regular extraction on one clipped region file"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = make_output(output_format, output_dir)
+    handler = run_extraction(
+        str(pbf_file),
+        output=output,
+        location_index=LOCATION_INDEX,
+        polygons_file=polygons_file,
+        build_polygons=False
+    )
+    street_counts, poi_counts = write_outputs(handler, output, output_dir, str(pbf_file))
+    return name, sum(street_counts.values()), sum(poi_counts.values())
+
+
+def extract_regions(files, output_dir, output_format='json', polygons_file=None, workers=1):
+    """Extract every region file (in parallel), each into output_dir/<region>/"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_extract_region, name, path, Path(output_dir) / safe_filename(name),
+                        output_format, polygons_file)
+            for name, path in files.items()
+        ]
+        for future in futures:
+            name, streets, pois = future.result()
+            logger.info(f"   {name}: {streets:,} streets, {pois:,} POIs")
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Clip a PBF file to regions and extract them")
+    parser.add_argument('--pbf', default=PBF_FILE, help="Input .osm.pbf file")
+    parser.add_argument('--regions', nargs='*',
+                        help="Province names to clip, using their admin polygons "
+                             "(default: config REGIONS unless --bbox is given)")
+    parser.add_argument('--bbox', action='append', type=parse_bbox, default=[],
+                        metavar='NAME=MIN_LON,MIN_LAT,MAX_LON,MAX_LAT',
+                        help="Clip a named bounding box (can be repeated)")
+    parser.add_argument('--polygons', type=Path, default=OUTPUT_DIR / ADMIN_POLYGONS_FILE,
+                        help="Admin polygons written by extract_from_pbf.py "
+                             f"(default: {OUTPUT_DIR / ADMIN_POLYGONS_FILE})")
+    parser.add_argument('--clip-dir', type=Path, default=OUTPUT_DIR / 'regions',
+                        help="Directory for the clipped region PBF files")
+    parser.add_argument('--extract', action='store_true',
+                        help="Run the extraction on every clipped region afterwards")
+    parser.add_argument('--output-dir', type=Path, default=OUTPUT_DIR,
+                        help="Extraction output directory (one subdirectory per region)")
+    parser.add_argument('--format', choices=['json', 'ndjson', 'parquet'], default='json',
+                        help="Output format of the region extractions")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of regions extracted in parallel (default: 1)")
+    return parser.parse_args()
+
+
+def main():
+    """Clip the input file and optionally extract each region"""
+    logger.info("✂️  Clipping PBF file to regions")
+    logger.info("=" * 60)
+
+    args = parse_args()
+    if not Path(args.pbf).exists():
+        logger.error(f"PBF file not found: {args.pbf}")
+        return
+
+    names = args.regions if args.regions is not None else ([] if args.bbox else REGIONS)
+    polygons_file = args.polygons if args.polygons.exists() else None
+    if names and polygons_file is None:
+        logger.error(f"Admin polygons not found: {args.polygons} "
+                     "(run extract_from_pbf.py once, or use --bbox)")
+        return
+
+    try:
+        regions = load_region_polygons(polygons_file, names) if names else {}
+        regions.update(dict(args.bbox))
+
+        files = clip_regions(args.pbf, regions, args.clip_dir)
+
+        if args.extract:
+            logger.info("")
+            logger.info(f"Extracting {len(files)} regions with {args.workers} workers...")
+            extract_regions(files, args.output_dir, args.format, polygons_file, args.workers)
+
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("ALL DONE!")
+        logger.info("=" * 60)
+
+    except Exception as e:
+        logger.error(f"Error during clipping: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
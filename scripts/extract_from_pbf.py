@@ -6,11 +6,38 @@ Much faster than Overpass API!
 
 import osmium
 import json
+import argparse
+import functools
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+import shapely
+from shapely.geometry import LineString
+from config import POI_CATEGORIES
+from src.utils.admin_locator import ADMIN_LEVEL_FIELDS, AdminLocator, polygons_from_rings
+from src.utils.columnar import (
+    BOUNDARY_SCHEMA, POI_SCHEMA, STREET_SCHEMA, ParquetRecordWriter, merge_parquet_parts, with_seq
+)
+from src.utils.extraction_state import ExtractionState
+from src.utils.geometry_store import GeometryWriter, index_filename, merge_geometry_stores
+from src.utils.metrics import METRICS, MetricsExporter, worker_metrics_file
+from src.utils.pbf_blocks import PBFBlocks, count_elements
+from src.utils.tag_rules import TagRules
+from src.utils.record_store import RecordColumns
+from src.utils.ndjson import NDJSONWriterPool, iter_ndjson, merge_ndjson
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -18,9 +45,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Output directory
+# Default input file and output directory
+PBF_FILE = "/mnt/osm-data/turkey-osm-extractor/turkey-251020.osm.pbf"
 OUTPUT_DIR = Path("/mnt/osm-data/turkey-osm-extractor/output")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+# Node location index used to build way geometries. Memory based types
+# (flex_mem, sparse_mem_array, dense_mmap_array) are rebuilt on every run;
+# file based types ("dense_file_array,<path>", "sparse_file_array,<path>")
+# keep the index on disk, so RAM stays bounded for very large inputs.
+LOCATION_INDEX = "flex_mem"
+
+# Index types that can be shared between workers and reused across runs.
+# Dense file arrays store every location at a fixed offset, so rewriting a
+# location is idempotent; sparse arrays append and must not be shared.
+SHAREABLE_INDEX_TYPES = ('dense_file_array',)
+
+# Number of records resolved against the admin polygons in one batch
+LOCATE_BATCH_SIZE = 4096
+
+# Admin polygons saved next to the output (also used by build_hierarchy.py)
+ADMIN_POLYGONS_FILE = "turkey_admin_polygons.geojson"
+
+# Street linestrings (src/utils/geometry_store.py), with --street-geometry
+GEOMETRY_FILE = "streets.geom"
+
+# Seconds between two writes of the --metrics-file
+METRICS_INTERVAL = 30
+
+# The main pass reads about this many bytes of PBF blocks per apply() call
+# (and counts their elements); with --checkpoint-dir a checkpoint is taken
+# between two segments once CHECKPOINT_INTERVAL seconds have passed since
+# the last one
+SEGMENT_BYTES = 32 * 2**20
+
+# Element types of the main pass
+PBF_ENTITIES = osmium.osm.NODE | osmium.osm.WAY | osmium.osm.RELATION
+CHECKPOINT_INTERVAL = 300
+CHECKPOINT_MANIFEST = "checkpoint.json"
+
+# Parallel runs split the file into this many block ranges per worker (so
+# workers that finish early take over more) and number the records of part
+# n from n * PART_SEQ_STRIDE on
+RANGES_PER_WORKER = 4
+PART_SEQ_STRIDE = 2**40
 
 # Regions to extract (major Turkish cities)
 REGIONS = [
@@ -29,72 +96,383 @@ REGIONS = [
     'Mersin', 'Kayseri', 'Eskişehir', 'Trabzon', 'Erzurum'
 ]
 
-# POI categories
-POI_CATEGORIES = {
-    'education': ['school', 'university', 'college', 'kindergarten'],
-    'healthcare': ['hospital', 'clinic', 'doctors', 'pharmacy'],
-    'government': ['townhall', 'police', 'post_office', 'courthouse'],
-    'religious': ['place_of_worship'],
-    'commercial': ['bank', 'atm', 'supermarket', 'marketplace'],
-    'transportation': ['bus_station', 'ferry_terminal', 'taxi', 'fuel']
-}
+# POI categories, compiled from config.POI_CATEGORIES (shared with the
+# Overpass extractors) into a (key, value) lookup
+POI_RULES = TagRules(POI_CATEGORIES)
 
 
-class TurkeyExtractor(osmium.SimpleHandler):
-    """Extract streets and POIs from Turkey OSM data"""
+def build_filters():
+    """
+    Build the libosmium filter chain that runs before the Python handler.
+
+    Filters only act on the entity type they are enabled for and pass
+    everything else through, so chaining them gives: POI nodes, named
+    highways and administrative boundary relations. The node filter comes
+    first in the list; see TurkeyExtractor.apply_filtered() for where the
+    location handler is placed relative to it.
+    """
+    return [
+        osmium.filter.TagFilter(*POI_RULES.tag_pairs()).enable_for(osmium.osm.NODE),
+        osmium.filter.KeyFilter('highway').enable_for(osmium.osm.WAY),
+        osmium.filter.KeyFilter('name').enable_for(osmium.osm.WAY),
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(osmium.osm.RELATION),
+    ]
+
+
+def add_stats(stats, other):
+    """Add the statistics of another handler (an element total stays None once unknown)"""
+    for key, value in other.items():
+        stats[key] = None if stats[key] is None or value is None else stats[key] + value
+
+
+def location_index_file(location_index):
+    """Return the backing file of a file based index ("type,path"), or None"""
+    _, _, path = location_index.partition(',')
+    return Path(path) if path else None
+
+
+def _index_metadata_file(index_file):
+    return index_file.with_name(index_file.name + '.json')
+
+
+def pbf_fingerprint(pbf_file):
+    """Identify a PBF file by path, size and modification time"""
+    stat = Path(pbf_file).stat()
+    return {
+        'source_file': str(Path(pbf_file).resolve()),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime
+    }
+
+
+def check_location_index(location_index, shared=False):
+    """Validate an index spec against the types compiled into libosmium"""
+    index_type = location_index.partition(',')[0]
+    if index_type not in osmium.index.map_types():
+        raise ValueError(
+            f"Unknown location index type '{index_type}', "
+            f"available: {', '.join(osmium.index.map_types())}"
+        )
+    if shared and index_type not in SHAREABLE_INDEX_TYPES:
+        raise ValueError(
+            f"Location index '{index_type}' cannot be shared or reused, "
+            f"use one of: {', '.join(SHAREABLE_INDEX_TYPES)}"
+        )
+
+
+def location_index_matches(location_index, pbf_file):
+    """Check whether a persisted index was built from this PBF file"""
+    index_file = location_index_file(location_index)
+    if index_file is None or not index_file.exists():
+        return False
+    
+    metadata_file = _index_metadata_file(index_file)
+    if not metadata_file.exists():
+        return False
+    with open(metadata_file, 'r', encoding='utf-8') as f:
+        return json.load(f) == pbf_fingerprint(pbf_file)
+
+
+def save_location_index_metadata(location_index, pbf_file):
+    """Record which PBF file a persisted index was built from"""
+    index_file = location_index_file(location_index)
+    with open(_index_metadata_file(index_file), 'w', encoding='utf-8') as f:
+        json.dump(pbf_fingerprint(pbf_file), f, indent=2)
+
+
+def build_location_index(pbf_file, location_index):
+    """
+    Fill a file based location index from the nodes of the PBF file.
+
+    This pass runs entirely in libosmium (only nodes are read and no
+    Python callbacks are involved).
+    """
+    index_file = location_index_file(location_index)
+    logger.info(f"Building node location index {index_file}...")
+    if index_file.exists():
+        index_file.unlink()
+    
+    idx = osmium.index.create_map(location_index)
+    with METRICS.timer('pbf_stage_seconds', stage='location_index'):
+        osmium.apply(osmium.io.Reader(pbf_file, osmium.osm.NODE), osmium.NodeLocationsForWays(idx))
+    del idx  # Flush the memory mapped file
+    
+    save_location_index_metadata(location_index, pbf_file)
+    logger.info(f"Location index ready: {index_file.stat().st_size / 1024 ** 3:.1f} GB on disk")
+
+
+class AdminRelationCollector(osmium.SimpleHandler):
+    """First admin pass: collect boundary relations and their member ways"""
+    
+    def __init__(self):
+        osmium.SimpleHandler.__init__(self)
+        self.relations = {}
+        self.way_ids = set()
+    
+    def relation(self, r):
+        admin_level = r.tags.get('admin_level', '')
+        if admin_level not in ADMIN_LEVEL_FIELDS:
+            return
+        members = [(m.ref, m.role) for m in r.members if m.type == 'w']
+        self.relations[r.id] = (admin_level, r.tags.get('name', ''), members)
+        self.way_ids.update(ref for ref, _ in members)
+
+
+class AdminWayCollector(osmium.SimpleHandler):
+    """Second admin pass: collect the geometry of boundary member ways"""
     
     def __init__(self):
         osmium.SimpleHandler.__init__(self)
-        self.streets = defaultdict(list)
-        self.pois = defaultdict(lambda: defaultdict(list))
+        self.lines = {}
+    
+    def way(self, w):
+        try:
+            coords = [(n.lon, n.lat) for n in w.nodes]
+        except osmium.InvalidLocationError:
+            return
+        if len(coords) >= 2:
+            self.lines[w.id] = LineString(coords)
+
+
+def build_admin_locator(pbf_file, location_index=LOCATION_INDEX, reuse_index=False):
+    """
+    Assemble province/district/neighborhood polygons from the PBF file.
+
+    Relations are read first to find the member ways, then only those ways
+    are passed to Python. Both passes are filtered in libosmium.
+    """
+    logger.info("Assembling administrative boundary polygons...")
+    relations = AdminRelationCollector()
+    osmium.apply(
+        osmium.io.Reader(pbf_file, osmium.osm.RELATION),
+        osmium.filter.TagFilter(('boundary', 'administrative')),
+        relations
+    )
+    
+    locations = osmium.NodeLocationsForWays(osmium.index.create_map(location_index))
+    locations.ignore_errors()
+    ways = AdminWayCollector()
+    # A reused index already has every location, so nodes can be skipped
+    entities = osmium.osm.WAY if reuse_index else osmium.osm.NODE | osmium.osm.WAY
+    osmium.apply(
+        osmium.io.Reader(pbf_file, entities),
+        locations,
+        osmium.filter.IdFilter(relations.way_ids).enable_for(osmium.osm.WAY),
+        ways
+    )
+    
+    boundaries = []
+    for admin_level, name, members in relations.relations.values():
+        outer = [ways.lines[ref] for ref, role in members if role != 'inner' and ref in ways.lines]
+        inner = [ways.lines[ref] for ref, role in members if role == 'inner' and ref in ways.lines]
+        geometry = polygons_from_rings(outer, inner)
+        if geometry is not None:
+            boundaries.append((admin_level, name, geometry))
+    
+    locator = AdminLocator(boundaries)
+    logger.info(f"Assembled {len(locator):,} of {len(relations.relations):,} boundary polygons")
+    return locator
+
+
+def format_count(value):
+    """Format a count for logging, tolerating missing totals"""
+    return f"{value:,}" if value is not None else "n/a"
+
+
+class CallbackMetrics(osmium.SimpleHandler):
+    """
+    Count and time the Python callbacks of a handler (with --metrics-file).
+
+    Takes the place of the handler at the end of the apply chain. The time
+    spent in the callbacks, next to the wall time of the pass, shows how
+    much of a run goes to Python and how much to reading, decoding,
+    filtering and location lookups in libosmium.
+    """
+
+    TYPES = ('node', 'way', 'relation', 'area')
+
+    def __init__(self, handler):
+        osmium.SimpleHandler.__init__(self)
+        self.handler = handler
+        self.counts = dict.fromkeys(self.TYPES, 0)
+        self.seconds = dict.fromkeys(self.TYPES, 0.0)
+
+    def node(self, n):
+        start = time.perf_counter()
+        self.handler.node(n)
+        self.seconds['node'] += time.perf_counter() - start
+        self.counts['node'] += 1
+
+    def way(self, w):
+        start = time.perf_counter()
+        self.handler.way(w)
+        self.seconds['way'] += time.perf_counter() - start
+        self.counts['way'] += 1
+
+    def relation(self, r):
+        start = time.perf_counter()
+        self.handler.relation(r)
+        self.seconds['relation'] += time.perf_counter() - start
+        self.counts['relation'] += 1
+
+    def area(self, a):
+        start = time.perf_counter()
+        self.handler.area(a)
+        self.seconds['area'] += time.perf_counter() - start
+        self.counts['area'] += 1
+
+    def collect(self, metrics):
+        """Publish the totals (registered as a metrics collector)"""
+        for osm_type in self.TYPES:
+            metrics.set_counter('pbf_callbacks_total', self.counts[osm_type], type=osm_type)
+            metrics.set_counter('pbf_callback_seconds_total', self.seconds[osm_type],
+                                type=osm_type)
+        stats = self.handler.stats
+        metrics.set_counter('pbf_records_total', stats['streets'], kind='street')
+        metrics.set_counter('pbf_records_total', stats['pois'], kind='poi')
+        for osm_type in ('nodes', 'ways', 'relations'):
+            if stats[osm_type] is not None:
+                metrics.set_counter('pbf_elements_total', stats[osm_type], type=osm_type[:-1])
+
+
+class TurkeyExtractor(osmium.SimpleHandler):
+    """Extract streets and POIs from Turkey OSM data
+
+    Several handlers can split the work of one file between processes:
+    each runs over its own range of PBF blocks (apply_range()) and one
+    more assembles the multipolygon POIs (apply_multipolygons()), whose
+    member ways may lie in any range. `areas` selects the area POIs a
+    handler extracts ('way' for closed ways, 'relation' for multipolygons)
+    and seq_base offsets the position of its records in the callback
+    stream, so merged results keep the single-process order.
+
+    Multipolygon POIs complete at their last member way, so they are held
+    back and handed on after all other records (finish()), in every mode.
+
+    The handler is meant to run behind the filters from build_filters():
+    only candidate streets, POIs and boundaries reach the Python callbacks.
+    Element totals are counted on the raw blocks of each segment of the
+    main pass (apply_segment()), without a callback per element.
+
+    If a sink (StreamingOutput) is given, records are handed to it as soon
+    as they are produced instead of being kept in memory. Otherwise they
+    are kept column-wise in RecordColumns stores per city (and category)
+    and only turned back into dicts when they are written out.
+
+    With an AdminLocator, streets and POIs are tagged with the province,
+    district and neighborhood containing them (in batches) and bucketed by
+    province; addr:city / addr:province is only the fallback.
+
+    With an ExtractionState, every record (and the node list of every
+    street) is also stored by id for later incremental updates.
+
+    With a GeometryWriter, the full linestring of every street is stored
+    in the binary geometry store (street records only keep the center).
+
+    With a Metrics registry, the callbacks are counted and timed per OSM
+    type (CallbackMetrics) and the passes over the file are timed.
+
+    With an ExtractionCheckpoint, the main pass runs in segments of PBF
+    blocks and the records go to checkpointed output parts.
+    """
+    
+    def __init__(self, sink=None, locator=None, state=None, geometry=None, metrics=None,
+                 areas=('way', 'relation'), seq_base=None):
+        osmium.SimpleHandler.__init__(self)
+        self.areas = areas
+        self.seq_base = seq_base or 0
+        self.sink = sink
+        self.locator = locator
+        self.state = state
+        self.geometry = geometry
+        self.metrics = metrics
+        self.sequenced = seq_base is not None
+        self.replaying = False
+        self._pending = []
+        self._multipolygons = []
+        self._wkb = osmium.geom.WKBFactory()
+        self.streets = defaultdict(RecordColumns)
+        self.pois = defaultdict(lambda: defaultdict(RecordColumns))
         self.admin_boundaries = []
         self.stats = {
             'nodes': 0,
             'ways': 0,
             'relations': 0,
+            'callbacks': 0,
             'streets': 0,
             'pois': 0
         }
     
     def node(self, n):
         """Process nodes (POIs are usually nodes)"""
-        self.stats['nodes'] += 1
+        self.stats['callbacks'] += 1
+        self.add_poi_from_tags(n.id, 'node', n.tags, n.location.lat, n.location.lon)
+    
+    def area(self, a):
+        """Process areas (POIs mapped as building outlines or multipolygons)"""
+        osm_type = 'way' if a.from_way() else 'relation'
+        if osm_type not in self.areas:
+            return
+        # Closed ways before the checkpoint were already extracted; multipolygons
+        # are held back until the end, so a resumed run assembles them again
+        if self.replaying and osm_type == 'way':
+            return
+        if not self.replaying:
+            self.stats['callbacks'] += 1
         
-        if 'amenity' in n.tags:
-            amenity = n.tags.get('amenity')
-            name = n.tags.get('name', '')
-            
-            # Check which category this POI belongs to
-            for category, amenity_types in POI_CATEGORIES.items():
-                if amenity in amenity_types:
-                    # Get city from tags
-                    city = n.tags.get('addr:city', n.tags.get('addr:province', 'Unknown'))
-                    
-                    poi_data = {
-                        'id': n.id,
-                        'type': 'node',
-                        'name': name,
-                        'amenity': amenity,
-                        'category': category,
-                        'lat': n.location.lat,
-                        'lon': n.location.lon,
-                        'address': n.tags.get('addr:street', ''),
-                        'city': city,
-                        'postcode': n.tags.get('addr:postcode', ''),
-                        'phone': n.tags.get('phone', ''),
-                        'website': n.tags.get('website', ''),
-                        'operator': n.tags.get('operator', '')
-                    }
-                    
-                    self.pois[city][category].append(poi_data)
-                    self.stats['pois'] += 1
-                    
-                    if self.stats['pois'] % 10000 == 0:
-                        logger.info(f"Processed {self.stats['pois']:,} POIs...")
+        try:
+            centroid = shapely.from_wkb(self._wkb.create_multipolygon(a)).centroid
+        except Exception:
+            return  # Skip areas with broken geometry
+        if centroid.is_empty:
+            return
+        
+        self.add_poi_from_tags(a.orig_id(), osm_type, a.tags, centroid.y, centroid.x,
+                               defer=osm_type == 'relation')
+        if self.state is not None and osm_type == 'way':
+            # Lets an update recompute the centroid when one of the nodes moves
+            self.state.put_way_nodes(a.orig_id(), [n.ref for ring in a.outer_rings() for n in ring])
+    
+    def add_poi_from_tags(self, osm_id, osm_type, tags, lat, lon, defer=False):
+        """Create a POI record if the tags match one of the POI categories (deferred until finish())"""
+        rule = POI_RULES.match(tags)
+        if rule is None:
+            return
+        
+        # Get city from tags
+        city = tags.get('addr:city', tags.get('addr:province', 'Unknown'))
+        
+        poi_data = {
+            'id': osm_id,
+            'type': osm_type,
+            'name': tags.get('name', ''),
+            'amenity': tags.get('amenity', ''),
+            'category': rule.category,
+            'subcategory': rule.filter,
+            'lat': lat,
+            'lon': lon,
+            'address': tags.get('addr:street', ''),
+            'city': city,
+            'postcode': tags.get('addr:postcode', ''),
+            'phone': tags.get('phone', ''),
+            'website': tags.get('website', ''),
+            'operator': tags.get('operator', '')
+        }
+        
+        if defer:
+            self._multipolygons.append(poi_data)
+        else:
+            self.queue('poi', poi_data)
+        if self.replaying:
+            return
+        self.stats['pois'] += 1
+        
+        if self.stats['pois'] % 10000 == 0:
+            logger.info(f"Processed {self.stats['pois']:,} POIs...")
     
     def way(self, w):
         """Process ways (streets are ways with highway tag)"""
-        self.stats['ways'] += 1
+        self.stats['callbacks'] += 1
         
         # Extract streets (ways with highway tag and name)
         if 'highway' in w.tags and 'name' in w.tags:
@@ -127,8 +505,15 @@ class TurkeyExtractor(osmium.SimpleHandler):
                         'nodes_count': len(w.nodes)
                     }
                     
-                    self.streets[city].append(street_data)
+                    self.queue('street', street_data)
                     self.stats['streets'] += 1
+                    if self.state is not None:
+                        self.state.put_way_nodes(w.id, [n.ref for n in w.nodes])
+                    if self.geometry is not None:
+                        # Location x/y are the E7 integers stored in the file
+                        self.geometry.add_e7(
+                            w.id, [n.location.y for n in w.nodes], [n.location.x for n in w.nodes]
+                        )
                     
                     if self.stats['streets'] % 10000 == 0:
                         logger.info(f"Processed {self.stats['streets']:,} streets...")
@@ -138,7 +523,7 @@ class TurkeyExtractor(osmium.SimpleHandler):
     
     def relation(self, r):
         """Process relations (administrative boundaries)"""
-        self.stats['relations'] += 1
+        self.stats['callbacks'] += 1
         
         # Extract administrative boundaries
         if r.tags.get('boundary') == 'administrative':
@@ -154,7 +539,1001 @@ class TurkeyExtractor(osmium.SimpleHandler):
                     'population': r.tags.get('population', ''),
                     'postal_code': r.tags.get('postal_code', '')
                 }
-                self.admin_boundaries.append(boundary_data)
+                self.add_boundary(self.sequence(boundary_data))
+    
+    def sequence(self, record, position=None):
+        """
+        Tag a record with its position in the callback stream.
+
+        The position is the callback count, after seq_base: workers cover
+        consecutive block ranges with increasing bases, so this number
+        orders records across workers exactly as a single-process run
+        would. Only needed (and only added) when running in parallel or
+        checkpointing; it is removed again when merging.
+        """
+        if self.sequenced:
+            record['_seq'] = self.seq_base + (self.stats['callbacks'] if position is None else position)
+        return record
+    
+    def queue(self, kind, record, position=None):
+        """Hand a record on, resolving its admin areas first if a locator is set"""
+        self.sequence(record, position)
+        if self.locator is None:
+            self.dispatch(kind, record)
+            return
+        self._pending.append((kind, record))
+        if len(self._pending) >= LOCATE_BATCH_SIZE:
+            self.flush()
+    
+    def flush(self):
+        """Resolve the admin areas of all queued records"""
+        if not self._pending:
+            return
+        lats = [r['center_lat'] if kind == 'street' else r['lat'] for kind, r in self._pending]
+        lons = [r['center_lon'] if kind == 'street' else r['lon'] for kind, r in self._pending]
+        
+        for (kind, record), areas in zip(self._pending, self.locator.locate_many(lats, lons)):
+            record.update(areas)
+            if areas['province']:
+                record['city'] = areas['province']
+            self.dispatch(kind, record)
+        self._pending = []
+    
+    def finish(self):
+        """Hand on the held back multipolygon POIs, after every other record"""
+        for i, poi in enumerate(self._multipolygons, 1):
+            self.queue('poi', poi, position=self.stats['callbacks'] + i)
+        self._multipolygons = []
+        self.flush()
+    
+    def dispatch(self, kind, record):
+        if kind == 'street':
+            self.add_street(record['city'], record)
+        else:
+            self.add_poi(record['city'], record['category'], record)
+    
+    def add_street(self, city, street):
+        if self.state is not None:
+            self.state.put_street(street)
+        if self.sink is not None:
+            self.sink.add_street(city, street)
+        else:
+            self.streets[city].append(street)
+    
+    def add_poi(self, city, category, poi):
+        if self.state is not None:
+            self.state.put_poi(poi)
+        if self.sink is not None:
+            self.sink.add_poi(city, category, poi)
+        else:
+            self.pois[city][category].append(poi)
+    
+    def add_boundary(self, boundary):
+        if self.state is not None:
+            self.state.put_boundary(boundary)
+        if self.sink is not None:
+            self.sink.add_boundary(boundary)
+        else:
+            self.admin_boundaries.append(boundary)
+    
+    def _target(self, pbf_file):
+        """The handler at the end of the apply chains (wrapped by CallbackMetrics with metrics)"""
+        if self.metrics is None:
+            return self
+        target = CallbackMetrics(self)
+        self.metrics.add_collector(target.collect)
+        self.metrics.set('pbf_input_bytes', Path(pbf_file).stat().st_size)
+        return target
+    
+    def _done(self, target):
+        if target is not self:
+            target.collect(self.metrics)
+            self.metrics.remove_collector(target.collect)
+    
+    @staticmethod
+    def _area_manager(pbf_file):
+        """AreaManager after its first pass over the relations with POI tags"""
+        areas = osmium.area.AreaManager()
+        osmium.apply(
+            osmium.io.Reader(pbf_file, osmium.osm.RELATION),
+            osmium.filter.TagFilter(*POI_RULES.tag_pairs()),
+            areas.first_pass_handler()
+        )
+        return areas
+    
+    def apply_filtered(self, pbf_file, location_index=LOCATION_INDEX, reuse_index=False,
+                       checkpoint=None):
+        """
+        Parse the file with the C++ pre-filters in front of this handler.
+
+        Normally the location handler sees every node. With reuse_index the
+        index already holds all locations, so it is placed behind the node
+        filter and only has to resolve way locations.
+
+        POIs mapped as closed ways or multipolygons are assembled into areas
+        by libosmium in the same pass (after a relations-only first pass)
+        and only areas with POI tags reach area().
+
+        With a checkpoint, the main pass is handed to ExtractionCheckpoint.run().
+        """
+        target = self._target(pbf_file)
+        start = time.perf_counter()
+        areas = self._area_manager(pbf_file)
+        self._record_pass('area_relations', start)
+        
+        locations = osmium.NodeLocationsForWays(osmium.index.create_map(location_index))
+        locations.ignore_errors()
+        area_handler = areas.second_pass_handler(
+            osmium.filter.TagFilter(*POI_RULES.tag_pairs()).enable_for(osmium.osm.AREA), target
+        )
+        node_filter, *other_filters = build_filters()
+        
+        if reuse_index:
+            chain = [node_filter, locations, area_handler] + other_filters
+        else:
+            chain = [locations, area_handler, node_filter] + other_filters
+        start = time.perf_counter()
+        if checkpoint is None:
+            for _, _, data in PBFBlocks(pbf_file).segments(0, SEGMENT_BYTES):
+                self.apply_segment(data, chain + [target])
+            self.finish()
+        else:
+            checkpoint.run(self, chain + [target], [locations, area_handler])
+        self._record_pass('main', start)
+        self._done(target)
+    
+    def apply_range(self, pbf_file, start_offset, end_offset, location_index):
+        """
+        Parse the PBF blocks in [start_offset, end_offset) (see PBFBlocks.split()).
+
+        location_index must be a shared index that already holds every
+        node location. Closed way POIs are assembled in the same pass;
+        multipolygons are left to apply_multipolygons().
+        """
+        target = self._target(pbf_file)
+        locations = osmium.NodeLocationsForWays(osmium.index.create_map(location_index))
+        locations.ignore_errors()
+        # Without a relation pass the manager only assembles closed ways (it
+        # must outlive its handler)
+        areas = osmium.area.AreaManager()
+        area_handler = areas.second_pass_handler(
+            osmium.filter.TagFilter(*POI_RULES.tag_pairs()).enable_for(osmium.osm.AREA), target
+        )
+        node_filter, *other_filters = build_filters()
+        chain = [node_filter, locations, area_handler] + other_filters + [target]
+        
+        start = time.perf_counter()
+        blocks = PBFBlocks(pbf_file)
+        for _, _, data in blocks.segments(start_offset, SEGMENT_BYTES, end=end_offset):
+            self.apply_segment(data, chain)
+        self.finish()
+        self._record_pass('main', start)
+        self._done(target)
+    
+    def apply_multipolygons(self, pbf_file, location_index):
+        """
+        Assemble the multipolygon POIs of the whole file.
+
+        Only relations and ways are read, entirely in libosmium; the
+        locations come from a shared index holding every node.
+        """
+        target = self._target(pbf_file)
+        start = time.perf_counter()
+        areas = self._area_manager(pbf_file)
+        locations = osmium.NodeLocationsForWays(osmium.index.create_map(location_index))
+        locations.ignore_errors()
+        osmium.apply(
+            osmium.io.Reader(pbf_file, osmium.osm.WAY),
+            locations,
+            areas.second_pass_handler(
+                osmium.filter.TagFilter(*POI_RULES.tag_pairs()).enable_for(osmium.osm.AREA), target
+            )
+        )
+        self.finish()
+        self._record_pass('multipolygons', start)
+        self._done(target)
+    
+    def apply_segment(self, data, chain):
+        """Run a segment of PBF blocks (PBFBlocks.segments()) through chain and count its elements"""
+        osmium.apply(osmium.io.Reader(osmium.io.FileBuffer(data, 'pbf'), PBF_ENTITIES), *chain)
+        if self.stats['nodes'] is None:
+            return
+        try:
+            counts = count_elements(data)
+        except ValueError as e:
+            logger.warning(f"{e}, element totals will not be reported")
+            self.stats.update(nodes=None, ways=None, relations=None)
+            return
+        for osm_type, count in counts.items():
+            self.stats[osm_type] += count
+    
+    def _record_pass(self, stage, start):
+        if self.metrics is not None:
+            self.metrics.observe('pbf_stage_seconds', time.perf_counter() - start, stage=stage)
+    
+    def memory_usage(self):
+        """Approximate memory held by the in-memory street and POI records"""
+        stores = list(self.streets.values()) + [
+            pois for categories in self.pois.values() for pois in categories.values()
+        ]
+        records = sum(len(store) for store in stores)
+        nbytes = sum(store.nbytes() for store in stores)
+        return {
+            'records': records,
+            'bytes': nbytes,
+            'bytes_per_record': round(nbytes / records, 1) if records else 0
+        }
+    
+    def results(self):
+        """Return extracted data as plain (picklable) structures"""
+        return {
+            'streets': dict(self.streets),
+            'pois': {city: dict(categories) for city, categories in self.pois.items()},
+            'admin_boundaries': list(self.admin_boundaries),
+            'stats': dict(self.stats)
+        }
+
+
+def safe_filename(city):
+    """Clean city name for filename (remove slashes and special chars)"""
+    return city.replace('/', '_').replace('\\', '_').replace(':', '_')
+
+
+class StreamingOutput:
+    """
+    Write records to per-city NDJSON files as they are produced.
+
+    Only counters are kept in memory, so peak memory does not grow with
+    the size of the input. Streets go to <city>_streets.ndjson, POIs to
+    <city>_poi.ndjson and boundaries to turkey_administrative.ndjson.
+    """
+    
+    format = 'ndjson'
+    
+    def __init__(self, output_dir, max_open_files=64):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.writers = NDJSONWriterPool(max_open_files=max_open_files)
+        self.street_counts = defaultdict(int)
+        self.poi_counts = defaultdict(int)
+        self.boundary_count = 0
+    
+    def street_file(self, city):
+        return self.output_dir / f"{safe_filename(city)}_streets.ndjson"
+    
+    def poi_file(self, city):
+        return self.output_dir / f"{safe_filename(city)}_poi.ndjson"
+    
+    def boundary_file(self):
+        return self.output_dir / "turkey_administrative.ndjson"
+    
+    def add_street(self, city, street):
+        self.writers.write(self.street_file(city), street)
+        self.street_counts[city] += 1
+    
+    def add_poi(self, city, category, poi):
+        self.writers.write(self.poi_file(city), poi)
+        self.poi_counts[city] += 1
+    
+    def add_boundary(self, boundary):
+        self.writers.write(self.boundary_file(), boundary)
+        self.boundary_count += 1
+    
+    def close(self):
+        self.writers.close()
+    
+    def counts(self):
+        """Return the counters as plain (picklable) structures"""
+        return {
+            'streets': dict(self.street_counts),
+            'pois': dict(self.poi_counts),
+            'boundaries': self.boundary_count
+        }
+    
+    @classmethod
+    def part(cls, directory):
+        """Output for one worker of a parallel run"""
+        return cls(directory)
+    
+    def merge_parts(self, results, parts_dir):
+        merge_stream_parts(results, parts_dir, self)
+
+
+class ParquetOutput:
+    """
+    Write records to streets.parquet, pois.parquet and boundaries.parquet.
+
+    Columns are typed and low-cardinality ones dictionary encoded. Records
+    are written in batches during the parse, each city to its own row
+    groups, so a city can be loaded without reading the others.
+    """
+    
+    format = 'parquet'
+    
+    def __init__(self, output_dir, sequenced=False):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        schemas = {'streets': STREET_SCHEMA, 'pois': POI_SCHEMA, 'boundaries': BOUNDARY_SCHEMA}
+        self.writers = {
+            kind: ParquetRecordWriter(
+                self.output_dir / f"{kind}.parquet", with_seq(schema) if sequenced else schema
+            )
+            for kind, schema in schemas.items()
+        }
+        self.street_counts = defaultdict(int)
+        self.poi_counts = defaultdict(int)
+        self.boundary_count = 0
+    
+    def add_street(self, city, street):
+        self.writers['streets'].write(street, city)
+        self.street_counts[city] += 1
+    
+    def add_poi(self, city, category, poi):
+        self.writers['pois'].write(poi, city)
+        self.poi_counts[city] += 1
+    
+    def add_boundary(self, boundary):
+        self.writers['boundaries'].write(boundary)
+        self.boundary_count += 1
+    
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+    
+    def counts(self):
+        """Return the counters as plain (picklable) structures"""
+        return {
+            'streets': dict(self.street_counts),
+            'pois': dict(self.poi_counts),
+            'boundaries': self.boundary_count
+        }
+    
+    @classmethod
+    def part(cls, directory):
+        """Output for one worker of a parallel run, with the _seq column kept"""
+        return cls(directory, sequenced=True)
+    
+    def merge_parts(self, results, parts_dir):
+        """
+        Merge per-worker Parquet files city by city, in callback stream order
+        (see TurkeyExtractor.sequence()).
+        """
+        parts_dir = Path(parts_dir)
+        parts = [parts_dir / f"part-{shard}" for shard in range(len(results))]
+        
+        for kind, counts in (('streets', self.street_counts), ('pois', self.poi_counts)):
+            for result in results:
+                for city, count in result['counts'][kind].items():
+                    counts[city] += count
+            merge_parquet_parts(
+                [part / f"{kind}.parquet" for part in parts], self.writers[kind],
+                groups=list(counts), group_by='city'
+            )
+        self.boundary_count = merge_parquet_parts(
+            [part / "boundaries.parquet" for part in parts], self.writers['boundaries'], groups=[None]
+        )
+
+
+def _by_seq(record):
+    return record['_seq']
+
+
+def _strip_seq(record):
+    del record['_seq']
+    return record
+
+
+@functools.lru_cache(maxsize=1)
+def _load_locator(polygons_file):
+    """Admin polygons of a worker process, loaded once for all its parts"""
+    return AdminLocator.from_geojson(polygons_file)
+
+
+def _extract_part(pbf_file, part, block_range, num_parts, stream_dir=None,
+                  location_index=None, polygons_file=None, output_class=StreamingOutput,
+                  geometry_file=None, metrics_file=None):
+    """
+    Run one part of a parallel extraction.
+
+    Parts with a (start, end) block_range extract the records of those
+    PBF blocks; the part without one assembles the multipolygon POIs. The
+    part number is the base of the records' positions (see sequence()).
+    """
+    sink = output_class.part(Path(stream_dir) / f"part-{part}") if stream_dir else None
+    locator = _load_locator(polygons_file) if polygons_file else None
+    geometry = GeometryWriter(geometry_file) if geometry_file else None
+    metrics = None
+    if metrics_file is not None:
+        # Each part exports its own file, e.g. metrics.worker-2.prom
+        METRICS.reset()
+        metrics = METRICS
+        exporter = MetricsExporter(METRICS, worker_metrics_file(metrics_file, part),
+                                   METRICS_INTERVAL, labels={'worker': part}).start()
+    handler = TurkeyExtractor(sink=sink, locator=locator, geometry=geometry, metrics=metrics,
+                              areas=('way',) if block_range else ('relation',),
+                              seq_base=part * PART_SEQ_STRIDE)
+    if block_range:
+        handler.apply_range(pbf_file, *block_range, location_index)
+    else:
+        handler.apply_multipolygons(pbf_file, location_index)
+    if metrics_file is not None:
+        exporter.stop()
+    logger.info(f"Part {part + 1}/{num_parts} finished: "
+                f"{handler.stats['streets']:,} streets, {handler.stats['pois']:,} POIs")
+    
+    if geometry is not None:
+        geometry.close()
+    
+    if sink is not None:
+        sink.close()
+        return {'stats': dict(handler.stats), 'counts': sink.counts()}
+    return handler.results()
+
+
+def merge_shard_results(results):
+    """
+    Merge per-worker results into a single handler.
+
+    Records carry their position in the callback stream (see
+    TurkeyExtractor.sequence()), so replaying them in that order rebuilds
+    exactly the same city/category ordering as a single-process run.
+    """
+    merged = TurkeyExtractor()
+    
+    for result in results:
+        add_stats(merged.stats, result['stats'])
+    
+    streets = heapq.merge(*(
+        heapq.merge(*result['streets'].values(), key=_by_seq)
+        for result in results
+    ), key=_by_seq)
+    for street in streets:
+        merged.streets[street['city']].append(_strip_seq(street))
+    
+    pois = heapq.merge(*(
+        heapq.merge(*(
+            category_pois
+            for categories in result['pois'].values()
+            for category_pois in categories.values()
+        ), key=_by_seq)
+        for result in results
+    ), key=_by_seq)
+    for poi in pois:
+        merged.pois[poi['city']][poi['category']].append(_strip_seq(poi))
+    
+    merged.admin_boundaries = [
+        _strip_seq(boundary)
+        for boundary in heapq.merge(*(result['admin_boundaries'] for result in results), key=_by_seq)
+    ]
+    
+    return merged
+
+
+def merge_stream_parts(results, stream_dir, output):
+    """
+    Merge per-worker NDJSON shards into the final output files.
+
+    Every worker file is in callback stream order (see
+    TurkeyExtractor.sequence()), so a streaming k-way merge yields the same
+    record order as a single-process run.
+    """
+    stream_dir = Path(stream_dir)
+    parts = [stream_dir / f"part-{shard}" for shard in range(len(results))]
+    
+    cities = {}
+    for result in results:
+        for city in list(result['counts']['streets']) + list(result['counts']['pois']):
+            cities.setdefault(city, None)
+    
+    for city in cities:
+        for kind, target in (('streets', output.street_file(city)), ('pois', output.poi_file(city))):
+            sources = [
+                part / target.name for part, result in zip(parts, results)
+                if city in result['counts'][kind]
+            ]
+            if not sources:
+                continue
+            count = merge_ndjson(sources, target, key=_by_seq, transform=_strip_seq)
+            if kind == 'streets':
+                output.street_counts[city] += count
+            else:
+                output.poi_counts[city] += count
+    
+    sources = [part / output.boundary_file().name for part in parts]
+    sources = [source for source in sources if source.exists()]
+    if sources:
+        output.boundary_count = merge_ndjson(
+            sources, output.boundary_file(), key=_by_seq, transform=_strip_seq
+        )
+
+
+def load_stream_parts(results, parts_dir, handler):
+    """Read NDJSON parts written one after the other back into a handler's stores"""
+    parts_dir = Path(parts_dir)
+    for shard, result in enumerate(results):
+        part = StreamingOutput(parts_dir / f"part-{shard}")
+        for city in result['counts']['streets']:
+            for street in iter_ndjson(part.street_file(city)):
+                handler.streets[city].append(_strip_seq(street))
+        for city in result['counts']['pois']:
+            for poi in iter_ndjson(part.poi_file(city)):
+                handler.pois[city][poi['category']].append(_strip_seq(poi))
+        if result['counts']['boundaries']:
+            handler.admin_boundaries.extend(
+                _strip_seq(boundary) for boundary in iter_ndjson(part.boundary_file())
+            )
+
+
+def fsync_path(path):
+    """Flush one file, or a directory's entries, to disk"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ExtractionCheckpoint:
+    """
+    Periodic checkpoints of a single-process extraction (--checkpoint-dir).
+
+    The main pass reads the PBF file in segments of whole blocks (see
+    PBFBlocks). Records go to an output part (part-<n>, NDJSON or Parquet,
+    like the parts of parallel workers) that is closed once the interval
+    has passed; checkpoint.json then records the block offset reached,
+    the handler statistics and the completed parts.
+
+    A resumed run drops the unfinished part, replays the completed blocks
+    into the location index and the area assembler only (areas completed
+    there were already extracted) and continues at the recorded offset.
+    At the end the parts are merged into the real output.
+
+    Only the part-* entries and checkpoint.json are ever removed, never the
+    directory itself; a non-empty directory without checkpoint.json is
+    refused, so an output or other directory is not wiped by mistake.
+    """
+    
+    def __init__(self, directory, pbf_file, output_format='json', geometry=False,
+                 interval=CHECKPOINT_INTERVAL, resume=False):
+        self.directory = Path(directory)
+        self.pbf_file = pbf_file
+        self.part_class = ParquetOutput if output_format == 'parquet' else StreamingOutput
+        self.geometry = geometry
+        self.interval = interval
+        self.settings = {
+            'source': pbf_fingerprint(pbf_file),
+            'format': output_format,
+            'geometry': geometry
+        }
+        self.offset = 0  # Block offset up to which all parts are complete
+        self.parts = []
+        self.stats = {}
+        self._part_start = None
+        
+        manifest = self.directory / CHECKPOINT_MANIFEST
+        if self.directory.exists() and any(self.directory.iterdir()) and not manifest.exists():
+            raise ValueError(f"{self.directory} is not empty and has no {CHECKPOINT_MANIFEST}, "
+                             f"refusing to use it as checkpoint directory")
+        if resume and manifest.exists():
+            data = json.loads(manifest.read_text(encoding='utf-8'))
+            if data['settings'] != self.settings:
+                raise ValueError(f"Checkpoint in {self.directory} was written for another "
+                                 f"input file or output options: {data['settings']}")
+            self.offset, self.parts, self.stats = data['offset'], data['parts'], data['stats']
+            logger.info(f"Resuming from checkpoint at block offset {self.offset:,} "
+                        f"({len(self.parts)} completed parts)")
+        elif resume:
+            logger.warning(f"No checkpoint in {self.directory}, starting from the beginning")
+        
+        # Parts after the last checkpoint are unfinished (all of them when starting over)
+        self._remove_parts(keep=len(self.parts))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Marks the directory as a checkpoint before any part is written
+        self._write_manifest()
+    
+    @property
+    def resuming(self):
+        return self.offset > 0
+    
+    def part_dir(self, index):
+        return self.directory / f"part-{index}"
+    
+    def _remove_parts(self, keep=0):
+        for part in self.directory.glob('part-*'):
+            if int(part.name.split('-')[1]) >= keep:
+                shutil.rmtree(part)
+    
+    def _write_manifest(self):
+        manifest = self.directory / CHECKPOINT_MANIFEST
+        tmp = manifest.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'settings': self.settings,
+                'offset': self.offset,
+                'parts': self.parts,
+                'stats': self.stats
+            }, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(manifest)
+        fsync_path(self.directory)
+    
+    def _open_part(self, handler, offset):
+        part = self.part_dir(len(self.parts))
+        handler.sink = self.part_class.part(part)
+        handler.geometry = GeometryWriter(part / GEOMETRY_FILE) if self.geometry else None
+        self._part_start = offset
+    
+    def _close_part(self, handler, offset):
+        handler.flush()
+        handler.sink.close()
+        if handler.geometry is not None:
+            handler.geometry.close()
+        part = self.part_dir(len(self.parts))
+        self.parts.append({'offset': self._part_start, 'counts': handler.sink.counts()})
+        self.offset = offset
+        self.stats = dict(handler.stats)
+        
+        # Parts must be on disk before the manifest refers to them
+        for path in sorted(part.rglob('*'), reverse=True):
+            fsync_path(path)
+        fsync_path(part)
+        self._write_manifest()
+        logger.info(f"Checkpoint at block offset {offset:,} ({len(self.parts)} parts)")
+    
+    def run(self, handler, chain, replay_chain):
+        """Run the main pass from the last checkpoint (see TurkeyExtractor.apply_filtered())"""
+        blocks = PBFBlocks(self.pbf_file)
+        handler.sequenced = True
+        
+        if self.resuming:
+            logger.info("Replaying the completed blocks into the location index...")
+            handler.stats.update(self.stats)
+            handler.replaying = True
+            for _, _, data in blocks.segments(0, SEGMENT_BYTES, end=self.offset):
+                osmium.apply(osmium.io.Reader(osmium.io.FileBuffer(data, 'pbf'), PBF_ENTITIES),
+                             *replay_chain)
+            handler.replaying = False
+        
+        self._open_part(handler, self.offset)
+        last_checkpoint = time.monotonic()
+        for start, end, data in blocks.segments(self.offset, SEGMENT_BYTES):
+            handler.apply_segment(data, chain)
+            if time.monotonic() - last_checkpoint >= self.interval and end < blocks.end:
+                self._close_part(handler, end)
+                self._open_part(handler, end)
+                last_checkpoint = time.monotonic()
+        handler.finish()
+        self._close_part(handler, blocks.end)
+    
+    def finish(self, handler, output=None, geometry_file=None):
+        """Merge the parts into the output (or the handler's stores) and remove the checkpoint"""
+        results = [{'counts': part['counts']} for part in self.parts]
+        handler.sink = output
+        handler.geometry = None
+        if geometry_file is not None:
+            merge_geometry_stores(
+                [self.part_dir(i) / GEOMETRY_FILE for i in range(len(self.parts))], geometry_file
+            )
+        if output is not None:
+            output.merge_parts(results, self.directory)
+        else:
+            load_stream_parts(results, self.directory, handler)
+        self._remove_parts()
+        (self.directory / CHECKPOINT_MANIFEST).unlink()
+
+
+def run_extraction(pbf_file, workers=1, output=None,
+                   location_index=LOCATION_INDEX, reuse_index=False, polygons_file=None,
+                   state=None, geometry_file=None, build_polygons=True, metrics_file=None,
+                   checkpoint=None, scratch_dir=None):
+    """
+    Parse the PBF file, optionally splitting the work over a process pool.
+
+    With a StreamingOutput or ParquetOutput, records are written to disk
+    during the parse and the returned handler only carries the statistics.
+
+    A file based location index is kept on disk after the run. If
+    reuse_index is set and the index was built from the same file, it is
+    used as is. Parallel runs build a shared index once up front, which
+    every worker maps; with a memory based index type a temporary
+    dense_file_array is used instead (in scratch_dir, e.g. the output
+    directory). Workers then take turns on block ranges of the file
+    (PBFBlocks.split()), each block being decoded once, and one more
+    assembles the multipolygon POIs.
+
+    If polygons_file is given, admin boundary polygons are assembled first,
+    saved there as GeoJSON and used to tag every street and POI. With
+    build_polygons=False an existing polygons_file is loaded instead (e.g.
+    the full-country polygons when extracting a clipped region file).
+
+    An ExtractionState (single process only) is filled with every record
+    so that later change files can be applied with update_from_osc.py.
+
+    If geometry_file is given, street linestrings are written there as a
+    geometry store (workers write parts that are concatenated afterwards).
+
+    With metrics_file, the passes are instrumented in METRICS (exported by
+    the caller) and every worker exports its own metrics file next to it.
+
+    With an ExtractionCheckpoint (single process, no state), the main pass
+    is checkpointed and, when resuming, continues at the last checkpoint;
+    the admin polygons written by the interrupted run are reused.
+    """
+    scratch = None
+    if workers > 1 and location_index_file(location_index) is None:
+        # Workers share one index built up front, so it has to be a file
+        scratch = Path(tempfile.mkdtemp(prefix='node-locations-', dir=scratch_dir))
+        location_index = f"dense_file_array,{scratch / 'nodes.idx'}"
+        logger.info(f"Parallel run: node locations go to a shared index in {scratch}")
+    try:
+        return _run_extraction(pbf_file, workers, output, location_index, reuse_index,
+                               polygons_file, state, geometry_file, build_polygons, metrics_file,
+                               checkpoint)
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch)
+
+
+def _run_extraction(pbf_file, workers, output, location_index, reuse_index, polygons_file,
+                    state, geometry_file, build_polygons, metrics_file, checkpoint):
+    if state is not None and workers > 1:
+        raise ValueError("Writing an extraction state requires a single worker")
+    if checkpoint is not None and (workers > 1 or state is not None):
+        raise ValueError("Checkpointing requires a single worker and no extraction state")
+    if (checkpoint is not None and checkpoint.resuming
+            and polygons_file is not None and Path(polygons_file).exists()):
+        build_polygons = False
+    index_file = location_index_file(location_index)
+    if reuse_index and index_file is None:
+        raise ValueError("Reusing the location index requires a file based index")
+    shared_index = index_file is not None and (reuse_index or workers > 1)
+    check_location_index(location_index, shared=shared_index)
+    
+    if shared_index:
+        if reuse_index and location_index_matches(location_index, pbf_file):
+            logger.info(f"Reusing node location index {index_file}")
+        else:
+            build_location_index(pbf_file, location_index)
+    elif index_file is not None and index_file.exists():
+        index_file.unlink()  # Stale index from another file
+    
+    locator = None
+    if polygons_file is not None and not build_polygons:
+        locator = AdminLocator.from_geojson(polygons_file)
+    elif polygons_file is not None:
+        admin_index = location_index
+        if index_file is not None and not shared_index:
+            # Separate scratch file, so the main pass does not append to it twice
+            admin_index = f"{location_index}.admin"
+        with METRICS.timer('pbf_stage_seconds', stage='admin_polygons'):
+            locator = build_admin_locator(pbf_file, admin_index, reuse_index=shared_index)
+        locator.to_geojson(polygons_file)
+        if admin_index != location_index:
+            location_index_file(admin_index).unlink()
+    
+    if workers <= 1:
+        geometry = None
+        if geometry_file is not None and checkpoint is None:
+            geometry = GeometryWriter(geometry_file)
+        handler = TurkeyExtractor(sink=output, locator=locator, state=state, geometry=geometry,
+                                  metrics=METRICS if metrics_file is not None else None)
+        handler.apply_filtered(pbf_file, location_index, reuse_index=shared_index,
+                               checkpoint=checkpoint)
+        if geometry is not None:
+            geometry.close()
+        if checkpoint is not None:
+            checkpoint.finish(handler, output, geometry_file)
+        if index_file is not None and not shared_index:
+            save_location_index_metadata(location_index, pbf_file)
+    else:
+        ranges = PBFBlocks(pbf_file).split(workers * RANGES_PER_WORKER)
+        # The multipolygon part comes last in the record order
+        parts = list(enumerate(ranges)) + [(len(ranges), None)]
+        logger.info(f"Running parallel extraction with {workers} workers "
+                    f"over {len(ranges)} block ranges")
+        stream_dir = output.output_dir / '.parts' if output is not None else None
+        geometry_parts = [
+            Path(f"{geometry_file}.part-{part}") if geometry_file is not None else None
+            for part in range(len(ranges))
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # It reads the ways of the whole file, so it starts first
+            futures = {
+                part: pool.submit(_extract_part, pbf_file, part, block_range, len(parts),
+                                  stream_dir, location_index, polygons_file, type(output),
+                                  geometry_parts[part] if block_range else None, metrics_file)
+                for part, block_range in parts[-1:] + parts[:-1]
+            }
+            results = [futures[part].result() for part, _ in parts]
+        
+        if geometry_file is not None:
+            merge_geometry_stores(geometry_parts, geometry_file)
+            for part in geometry_parts:
+                part.unlink()
+                index_filename(part).unlink()
+        
+        if output is not None:
+            output.merge_parts(results, stream_dir)
+            shutil.rmtree(stream_dir)
+            handler = TurkeyExtractor(sink=output)
+            for result in results:
+                add_stats(handler.stats, result['stats'])
+        else:
+            handler = merge_shard_results(results)
+    
+    if output is not None:
+        output.close()
+    for osm_type in ('nodes', 'ways', 'relations'):
+        if handler.stats[osm_type] is not None:
+            METRICS.set_counter('pbf_elements_total', handler.stats[osm_type], type=osm_type[:-1])
+    return handler
+
+
+def save_boundaries_file(output_dir, boundaries):
+    """Write turkey_administrative.json"""
+    admin_file = output_dir / "turkey_administrative.json"
+    with open(admin_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'extracted_at': datetime.now().isoformat(),
+            'total_count': len(boundaries),
+            'boundaries': boundaries
+        }, f, ensure_ascii=False, indent=2)
+
+
+def save_city_file(output_dir, city, kind, records):
+    """Write <city>_streets.json or <city>_poi.json (kind is 'streets' or 'pois')"""
+    suffix = 'streets' if kind == 'streets' else 'poi'
+    city_file = output_dir / f"{safe_filename(city)}_{suffix}.json"
+    with open(city_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'city': city,
+            'extracted_at': datetime.now().isoformat(),
+            'total_count': len(records),
+            kind: records
+        }, f, ensure_ascii=False, indent=2)
+
+
+def save_json_outputs(handler, output_dir):
+    """Write the in-memory results as pretty-printed JSON files"""
+    # Save administrative boundaries
+    logger.info("Saving administrative boundaries...")
+    save_boundaries_file(output_dir, handler.admin_boundaries)
+    logger.info(f"   Saved {len(handler.admin_boundaries)} boundaries")
+    
+    # Save streets by city
+    logger.info("")
+    logger.info("Saving streets by city...")
+    street_counts = {}
+    for city, streets in handler.streets.items():
+        if streets:  # Only save if we have data
+            save_city_file(output_dir, city, 'streets', list(streets))
+            logger.info(f"   {city}: {len(streets):,} streets")
+        street_counts[city] = len(streets)
+    
+    # Save POIs by city and category
+    logger.info("")
+    logger.info("Saving POIs by city...")
+    poi_counts = {}
+    for city, categories in handler.pois.items():
+        if categories:  # Only save if we have data
+            city_pois = []
+            for category, pois in categories.items():
+                city_pois.extend(pois)
+            
+            if city_pois:
+                save_city_file(output_dir, city, 'pois', city_pois)
+                logger.info(f"   {city}: {len(city_pois):,} POIs")
+            poi_counts[city] = len(city_pois)
+    
+    return street_counts, poi_counts
+
+
+def save_summary(output_dir, pbf_file, stats, street_counts, poi_counts, memory=None):
+    """Write extraction_summary.json (memory is TurkeyExtractor.memory_usage(), if kept in memory)"""
+    logger.info("")
+    logger.info("Saving extraction summary...")
+    summary_file = output_dir / "extraction_summary.json"
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'extraction_date': datetime.now().isoformat(),
+            'source_file': pbf_file,
+            'method': 'PBF file parsing (osmium)',
+            'statistics': {
+                'total_nodes': stats['nodes'],
+                'total_ways': stats['ways'],
+                'total_relations': stats['relations'],
+                'python_callbacks': stats['callbacks'],
+                'total_streets': sum(street_counts.values()),
+                'total_pois': sum(poi_counts.values()),
+                'cities_processed': len(street_counts)
+            },
+            'memory': memory,
+            'cities': {
+                city: {
+                    'streets': count,
+                    'pois': poi_counts.get(city, 0)
+                }
+                for city, count in street_counts.items()
+            }
+        }, f, ensure_ascii=False, indent=2)
+
+
+def make_output(output_format, output_dir, max_open_files=64):
+    """Return the streaming sink for an output format (None for in-memory JSON)"""
+    if output_format == 'ndjson':
+        return StreamingOutput(output_dir, max_open_files)
+    if output_format == 'parquet':
+        return ParquetOutput(output_dir)
+    return None
+
+
+def write_outputs(handler, output, output_dir, pbf_file):
+    """Save in-memory results (if not streamed) and the summary; returns the city counts"""
+    memory = None
+    if output is not None:
+        street_counts = dict(output.street_counts)
+        poi_counts = dict(output.poi_counts)
+        logger.info(f"Streamed {output.boundary_count:,} boundaries, "
+                    f"{sum(street_counts.values()):,} streets and "
+                    f"{sum(poi_counts.values()):,} POIs to {output.format}")
+    else:
+        memory = handler.memory_usage()
+        logger.info(f"Records held in memory: {memory['records']:,} "
+                    f"({memory['bytes'] / 2**20:,.1f} MiB, "
+                    f"{memory['bytes_per_record']} bytes per record)")
+        street_counts, poi_counts = save_json_outputs(handler, output_dir)
+    
+    save_summary(output_dir, pbf_file, handler.stats, street_counts, poi_counts, memory=memory)
+    return street_counts, poi_counts
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Extract Turkey OSM data from a PBF file")
+    parser.add_argument('--pbf', default=PBF_FILE, help="Input .osm.pbf file")
+    parser.add_argument('--output-dir', type=Path, default=OUTPUT_DIR, help="Output directory")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes (default: 1)")
+    parser.add_argument('--format', choices=['json', 'ndjson', 'parquet'], default='json',
+                        help="Output format: pretty-printed JSON per city (collected in memory), "
+                             "NDJSON per city or Parquet files with one row group per city "
+                             "(both written during the parse). Default: json")
+    parser.add_argument('--stream', action='store_true',
+                        help="Same as --format ndjson")
+    parser.add_argument('--max-open-files', type=int, default=64,
+                        help="Maximum number of NDJSON files kept open in --stream mode")
+    parser.add_argument('--location-index', default=LOCATION_INDEX,
+                        help="Node location index: flex_mem, sparse_mem_array, dense_mmap_array, "
+                             "or a file based index such as dense_file_array,/path/nodes.idx "
+                             f"(default: {LOCATION_INDEX})")
+    parser.add_argument('--reuse-location-index', action='store_true',
+                        help="Reuse a dense_file_array index built from the same PBF file "
+                             "by a previous run")
+    parser.add_argument('--state', type=Path,
+                        help="Also store all records in this SQLite file so that OSM change "
+                             "files can be applied later with update_from_osc.py "
+                             "(requires a file based --location-index)")
+    parser.add_argument('--street-geometry', action='store_true',
+                        help=f"Also write the full street linestrings to {GEOMETRY_FILE} "
+                             "(delta encoded, indexed by way id)")
+    parser.add_argument('--no-admin-polygons', action='store_true',
+                        help="Skip polygon based province/district/neighborhood assignment "
+                             "and bucket records by addr:city only")
+    parser.add_argument('--checkpoint-dir', type=Path,
+                        help="Checkpoint the extraction in this (dedicated) directory, so an "
+                             "interrupted run can be continued with --resume (single worker)")
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                        help=f"Seconds between checkpoints (default: {CHECKPOINT_INTERVAL})")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument('--metrics-file', type=Path,
+                        help="Periodically write throughput and resource metrics to this file "
+                             "(Prometheus text format for *.prom, JSON otherwise); parallel "
+                             "workers write <name>.worker-N<suffix> next to it")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                        help=f"Seconds between metrics exports (default: {METRICS_INTERVAL})")
+    return parser.parse_args()
 
 
 def main():
@@ -162,7 +1541,12 @@ def main():
     logger.info("🗺️  Starting Turkey OSM PBF Extraction")
     logger.info("=" * 60)
     
-    pbf_file = "/mnt/osm-data/turkey-osm-extractor/turkey-251020.osm.pbf"
+    args = parse_args()
+    if args.stream:
+        args.format = 'ndjson'
+    pbf_file = args.pbf
+    output_dir = args.output_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
     
     # Check if file exists
     if not Path(pbf_file).exists():
@@ -173,116 +1557,93 @@ def main():
     logger.info("This will take 10-30 minutes...")
     logger.info("")
     
-    # Create handler and parse file
-    handler = TurkeyExtractor()
+    state = None
+    if args.state is not None:
+        if location_index_file(args.location_index) is None:
+            logger.error("--state requires a file based --location-index to resolve "
+                         "unchanged nodes during updates")
+            return
+        if args.state.exists():
+            args.state.unlink()
+        state = ExtractionState(args.state)
+    
+    if args.resume and args.checkpoint_dir is None:
+        logger.error("--resume requires --checkpoint-dir")
+        return
+    checkpoint = None
+    if args.checkpoint_dir is not None:
+        try:
+            checkpoint = ExtractionCheckpoint(
+                args.checkpoint_dir, pbf_file, args.format, geometry=args.street_geometry,
+                interval=args.checkpoint_interval, resume=args.resume
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            return
+    
+    exporter = None
+    if args.metrics_file is not None:
+        exporter = MetricsExporter(METRICS, args.metrics_file, args.metrics_interval).start()
+        logger.info(f"Writing metrics to {args.metrics_file} every {args.metrics_interval:g}s")
     
     try:
-        handler.apply_file(pbf_file, locations=True)
+        output = make_output(args.format, output_dir, args.max_open_files)
+        handler = run_extraction(
+            pbf_file,
+            workers=args.workers,
+            output=output,
+            location_index=args.location_index,
+            reuse_index=args.reuse_location_index,
+            polygons_file=None if args.no_admin_polygons else output_dir / ADMIN_POLYGONS_FILE,
+            state=state,
+            geometry_file=output_dir / GEOMETRY_FILE if args.street_geometry else None,
+            metrics_file=args.metrics_file,
+            checkpoint=checkpoint,
+            scratch_dir=output_dir
+        )
+        
+        if state is not None:
+            state.set_meta('source_file', pbf_fingerprint(pbf_file))
+            state.set_meta('output_format', args.format)
+            state.set_meta('location_index', args.location_index)
+            state.set_meta('admin_polygons', not args.no_admin_polygons)
+            state.close()
+            logger.info(f"Extraction state saved to {args.state}")
         
         logger.info("")
         logger.info("=" * 60)
         logger.info("Extraction Complete!")
-        logger.info(f"Total nodes processed: {handler.stats['nodes']:,}")
-        logger.info(f"Total ways processed: {handler.stats['ways']:,}")
-        logger.info(f"Total relations processed: {handler.stats['relations']:,}")
+        logger.info(f"Total nodes processed: {format_count(handler.stats['nodes'])}")
+        logger.info(f"Total ways processed: {format_count(handler.stats['ways'])}")
+        logger.info(f"Total relations processed: {format_count(handler.stats['relations'])}")
+        logger.info(f"Python callbacks: {handler.stats['callbacks']:,}")
         logger.info(f"Total streets extracted: {handler.stats['streets']:,}")
         logger.info(f"Total POIs extracted: {handler.stats['pois']:,}")
         logger.info("")
         
-        # Save administrative boundaries
-        logger.info("Saving administrative boundaries...")
-        admin_file = OUTPUT_DIR / "turkey_administrative.json"
-        with open(admin_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'extracted_at': datetime.now().isoformat(),
-                'total_count': len(handler.admin_boundaries),
-                'boundaries': handler.admin_boundaries
-            }, f, ensure_ascii=False, indent=2)
-        logger.info(f"   Saved {len(handler.admin_boundaries)} boundaries")
-        
-        # Save streets by city
-        logger.info("")
-        logger.info("Saving streets by city...")
-        total_streets = 0
-        for city, streets in handler.streets.items():
-            if streets:  # Only save if we have data
-                # Clean city name for filename (remove slashes and special chars)
-                safe_city_name = city.replace('/', '_').replace('\\', '_').replace(':', '_')
-                city_file = OUTPUT_DIR / f"{safe_city_name}_streets.json"
-                with open(city_file, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'city': city,
-                        'extracted_at': datetime.now().isoformat(),
-                        'total_count': len(streets),
-                        'streets': streets
-                    }, f, ensure_ascii=False, indent=2)
-                logger.info(f"   {city}: {len(streets):,} streets")
-                total_streets += len(streets)
-        
-        # Save POIs by city and category
-        logger.info("")
-        logger.info("Saving POIs by city...")
-        total_pois = 0
-        for city, categories in handler.pois.items():
-            if categories:  # Only save if we have data
-                city_pois = []
-                for category, pois in categories.items():
-                    city_pois.extend(pois)
-                
-                if city_pois:
-                    # Clean city name for filename
-                    safe_city_name = city.replace('/', '_').replace('\\', '_').replace(':', '_')
-                    city_file = OUTPUT_DIR / f"{safe_city_name}_poi.json"
-                    with open(city_file, 'w', encoding='utf-8') as f:
-                        json.dump({
-                            'city': city,
-                            'extracted_at': datetime.now().isoformat(),
-                            'total_count': len(city_pois),
-                            'pois': city_pois
-                        }, f, ensure_ascii=False, indent=2)
-                    logger.info(f"   {city}: {len(city_pois):,} POIs")
-                    total_pois += len(city_pois)
-        
-        # Save summary
-        logger.info("")
-        logger.info("Saving extraction summary...")
-        summary_file = OUTPUT_DIR / "extraction_summary.json"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'extraction_date': datetime.now().isoformat(),
-                'source_file': pbf_file,
-                'method': 'PBF file parsing (osmium)',
-                'statistics': {
-                    'total_nodes': handler.stats['nodes'],
-                    'total_ways': handler.stats['ways'],
-                    'total_relations': handler.stats['relations'],
-                    'total_streets': total_streets,
-                    'total_pois': total_pois,
-                    'cities_processed': len(handler.streets)
-                },
-                'cities': {
-                    city: {
-                        'streets': len(streets),
-                        'pois': sum(len(pois) for pois in handler.pois.get(city, {}).values())
-                    }
-                    for city, streets in handler.streets.items()
-                }
-            }, f, ensure_ascii=False, indent=2)
+        with METRICS.timer('pbf_stage_seconds', stage='write_outputs'):
+            street_counts, poi_counts = write_outputs(handler, output, output_dir, pbf_file)
         
+        total_streets = sum(street_counts.values())
+        total_pois = sum(poi_counts.values())
         logger.info("")
         logger.info("=" * 60)
         logger.info("ALL DONE!")
         logger.info(f"Final Stats:")
         logger.info(f"   - Streets: {total_streets:,}")
         logger.info(f"   - POIs: {total_pois:,}")
-        logger.info(f"   - Cities: {len(handler.streets)}")
-        logger.info(f"Output directory: {OUTPUT_DIR}")
+        logger.info(f"   - Cities: {len(street_counts)}")
+        logger.info(f"Output directory: {output_dir}")
         logger.info("=" * 60)
         
     except Exception as e:
         logger.error(f"Error during extraction: {e}")
         import traceback
         traceback.print_exc()
+    
+    finally:
+        if exporter is not None:
+            exporter.stop()
 
 
 if __name__ == "__main__":
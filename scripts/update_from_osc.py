@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Apply OSM change files (.osc) to a previous PBF extraction
+Only the city files touched by the changes are rewritten
+"""
+
+import osmium
+import json
+import argparse
+import sys
+from pathlib import Path
+from datetime import datetime
+import logging
+from collections import defaultdict
+
+# Add the project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from shapely.geometry import Polygon
+from src.utils.admin_locator import AdminLocator
+from src.utils.columnar import BOUNDARY_SCHEMA, POI_SCHEMA, STREET_SCHEMA, write_parquet
+from src.utils.extraction_state import ExtractionState
+from src.utils.ndjson import dump_record
+from extract_from_pbf import (
+    ADMIN_POLYGONS_FILE, OUTPUT_DIR, POI_RULES, TurkeyExtractor, location_index_file,
+    safe_filename, save_boundaries_file, save_city_file
+)
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ChangeHandler(TurkeyExtractor):
+    """
+    Apply changed nodes, ways and relations to an ExtractionState.
+
+    Records are rebuilt with the same code as the full extraction and
+    written to the state only. Every city whose streets or POIs changed
+    (before or after the change) is remembered so its files can be
+    rewritten afterwards.
+
+    Limitations: boundary polygons and multipolygon POI centroids are not
+    re-assembled from a diff. Tag changes on those relations are applied
+    and the previous centroid is kept.
+    """
+
+    def __init__(self, state, locator=None):
+        TurkeyExtractor.__init__(self, locator=locator, state=state)
+        self.dirty = {'streets': set(), 'pois': set()}
+        self.boundaries_changed = False
+        self.moved_nodes = set()
+        self.changed_ways = set()
+        self._boundary_added = False
+
+    def _mark(self, kind, old_city, new_city=None):
+        for city in (old_city, new_city):
+            if city is not None:
+                self.dirty[kind].add(city)
+
+    def add_street(self, city, street):
+        self._mark('streets', self.state.put_street(street), city)
+
+    def add_poi(self, city, category, poi):
+        self._mark('pois', self.state.put_poi(poi), city)
+
+    def add_boundary(self, boundary):
+        self.state.put_boundary(boundary)
+        self.boundaries_changed = True
+        self._boundary_added = True
+
+    def remove_street(self, way_id):
+        self._mark('streets', self.state.delete_street(way_id))
+
+    def remove_poi(self, osm_type, osm_id):
+        self._mark('pois', self.state.delete_poi(osm_type, osm_id))
+
+    def node(self, n):
+        """Rebuild or remove the POI of a changed node"""
+        self.moved_nodes.add(n.id)
+        pois = self.stats['pois']
+        if not n.deleted:
+            TurkeyExtractor.node(self, n)
+        if self.stats['pois'] == pois:
+            self.remove_poi('node', n.id)
+
+    def way(self, w):
+        """Rebuild or remove the street and area POI of a changed way"""
+        self.changed_ways.add(w.id)
+        streets, pois = self.stats['streets'], self.stats['pois']
+
+        if not w.deleted:
+            TurkeyExtractor.way(self, w)
+            if len(w.nodes) >= 4 and w.is_closed() and POI_RULES.match(w.tags):
+                try:
+                    centroid = Polygon([(n.lon, n.lat) for n in w.nodes]).centroid
+                except (osmium.InvalidLocationError, ValueError):
+                    centroid = None
+                if centroid is not None and not centroid.is_empty:
+                    self.add_poi_from_tags(w.id, 'way', w.tags, centroid.y, centroid.x)
+                    self.state.put_way_nodes(w.id, [n.ref for n in w.nodes])
+
+        if self.stats['streets'] == streets:
+            self.remove_street(w.id)
+        if self.stats['pois'] == pois:
+            self.remove_poi('way', w.id)
+        if self.stats['streets'] == streets and self.stats['pois'] == pois:
+            self.state.delete_way_nodes(w.id)
+
+    def relation(self, r):
+        """Update or remove boundaries and multipolygon POIs of a changed relation"""
+        self._boundary_added = False
+        if not r.deleted:
+            TurkeyExtractor.relation(self, r)
+        if not self._boundary_added and self.state.delete_boundary(r.id):
+            self.boundaries_changed = True
+
+        poi = self.state.get_poi('relation', r.id)
+        if poi is not None:
+            pois = self.stats['pois']
+            if not r.deleted:
+                self.add_poi_from_tags(r.id, 'relation', r.tags, poi['lat'], poi['lon'])
+            if self.stats['pois'] == pois:
+                self.remove_poi('relation', r.id)
+
+    def refresh_moved_ways(self, location_index):
+        """Recompute the center of unchanged streets and closed-way POIs whose nodes moved"""
+        way_ids = self.state.ways_for_nodes(self.moved_nodes) - self.changed_ways
+        if not way_ids:
+            return 0
+
+        locations = osmium.index.create_map(location_index)
+        refreshed = 0
+        for way_id in sorted(way_ids):
+            street = self.state.get_street(way_id)
+            poi = self.state.get_poi('way', way_id)
+            if street is None and poi is None:
+                continue
+            try:
+                points = [locations.get(ref) for ref in self.state.way_nodes(way_id)]
+            except KeyError:
+                continue  # Location missing from the index
+            if street is not None:
+                street['center_lat'] = sum(p.lat for p in points) / len(points)
+                street['center_lon'] = sum(p.lon for p in points) / len(points)
+                self.queue('street', street)
+                refreshed += 1
+            if poi is not None:
+                try:
+                    centroid = Polygon([(p.lon, p.lat) for p in points]).centroid
+                except ValueError:
+                    centroid = None
+                if centroid is not None and not centroid.is_empty:
+                    poi['lat'], poi['lon'] = centroid.y, centroid.x
+                    self.queue('poi', poi)
+                    refreshed += 1
+
+        self.flush()
+        return refreshed
+
+
+def apply_changes(change_files, state, location_index, locator=None):
+    """Apply the change files in order and return the handler with the dirty cities"""
+    handler = ChangeHandler(state, locator=locator)
+
+    for change_file in change_files:
+        logger.info(f"Applying {change_file}...")
+        reader = osmium.MergeInputReader()
+        reader.add_file(str(change_file))
+
+        # The persistent index provides locations of unchanged nodes and
+        # receives the new locations of changed ones
+        locations = osmium.NodeLocationsForWays(osmium.index.create_map(location_index))
+        locations.ignore_errors()
+        reader.apply(locations, handler)
+        handler.flush()
+        del locations
+
+    refreshed = handler.refresh_moved_ways(location_index)
+    logger.info(f"Recomputed {refreshed:,} streets and POIs with moved nodes")
+    state.commit()
+    return handler
+
+
+def _write_ndjson(path, records):
+    count = 0
+    with open(path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+        for record in records:
+            f.write(dump_record(record))
+            count += 1
+    return count
+
+
+def group_by_category(pois):
+    """POIs grouped by category as in the JSON files of a full extraction (first seen first)"""
+    categories = defaultdict(list)
+    for poi in pois:
+        categories[poi['category']].append(poi)
+    return [poi for category_pois in categories.values() for poi in category_pois]
+
+
+def rewrite_parquet_files(state, handler, output_dir):
+    """Parquet files hold every city, so a changed file is rewritten from the state"""
+    street_counts, poi_counts = state.city_counts()
+    tables = (
+        ('streets', STREET_SCHEMA, state.streets_for_city, street_counts),
+        ('pois', POI_SCHEMA, state.pois_for_city, poi_counts),
+    )
+    for kind, schema, reader, counts in tables:
+        if not handler.dirty[kind]:
+            continue
+        target = output_dir / f"{kind}.parquet"
+        scratch = target.with_suffix('.parquet.tmp')
+        records = (record for city in sorted(counts) for record in reader(city))
+        count = write_parquet(records, scratch, schema, group_by='city')
+        scratch.replace(target)
+        logger.info(f"   Rewrote {count:,} {kind}")
+
+    if handler.boundaries_changed:
+        boundaries = state.boundaries()
+        write_parquet(boundaries, output_dir / "boundaries.parquet", BOUNDARY_SCHEMA)
+        logger.info(f"   Rewrote {len(boundaries):,} boundaries")
+
+
+def rewrite_city_files(state, handler, output_dir, output_format):
+    """Rewrite the street and POI files of every changed city"""
+    if output_format == 'parquet':
+        rewrite_parquet_files(state, handler, output_dir)
+        return
+
+    suffixes = {'streets': 'streets', 'pois': 'poi'}
+    readers = {'streets': state.streets_for_city, 'pois': state.pois_for_city}
+
+    for kind, cities in handler.dirty.items():
+        for city in sorted(cities):
+            if output_format == 'ndjson':
+                path = output_dir / f"{safe_filename(city)}_{suffixes[kind]}.ndjson"
+                count = _write_ndjson(path, readers[kind](city))
+            else:
+                path = output_dir / f"{safe_filename(city)}_{suffixes[kind]}.json"
+                records = list(readers[kind](city))
+                if kind == 'pois':
+                    records = group_by_category(records)
+                count = len(records)
+                if records:
+                    save_city_file(output_dir, city, kind, records)
+
+            if count == 0 and path.exists():
+                path.unlink()
+            logger.info(f"   {city}: {count:,} {kind}")
+
+    if handler.boundaries_changed:
+        boundaries = state.boundaries()
+        if output_format == 'ndjson':
+            _write_ndjson(output_dir / "turkey_administrative.ndjson", boundaries)
+        else:
+            save_boundaries_file(output_dir, boundaries)
+        logger.info(f"   Rewrote {len(boundaries):,} boundaries")
+
+
+def update_summary(state, output_dir, change_files):
+    """Refresh the totals in extraction_summary.json from the state"""
+    summary_file = output_dir / "extraction_summary.json"
+    summary = {}
+    if summary_file.exists():
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+
+    street_counts, poi_counts = state.city_counts()
+    statistics = summary.setdefault('statistics', {})
+    statistics['total_streets'] = sum(street_counts.values())
+    statistics['total_pois'] = sum(poi_counts.values())
+    statistics['cities_processed'] = len(street_counts)
+    summary['cities'] = {
+        city: {'streets': count, 'pois': poi_counts.get(city, 0)}
+        for city, count in sorted(street_counts.items())
+    }
+    summary['last_update'] = {
+        'updated_at': datetime.now().isoformat(),
+        'change_files': [str(change_file) for change_file in change_files]
+    }
+
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Apply OSM change files to a previous PBF extraction")
+    parser.add_argument('change_files', nargs='+', type=Path,
+                        help="OSM change files (.osc / .osc.gz), applied in the given order")
+    parser.add_argument('--state', type=Path, required=True,
+                        help="Extraction state written by extract_from_pbf.py --state")
+    parser.add_argument('--output-dir', type=Path, default=OUTPUT_DIR, help="Output directory")
+    return parser.parse_args()
+
+
+def main():
+    """Main update process"""
+    logger.info("🔄 Starting incremental OSM update")
+    logger.info("=" * 60)
+
+    args = parse_args()
+    if not args.state.exists():
+        logger.error(f"Extraction state not found: {args.state}")
+        return
+
+    state = ExtractionState(args.state)
+    location_index = state.get_meta('location_index')
+    output_format = state.get_meta('output_format', 'json')
+
+    index_file = location_index_file(location_index) if location_index else None
+    if index_file is None or not index_file.exists():
+        logger.error(f"Persistent node location index not found: {location_index}")
+        state.close()
+        return
+
+    locator = None
+    polygons_file = args.output_dir / ADMIN_POLYGONS_FILE
+    if state.get_meta('admin_polygons', False) and polygons_file.exists():
+        locator = AdminLocator.from_geojson(polygons_file)
+
+    try:
+        handler = apply_changes(args.change_files, state, location_index, locator)
+
+        logger.info("")
+        logger.info("Rewriting changed city files...")
+        rewrite_city_files(state, handler, args.output_dir, output_format)
+        update_summary(state, args.output_dir, args.change_files)
+
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("UPDATE DONE!")
+        logger.info(f"   - Street files rewritten: {len(handler.dirty['streets'])}")
+        logger.info(f"   - POI files rewritten: {len(handler.dirty['pois'])}")
+        logger.info("=" * 60)
+
+    except Exception as e:
+        logger.error(f"Error during update: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,9 @@ setup(
         "shapely>=2.0.1",
         "ujson>=5.8.0",
         "tqdm>=4.65.0",
-        "osmium",
+        "osmium>=4.0",
+        "pyarrow>=12.0.0",
+        "numpy>=1.21.0",
     ],
     entry_points={
         "console_scripts": [
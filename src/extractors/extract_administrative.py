@@ -1,53 +1,79 @@
 # Administrative boundaries extraction
+import asyncio
 import json
-import time
-from typing import Dict, List
+from typing import Dict, Iterator, List
 import overpy
-from config import CONFIG, ADMIN_LEVELS, OUTPUT_DIR
-from src.utils.utils import setup_logging, save_json, execute_query_with_retry
+from config import CONFIG, ADMIN_LEVELS, REGIONS, OUTPUT_DIR
+from src.utils.overpass_client import OverpassClient
+from src.utils.overpass_geometry import element_point, geometry_mode, out_statement
+from src.utils.region_resolver import RegionResolver
+from src.utils.utils import setup_logging, save_json
 
 class AdministrativeExtractor:
     def __init__(self):
-        self.api = overpy.Overpass()
+        self.client = OverpassClient()
+        self.regions = RegionResolver()
+        # Only the relations are kept, so their member ways and nodes need not be fetched
+        self.geometry = geometry_mode('admin')
         self.logger = setup_logging(f"{OUTPUT_DIR}/admin_extraction.log")
     
+    @staticmethod
+    def _collect_relations(elements: Iterator[Dict]) -> List[Dict]:
+        """The relations of a streamed response; member ways and nodes are skipped"""
+        relations = {}
+        for element in elements:
+            if element['type'] == 'relation':
+                relations.setdefault(element['id'], element)
+        return list(relations.values())
+    
+    @staticmethod
+    def _geometry_fields(relation: Dict) -> Dict:
+        """Center and bounds of a relation, if its geometry mode returned them"""
+        fields = {}
+        point = element_point(relation)
+        if point is not None:
+            fields['center'] = {'lat': point[0], 'lon': point[1]}
+        if 'bounds' in relation:
+            fields['bounds'] = relation['bounds']
+        return fields
+    
     def extract_turkey_admin_hierarchy(self) -> Dict:
         """Extract complete administrative hierarchy for Turkey"""
         self.logger.info("Starting Turkey administrative hierarchy extraction")
         
-        query = """
+        query = f"""
         [out:json][timeout:600];
         area["name:en"="Turkey"]["admin_level"="2"]->.country;
         
         (
           relation["boundary"="administrative"](area.country);
         );
-        out body;
-        >;
-        out skel qt;
+        {out_statement(self.geometry, '        ')}
         """
         
         try:
-            result = execute_query_with_retry(self.api, query)
+            relations = asyncio.run(self.client.stream(query, self._collect_relations, kind='admin'))
             admin_data = {}
             
-            for relation in result.relations:
-                admin_level = relation.tags.get('admin_level', '')
-                name = relation.tags.get('name', '')
+            for relation in relations:
+                tags = relation.get('tags', {})
+                admin_level = tags.get('admin_level', '')
+                name = tags.get('name', '')
                 
                 if name and admin_level in ADMIN_LEVELS:
-                    admin_data[relation.id] = {
-                        'id': relation.id,
+                    admin_data[relation['id']] = {
+                        'id': relation['id'],
                         'name': name,
                         'admin_level': admin_level,
                         'admin_type': ADMIN_LEVELS[admin_level],
-                        'postal_code': relation.tags.get('postal_code', ''),
-                        'population': relation.tags.get('population', ''),
-                        'wikidata': relation.tags.get('wikidata', ''),
-                        'wikipedia': relation.tags.get('wikipedia', ''),
-                        'area': relation.tags.get('area', ''),
-                        'members_count': len(relation.members),
-                        'tags': dict(relation.tags)
+                        'postal_code': tags.get('postal_code', ''),
+                        'population': tags.get('population', ''),
+                        'wikidata': tags.get('wikidata', ''),
+                        'wikipedia': tags.get('wikipedia', ''),
+                        'area': tags.get('area', ''),
+                        'members_count': len(relation.get('members', [])),
+                        'tags': tags,
+                        **self._geometry_fields(relation)
                     }
             
             # Save administrative data
@@ -60,38 +86,41 @@ class AdministrativeExtractor:
             self.logger.error(f"❌ Failed to extract administrative data: {e}")
             return {}
     
-    def extract_region_admin_boundaries(self, region_name: str) -> Dict:
+    async def extract_region_admin_boundaries(self, region_name: str) -> List[Dict]:
         """Extract administrative boundaries for a specific region"""
         self.logger.info(f"Extracting admin boundaries for {region_name}")
+        area_id = await self.regions.resolve(self.client, region_name)
         
         query = f"""
         [out:json][timeout:300];
-        area["name"="{region_name}"]["admin_level"="4"]->.searchArea;
+        area({area_id})->.searchArea;
         
         (
           relation["boundary"="administrative"](area.searchArea);
         );
-        out body;
-        >;
-        out skel qt;
+        {out_statement(self.geometry, '        ')}
         """
         
         try:
-            result = execute_query_with_retry(self.api, query)
+            relations = await self.client.stream(query, self._collect_relations, kind='admin')
             region_admin_data = []
             
-            for relation in result.relations:
+            for relation in relations:
+                tags = relation.get('tags', {})
                 admin_data = {
-                    'id': relation.id,
-                    'name': relation.tags.get('name', ''),
-                    'admin_level': relation.tags.get('admin_level', ''),
-                    'admin_type': ADMIN_LEVELS.get(relation.tags.get('admin_level', ''), 'unknown'),
-                    'postal_code': relation.tags.get('postal_code', ''),
-                    'boundary_type': relation.tags.get('boundary', ''),
+                    'id': relation['id'],
+                    'name': tags.get('name', ''),
+                    'admin_level': tags.get('admin_level', ''),
+                    'admin_type': ADMIN_LEVELS.get(tags.get('admin_level', ''), 'unknown'),
+                    'postal_code': tags.get('postal_code', ''),
+                    'boundary_type': tags.get('boundary', ''),
                     'members': [
-                        {'type': m.type, 'ref': m.ref, 'role': m.role}
-                        for m in relation.members
-                    ]
+                        # Member coordinates come inline in 'geom' mode
+                        {'type': m['type'], 'ref': m['ref'], 'role': m.get('role'),
+                         **{key: m[key] for key in ('lat', 'lon', 'geometry') if key in m}}
+                        for m in relation.get('members', [])
+                    ],
+                    **self._geometry_fields(relation)
                 }
                 region_admin_data.append(admin_data)
             
@@ -105,6 +134,18 @@ class AdministrativeExtractor:
         except Exception as e:
             self.logger.error(f"❌ Failed to extract admin boundaries for {region_name}: {e}")
             return []
+    
+    def extract_all_regions_admin_boundaries(self, regions: List[str] = REGIONS) -> Dict:
+        """Extract administrative boundaries for all regions concurrently"""
+        self.logger.info("Starting admin boundary extraction for all regions")
+        
+        async def extract_all():
+            await self.regions.resolve_all(self.client, regions)
+            return await asyncio.gather(
+                *(self.extract_region_admin_boundaries(region) for region in regions)
+            )
+        
+        return dict(zip(regions, asyncio.run(extract_all())))
 
 if __name__ == "__main__":
     extractor = AdministrativeExtractor()
@@ -1,90 +1,201 @@
 # Points of Interest extraction
+import asyncio
 import json
-import time
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 import overpy
 from config import CONFIG, POI_CATEGORIES, REGIONS, OUTPUT_DIR
-from src.utils.utils import setup_logging, save_json, execute_query_with_retry, get_element_coordinates
+from src.utils.columnar import OVERPASS_POI_SCHEMA
+from src.utils.tag_rules import TagRule, TagRules
+from src.utils.overpass_client import OverpassClient
+from src.utils.overpass_geometry import element_point, geometry_mode, out_statement
+from src.utils.overpass_stream import NodeCoordinates
+from src.utils.region_resolver import RegionResolver
+from src.utils.utils import setup_logging, save_json, save_records
+
+# Queries per region: one union of every filter ('region'), one per category or one
+# per filter. Elements are split into categories and subcategories locally by tag
+# matching, so the output is the same for all three
+POI_BATCHING = ('region', 'category', 'filter')
 
 class POIExtractor:
     def __init__(self):
-        self.api = overpy.Overpass()
+        self.client = OverpassClient()
+        self.regions = RegionResolver()
+        self.rules = TagRules(POI_CATEGORIES)
+        # Overpass queries per region: 'region' (one union query), 'category' or 'filter'
+        self.batching = CONFIG.get('poi_batching', 'region')
+        if self.batching not in POI_BATCHING:
+            raise ValueError(f"Unknown poi_batching {self.batching!r}, expected one of {POI_BATCHING}")
+        # Coordinates of way and relation POIs: 'full' fetches their nodes, the others less
+        self.geometry = geometry_mode('poi')
         self.logger = setup_logging(f"{OUTPUT_DIR}/poi_extraction.log")
     
-    def extract_poi_for_region(self, region_name: str, category: str, filters: List[str]) -> List[Dict]:
-        """Extract POIs for a specific region and category"""
-        pois = []
-        
-        for filter_str in filters:
-            query = f"""
+    def _query(self, area_id: int, rules: List[TagRule]) -> str:
+        """One union query for the given filters"""
+        selectors = "\n".join(
+            f"""              node{rule.overpass()}(area.searchArea);
+              way{rule.overpass()}(area.searchArea);
+              relation{rule.overpass()}(area.searchArea);"""
+            for rule in rules
+        )
+        return f"""
             [out:json][timeout:200];
-            area["name"="{region_name}"]["admin_level"="4"]->.searchArea;
+            area({area_id})->.searchArea;
             
             (
-              node[{filter_str}](area.searchArea);
-              way[{filter_str}](area.searchArea);
-              relation[{filter_str}](area.searchArea);
+{selectors}
             );
-            out body;
-            >;
-            out skel qt;
+            {out_statement(self.geometry, '            ')}
             """
-            
-            try:
-                result = execute_query_with_retry(self.api, query)
-                
-                for element in result.nodes + result.ways + result.relations:
-                    poi_data = {
-                        'id': element.id,
-                        'type': element.__class__.__name__.lower(),
-                        'name': element.tags.get('name', ''),
-                        'category': category,
-                        'subcategory': filter_str,
-                        'coordinates': get_element_coordinates(element),
-                        'postal_code': element.tags.get('postal_code', ''),
-                        'address': element.tags.get('addr:street', ''),
-                        'city': element.tags.get('addr:city', ''),
-                        'operator': element.tags.get('operator', ''),
-                        'website': element.tags.get('website', ''),
-                        'phone': element.tags.get('phone', ''),
-                        'full_tags': dict(element.tags)
-                    }
-                    pois.append(poi_data)
-                
-                self.logger.info(f"  - {region_name}/{category}/{filter_str}: {len(result.nodes + result.ways + result.relations)} POIs")
-                time.sleep(5)  # Rate limiting
-                
-            except Exception as e:
-                self.logger.error(f"Error in {region_name}/{category}/{filter_str}: {e}")
+    
+    async def _fetch(self, region_name: str, rules: List[TagRule], label: str) -> Optional[Dict[TagRule, List]]:
+        """
+        Query the filters of rules and split the elements by matching filter.
+        
+        Returns None if the query failed.
+        """
+        area_id = await self.regions.resolve(self.client, region_name)
+        try:
+            return await self.client.stream(self._query(area_id, rules), self._match_elements,
+                                            kind='poi')
+        except Exception as e:
+            self.logger.error(f"Error in {label}: {e}")
+            return None
+    
+    def _match_elements(self, elements: Iterator[Dict]) -> Dict[TagRule, List[Dict]]:
+        """
+        Group streamed Overpass elements by matching filter.
+        
+        Untagged way/relation members match no filter and are dropped; an
+        element matching several filters goes to the earliest listed one,
+        as TagRules.match decides. Elements keep the response order within
+        nodes, ways and relations. Ways and relations get the point of
+        their geometry mode (see element_point); in 'full' mode ways get
+        the mean of their node coordinates, which arrive after them.
+        """
+        found = {'node': [], 'way': [], 'relation': []}
+        seen = set()
+        coordinates = NodeCoordinates()
+        
+        for element in elements:
+            e_type = element['type']
+            if e_type == 'node':
+                coordinates.add(element['id'], element['lat'], element['lon'])
+            tags = element.get('tags')
+            if not tags or e_type not in found or (e_type, element['id']) in seen:
                 continue
+            rule = self.rules.match(tags)
+            if rule is None:
+                continue
+            seen.add((e_type, element['id']))
+            lat, lon = element_point(element) or (None, None)
+            found[e_type].append((rule, {
+                'id': element['id'],
+                'type': e_type,
+                'tags': tags,
+                'coordinates': {'lat': lat, 'lon': lon},
+                'nodes': element.get('nodes') if self.geometry == 'full' else None
+            }))
         
+        matched = {}
+        for e_type in ('node', 'way', 'relation'):
+            for rule, element in found[e_type]:
+                nodes = element.pop('nodes')
+                if nodes:
+                    lats, lons = coordinates.lookup(nodes)
+                    if len(lats):
+                        element['coordinates'] = {
+                            'lat': sum(lats.tolist()) / len(lats),
+                            'lon': sum(lons.tolist()) / len(lons)
+                        }
+                matched.setdefault(rule, []).append(element)
+        return matched
+    
+    def _poi_records(self, region_name: str, category: str, rules: List[TagRule],
+                     matched: Dict[TagRule, List[Dict]]) -> List[Dict]:
+        """POI records of one category, in filter order"""
+        pois = []
+        for rule in rules:
+            elements = matched.get(rule, [])
+            for element in elements:
+                tags = element['tags']
+                poi_data = {
+                    'id': element['id'],
+                    'type': element['type'],
+                    'name': tags.get('name', ''),
+                    'category': category,
+                    'subcategory': rule.filter,
+                    'coordinates': element['coordinates'],
+                    'postal_code': tags.get('postal_code', ''),
+                    'address': tags.get('addr:street', ''),
+                    'city': tags.get('addr:city', ''),
+                    'operator': tags.get('operator', ''),
+                    'website': tags.get('website', ''),
+                    'phone': tags.get('phone', ''),
+                    'full_tags': tags
+                }
+                pois.append(poi_data)
+            
+            self.logger.info(f"  - {region_name}/{category}/{rule.filter}: {len(elements)} POIs")
         return pois
     
-    def extract_all_poi_for_region(self, region_name: str) -> Dict:
+    async def extract_poi_for_region(self, region_name: str, category: str, rules: List[TagRule]) -> List[Dict]:
+        """Extract POIs for a specific region and category"""
+        # One union query for the category, or one query per filter (all in flight at once)
+        if self.batching == 'filter':
+            batches = [[rule] for rule in rules]
+        else:
+            batches = [rules]
+        results = await asyncio.gather(*(
+            self._fetch(region_name, batch, f"{region_name}/{category}/{batch[0].filter}"
+                        if len(batch) == 1 else f"{region_name}/{category}")
+            for batch in batches
+        ))
+        
+        # Keep each filter's elements from its own query only
+        matched = {}
+        for batch, result in zip(batches, results):
+            if result is not None:
+                matched.update((rule, result.get(rule, [])) for rule in batch)
+        return self._poi_records(region_name, category, rules, matched)
+    
+    async def extract_all_poi_for_region(self, region_name: str) -> Dict:
         """Extract all POI categories for a region"""
         self.logger.info(f"Extracting POIs for {region_name}")
         
         region_pois = {}
+        categories = self.rules.categories()
+        if self.batching == 'region':
+            # A single query for every filter, split into categories locally
+            matched = await self._fetch(region_name, self.rules.rules, region_name)
+            results = [
+                self._poi_records(region_name, category, self.rules.for_category(category), matched)
+                if matched is not None else []
+                for category in categories
+            ]
+        else:
+            results = await asyncio.gather(
+                *(self.extract_poi_for_region(region_name, category, self.rules.for_category(category))
+                  for category in categories),
+                return_exceptions=True
+            )
         
-        for category, config in POI_CATEGORIES.items():
-            try:
-                pois = self.extract_poi_for_region(
-                    region_name, 
-                    category, 
-                    config['filters']
-                )
+        for category, pois in zip(categories, results):
+            if isinstance(pois, Exception):
+                self.logger.error(f"❌ Failed to extract {category} for {region_name}: {pois}")
+                region_pois[category] = []
+            else:
                 region_pois[category] = pois
-                
                 self.logger.info(f"✅ {region_name}/{category}: {len(pois)} POIs")
-                time.sleep(10)  # Be nice to API
-                
-            except Exception as e:
-                self.logger.error(f"❌ Failed to extract {category} for {region_name}: {e}")
-                region_pois[category] = []
         
         # Save region POI data
         filename = f"{OUTPUT_DIR}/{region_name}_poi.json"
-        save_json(region_pois, filename)
+        if CONFIG['output_format'] == 'parquet':
+            # One flat table; the category is a (dictionary encoded) column
+            all_pois = [poi for pois in region_pois.values() for poi in pois]
+            save_records(all_pois, filename, 'parquet', OVERPASS_POI_SCHEMA)
+        else:
+            save_json(region_pois, filename)
         
         total_pois = sum(len(pois) for pois in region_pois.values())
         self.logger.info(f"✅ {region_name}: {total_pois} total POIs saved")
@@ -97,26 +208,30 @@ class POIExtractor:
         
         summary = {}
         
-        for region in REGIONS:  # Process all regions
-            try:
-                region_pois = self.extract_all_poi_for_region(region)
-                total_pois = sum(len(pois) for pois in region_pois.values())
-                
-                summary[region] = {
-                    'total_pois': total_pois,
-                    'categories': {cat: len(pois) for cat, pois in region_pois.items()},
-                    'status': 'success'
-                }
-                
-                time.sleep(30)  # Longer delay between regions
-                
-            except Exception as e:
-                self.logger.error(f"❌ Failed to process {region}: {e}")
+        # Regions are queried concurrently, as fast as the client's rate limit allows
+        async def extract_all():
+            await self.regions.resolve_all(self.client, REGIONS)
+            return await asyncio.gather(
+                *(self.extract_all_poi_for_region(region) for region in REGIONS),
+                return_exceptions=True
+            )
+        
+        for region, region_pois in zip(REGIONS, asyncio.run(extract_all())):
+            if isinstance(region_pois, Exception):
+                self.logger.error(f"❌ Failed to process {region}: {region_pois}")
                 summary[region] = {
                     'total_pois': 0,
                     'status': 'failed',
-                    'error': str(e)
+                    'error': str(region_pois)
                 }
+                continue
+            
+            total_pois = sum(len(pois) for pois in region_pois.values())
+            summary[region] = {
+                'total_pois': total_pois,
+                'categories': {cat: len(pois) for cat, pois in region_pois.items()},
+                'status': 'success'
+            }
         
         # Save POI extraction summary
         save_json(summary, f"{OUTPUT_DIR}/poi_extraction_summary.json")
@@ -1,63 +1,60 @@
 # Street network extraction
+import asyncio
 import json
-import time
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
 import overpy
 from config import CONFIG, REGIONS, OUTPUT_DIR
-from src.utils.utils import setup_logging, save_json, execute_query_with_retry
+from src.utils.columnar import OVERPASS_STREET_SCHEMA
+from src.utils.geometry_store import E7, GeometryWriter
+from src.utils.overpass_client import OverpassClient
+from src.utils.overpass_geometry import geometry_mode, out_statement
+from src.utils.overpass_stream import NodeCoordinates, WayRefs
+from src.utils.overpass_tiles import Tile, TilePlanner
+from src.utils.region_resolver import RegionResolver
+from src.utils.utils import setup_logging, save_json, save_records
 
 class StreetExtractor:
     def __init__(self):
-        self.api = overpy.Overpass()
+        self.client = OverpassClient()
+        self.regions = RegionResolver()
+        self.planner = TilePlanner()
+        # Linestrings need the node coordinates: inline ('geom') or as member nodes ('full')
+        self.geometry = geometry_mode('streets', ('geom', 'full'))
         self.logger = setup_logging(f"{OUTPUT_DIR}/street_extraction.log")
     
-    def extract_region_streets(self, region_name: str) -> List[Dict]:
-        """Extract complete street network for a region"""
-        self.logger.info(f"Extracting streets for {region_name}")
-        
-        query = f"""
+    def _query(self, area_id: int, tile: Tile) -> str:
+        # The root tile covers the whole region, so it needs no bbox filter
+        bbox = tile.bbox() if tile.depth else ''
+        return f"""
         [out:json][timeout:300];
-        area["name"="{region_name}"]["admin_level"="4"]->.searchArea;
+        area({area_id})->.searchArea;
         
         (
-          way["highway"]["name"](area.searchArea);
+          way["highway"]["name"](area.searchArea){bbox};
         );
-        out body;
-        >;
-        out skel qt;
+        {out_statement(self.geometry, '        ')}
         """
+    
+    async def extract_region_streets(self, region_name: str) -> List[Dict]:
+        """Extract complete street network for a region"""
+        self.logger.info(f"Extracting streets for {region_name}")
+        area_id = await self.regions.resolve(self.client, region_name)
+        bounds = await self.regions.bounds(self.client, region_name)
         
         try:
-            result = execute_query_with_retry(self.api, query)
-            streets = []
-            
-            for way in result.ways:
-                street_data = {
-                    'id': way.id,
-                    'name': way.tags.get('name', ''),
-                    'highway_type': way.tags.get('highway', ''),
-                    'postal_code': way.tags.get('postal_code', ''),
-                    'length': way.tags.get('length', ''),
-                    'lanes': way.tags.get('lanes', ''),
-                    'maxspeed': way.tags.get('maxspeed', ''),
-                    'surface': way.tags.get('surface', ''),
-                    'lit': way.tags.get('lit', ''),
-                    'oneway': way.tags.get('oneway', ''),
-                    'bridge': way.tags.get('bridge', ''),
-                    'tunnel': way.tags.get('tunnel', ''),
-                    'geometry': [
-                        {'lat': float(node.lat), 'lon': float(node.lon)} 
-                        for node in way.nodes
-                        if hasattr(node, 'lat') and hasattr(node, 'lon')
-                    ],
-                    'nodes_count': len(way.nodes),
-                    'full_tags': dict(way.tags)
-                }
-                streets.append(street_data)
+            # Regions too large for one query are split into tiles
+            tiles = await self.planner.run(
+                self.client, bounds, lambda tile: self._query(area_id, tile),
+                self._collect_streets, kind='streets'
+            )
+            if len(tiles) > 1:
+                self.logger.info(f"{region_name}: streets fetched in {len(tiles)} tiles")
+            streets = self._merge_tiles(region_name, tiles)
             
             # Save streets data
             filename = f"{OUTPUT_DIR}/{region_name}_streets.json"
-            save_json(streets, filename)
+            save_records(streets, filename, CONFIG['output_format'], OVERPASS_STREET_SCHEMA)
             
             self.logger.info(f"✅ {region_name}: {len(streets)} streets saved")
             return streets
@@ -66,29 +63,112 @@ class StreetExtractor:
             self.logger.error(f"❌ Failed to extract streets for {region_name}: {e}")
             return []
     
+    def _collect_streets(self, elements: Iterator[Dict]) -> Tuple[List[Dict], WayRefs, NodeCoordinates]:
+        """
+        Street records, node references and node coordinates from streamed Overpass elements.
+        
+        The ways arrive before their nodes, so node references are kept in
+        flat arrays until all coordinates are in; in 'geom' mode each way
+        brings the coordinates of its nodes along.
+        """
+        streets = []
+        seen = set()
+        refs = WayRefs()
+        coordinates = NodeCoordinates()
+        
+        for element in elements:
+            if element['type'] == 'node':
+                coordinates.add(element['id'], element['lat'], element['lon'])
+                continue
+            if element['type'] != 'way' or element['id'] in seen:
+                continue
+            seen.add(element['id'])
+            tags = element.get('tags', {})
+            street_data = {
+                'id': element['id'],
+                'name': tags.get('name', ''),
+                'highway_type': tags.get('highway', ''),
+                'postal_code': tags.get('postal_code', ''),
+                'length': tags.get('length', ''),
+                'lanes': tags.get('lanes', ''),
+                'maxspeed': tags.get('maxspeed', ''),
+                'surface': tags.get('surface', ''),
+                'lit': tags.get('lit', ''),
+                'oneway': tags.get('oneway', ''),
+                'bridge': tags.get('bridge', ''),
+                'tunnel': tags.get('tunnel', ''),
+                'nodes_count': len(element['nodes']),
+                'full_tags': tags
+            }
+            streets.append(street_data)
+            refs.add(element['id'], element['nodes'])
+            for node_id, point in zip(element['nodes'], element.get('geometry') or ()):
+                if point:
+                    coordinates.add(node_id, point['lat'], point['lon'])
+        
+        return streets, refs, coordinates
+    
+    def _merge_tiles(self, region_name: str, tiles: List[Tuple[List[Dict], WayRefs, NodeCoordinates]]) -> List[Dict]:
+        """
+        Street records of all tiles, each way once, with their linestrings written.
+        
+        Ways crossing a tile edge come with all their nodes in every tile
+        they touch; the first tile's copy is kept.
+        """
+        if len(tiles) == 1:
+            streets, refs, coordinates = tiles[0]
+        else:
+            streets = []
+            seen = set()
+            refs = WayRefs()
+            coordinates = NodeCoordinates()
+            for tile_streets, tile_refs, tile_coordinates in tiles:
+                coordinates.update(tile_coordinates)
+                for street, (way_id, node_ids) in zip(tile_streets, tile_refs):
+                    if way_id in seen:
+                        continue
+                    seen.add(way_id)
+                    streets.append(street)
+                    refs.add(way_id, node_ids.tolist())
+        
+        # Full linestrings go to a binary geometry store keyed by way id
+        geometry = GeometryWriter(f"{OUTPUT_DIR}/{region_name}_streets.geom")
+        for way_id, node_ids in refs:
+            lats, lons = coordinates.lookup(node_ids)
+            geometry.add_e7(way_id, np.rint(lats * E7).astype(np.int64).tolist(),
+                            np.rint(lons * E7).astype(np.int64).tolist())
+        geometry.close()
+        
+        return streets
+    
     def extract_all_regions_streets(self) -> Dict:
         """Extract streets for all regions"""
         self.logger.info("Starting street extraction for all regions")
         
         summary = {}
         
-        for region in REGIONS:
-            try:
-                streets = self.extract_region_streets(region)
-                summary[region] = {
-                    'streets_count': len(streets),
-                    'status': 'success'
-                }
-                
-                # Be nice to the API
-                time.sleep(CONFIG['retry_delay'])
-                
-            except Exception as e:
-                self.logger.error(f"❌ Failed to process {region}: {e}")
+        # Regions are queried concurrently, as fast as the client's rate limit allows
+        async def extract_all():
+            await self.regions.resolve_all(self.client, REGIONS)
+            return await asyncio.gather(
+                *(self.extract_region_streets(region) for region in REGIONS),
+                return_exceptions=True
+            )
+        
+        results = asyncio.run(extract_all())
+        
+        for region, streets in zip(REGIONS, results):
+            if isinstance(streets, Exception):
+                self.logger.error(f"❌ Failed to process {region}: {streets}")
                 summary[region] = {
                     'streets_count': 0,
                     'status': 'failed',
-                    'error': str(e)
+                    'error': str(streets)
+                }
+            else:
+                summary[region] = {
+                    'streets_count': len(streets),
+                    'status': 'success'
                 }
         
         # Save extraction summary
@@ -1,8 +1,8 @@
 # Main extraction script
-import time
 import json
 from datetime import datetime
-from config import OUTPUT_DIR
+from config import CONFIG, OUTPUT_DIR
+from src.utils.metrics import METRICS, MetricsExporter
 from src.utils.utils import setup_logging, save_json
 from src.extractors.extract_administrative import AdministrativeExtractor
 from src.extractors.extract_streets import StreetExtractor
@@ -20,6 +20,11 @@ class TurkeyOSMExtractor:
         start_time = datetime.now()
         self.logger.info("🚀 Starting complete Turkey OSM data extraction")
         
+        exporter = None
+        if CONFIG.get('metrics_file'):
+            exporter = MetricsExporter(METRICS, CONFIG['metrics_file'],
+                                       CONFIG.get('metrics_interval', 30)).start()
+        
         extraction_summary = {
             'start_time': start_time.isoformat(),
             'project': 'Turkey OSM Data Extraction',
@@ -33,8 +38,6 @@ class TurkeyOSMExtractor:
             admin_data = self.admin_extractor.extract_turkey_admin_hierarchy()
             extraction_summary['administrative_units'] = len(admin_data)
             
-            time.sleep(60)
-            
             # 2. Extract street networks
             self.logger.info("🛣️ Step 2: Extracting street networks")
             streets_summary = self.street_extractor.extract_all_regions_streets()
@@ -43,8 +46,6 @@ class TurkeyOSMExtractor:
                 region['streets_count'] for region in streets_summary.values()
             )
             
-            time.sleep(60)
-            
             # 3. Extract Points of Interest
             self.logger.info("🏢 Step 3: Extracting Points of Interest")
             poi_summary = self.poi_extractor.extract_all_regions_poi()
@@ -79,6 +80,10 @@ class TurkeyOSMExtractor:
             extraction_summary['error'] = str(e)
             extraction_summary['end_time'] = datetime.now().isoformat()
             save_json(extraction_summary, f"{OUTPUT_DIR}/extraction_failed.json")
+        
+        finally:
+            if exporter is not None:
+                exporter.stop()
             
         return extraction_summary
 
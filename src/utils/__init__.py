@@ -1,5 +1,5 @@
 """Utility functions for logging, data processing, and file operations."""
 
-from .utils import setup_logging, save_json
+from .utils import setup_logging, save_json, save_records
 
-__all__ = ['setup_logging', 'save_json']
+__all__ = ['setup_logging', 'save_json', 'save_records']
@@ -0,0 +1,158 @@
+# Point-in-polygon lookup for administrative boundaries
+import json
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import box, mapping, shape
+from shapely.ops import polygonize
+from shapely.strtree import STRtree
+
+# Admin levels used for the address hierarchy
+ADMIN_LEVEL_FIELDS = {
+    '4': 'province',
+    '6': 'district',
+    '8': 'neighborhood'
+}
+
+# Marker for grid cells that are not covered by a single polygon
+_MIXED = object()
+
+
+class _LevelIndex:
+    """STRtree over the prepared polygons of one admin level"""
+
+    def __init__(self, names: List[str], geometries: List):
+        self.names = names
+        self.geometries = np.array(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+
+    def cell_owner(self, cell) -> object:
+        """Return the name covering the whole cell, '' if none touches it, or _MIXED"""
+        candidates = self.tree.query(cell)
+        if len(candidates) == 0:
+            return ''
+        for idx in candidates:
+            if self.geometries[idx].contains(cell):
+                return self.names[idx]
+        return _MIXED
+
+    def locate(self, xs: np.ndarray, ys: np.ndarray) -> List[str]:
+        """Find the polygon containing each point, checking bboxes first"""
+        result = [''] * len(xs)
+        if len(xs) == 0:
+            return result
+
+        point_idx, geom_idx = self.tree.query(shapely.points(xs, ys))
+        inside = shapely.contains_xy(self.geometries[geom_idx], xs[point_idx], ys[point_idx])
+        for point, geom in zip(point_idx[inside], geom_idx[inside]):
+            if not result[point]:
+                result[point] = self.names[geom]
+        return result
+
+
+class AdminLocator:
+    """
+    Assign province/district/neighborhood names to coordinates.
+
+    Lookups go through a grid cell cache first: a cell that lies entirely
+    inside one polygon (or outside all of them) is answered without any
+    geometry test. Points in cells crossed by a boundary are resolved in
+    batches with a vectorized STRtree query and contains_xy test.
+    """
+
+    def __init__(self, boundaries: Sequence[Tuple[str, str, object]], cell_size: float = 0.01):
+        """boundaries is a sequence of (admin_level, name, geometry) tuples"""
+        self.cell_size = cell_size
+        self.levels: Dict[str, _LevelIndex] = {}
+        self._cells: Dict[Tuple[int, int], Tuple] = {}
+
+        for level in ADMIN_LEVEL_FIELDS:
+            entries = [(name, geom) for lvl, name, geom in boundaries if lvl == level and geom is not None]
+            if entries:
+                names, geometries = zip(*entries)
+                self.levels[level] = _LevelIndex(list(names), list(geometries))
+
+    def __len__(self) -> int:
+        return sum(len(index.names) for index in self.levels.values())
+
+    def _cell(self, key: Tuple[int, int]) -> Tuple:
+        owners = self._cells.get(key)
+        if owners is None:
+            x, y = key[1] * self.cell_size, key[0] * self.cell_size
+            cell = box(x, y, x + self.cell_size, y + self.cell_size)
+            owners = tuple(
+                self.levels[level].cell_owner(cell) if level in self.levels else ''
+                for level in ADMIN_LEVEL_FIELDS
+            )
+            self._cells[key] = owners
+        return owners
+
+    def locate_many(self, lats: Sequence[float], lons: Sequence[float]) -> List[Dict[str, str]]:
+        """Return {'province', 'district', 'neighborhood'} for each coordinate"""
+        results = []
+        pending = {level: [] for level in ADMIN_LEVEL_FIELDS}
+
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            key = (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+            owners = self._cell(key)
+            result = {}
+            for (level, field), owner in zip(ADMIN_LEVEL_FIELDS.items(), owners):
+                if owner is _MIXED:
+                    pending[level].append(i)
+                    owner = ''
+                result[field] = owner
+            results.append(result)
+
+        for level, indices in pending.items():
+            if not indices:
+                continue
+            xs = np.array([lons[i] for i in indices], dtype=float)
+            ys = np.array([lats[i] for i in indices], dtype=float)
+            field = ADMIN_LEVEL_FIELDS[level]
+            for i, name in zip(indices, self.levels[level].locate(xs, ys)):
+                results[i][field] = name
+
+        return results
+
+    def locate(self, lat: float, lon: float) -> Dict[str, str]:
+        """Return {'province', 'district', 'neighborhood'} for one coordinate"""
+        return self.locate_many([lat], [lon])[0]
+
+    def to_geojson(self, filename: str) -> None:
+        """Save the boundary polygons as a GeoJSON FeatureCollection"""
+        features = []
+        for level, index in self.levels.items():
+            for name, geometry in zip(index.names, index.geometries):
+                features.append({
+                    'type': 'Feature',
+                    'properties': {'name': name, 'admin_level': level},
+                    'geometry': mapping(geometry)
+                })
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+
+    @classmethod
+    def from_geojson(cls, filename: str, cell_size: float = 0.01) -> 'AdminLocator':
+        """Load boundary polygons written by to_geojson()"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        boundaries = [
+            (feature['properties']['admin_level'], feature['properties']['name'], shape(feature['geometry']))
+            for feature in data['features']
+        ]
+        return cls(boundaries, cell_size=cell_size)
+
+
+def polygons_from_rings(outer_lines: List, inner_lines: List) -> Optional[object]:
+    """Assemble a (multi)polygon from the outer and inner member ways of a boundary"""
+    outer = shapely.unary_union(list(polygonize(outer_lines)))
+    if outer.is_empty:
+        return None
+    if inner_lines:
+        inner = shapely.unary_union(list(polygonize(inner_lines)))
+        if not inner.is_empty:
+            outer = outer.difference(inner)
+    return outer
@@ -0,0 +1,193 @@
+# Columnar Parquet output for extracted records
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def _category() -> pa.DataType:
+    """Dictionary encoded string, for columns with few distinct values"""
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+_LAT_LON = pa.struct([('lat', pa.float64()), ('lon', pa.float64())])
+_TAGS = pa.map_(pa.string(), pa.string())
+
+# Records produced by scripts/extract_from_pbf.py
+STREET_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('highway_type', _category()),
+    ('city', _category()),
+    ('surface', _category()),
+    ('lanes', _category()),
+    ('maxspeed', _category()),
+    ('oneway', _category()),
+    ('lit', _category()),
+    ('bridge', _category()),
+    ('tunnel', _category()),
+    ('center_lat', pa.float64()),
+    ('center_lon', pa.float64()),
+    ('nodes_count', pa.int32()),
+    ('province', _category()),
+    ('district', _category()),
+    ('neighborhood', _category()),
+])
+
+POI_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('type', _category()),
+    ('name', pa.string()),
+    ('amenity', _category()),
+    ('category', _category()),
+    ('subcategory', _category()),
+    ('lat', pa.float64()),
+    ('lon', pa.float64()),
+    ('address', pa.string()),
+    ('city', _category()),
+    ('postcode', _category()),
+    ('phone', pa.string()),
+    ('website', pa.string()),
+    ('operator', _category()),
+    ('province', _category()),
+    ('district', _category()),
+    ('neighborhood', _category()),
+])
+
+BOUNDARY_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('admin_level', _category()),
+    ('type', _category()),
+    ('population', pa.string()),
+    ('postal_code', pa.string()),
+])
+
+# Records produced by the Overpass extractors in src/extractors
+OVERPASS_STREET_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('highway_type', _category()),
+    ('postal_code', _category()),
+    ('length', pa.string()),
+    ('lanes', _category()),
+    ('maxspeed', _category()),
+    ('surface', _category()),
+    ('lit', _category()),
+    ('oneway', _category()),
+    ('bridge', _category()),
+    ('tunnel', _category()),
+    ('nodes_count', pa.int32()),
+    ('full_tags', _TAGS),
+])
+
+OVERPASS_POI_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('type', _category()),
+    ('name', pa.string()),
+    ('category', _category()),
+    ('subcategory', _category()),
+    ('coordinates', _LAT_LON),
+    ('postal_code', _category()),
+    ('address', pa.string()),
+    ('city', _category()),
+    ('operator', _category()),
+    ('website', pa.string()),
+    ('phone', pa.string()),
+    ('full_tags', _TAGS),
+])
+
+# Column used to order records from parallel workers (see extract_from_pbf.py)
+SEQ_FIELD = pa.field('_seq', pa.int64())
+
+
+def with_seq(schema: pa.Schema) -> pa.Schema:
+    """Return the schema with the worker sequence column appended"""
+    return schema.append(SEQ_FIELD)
+
+
+class ParquetRecordWriter:
+    """
+    Write dict records to one Parquet file in batches.
+
+    Records are buffered per group (the city) and each buffer is written
+    as its own row group, so readers can skip whole cities using row group
+    statistics. A buffer is written when it reaches row_group_size, and the
+    largest buffer is written early whenever more than max_buffered_rows
+    records are held in total.
+    """
+
+    def __init__(self, filename, schema: pa.Schema, row_group_size: int = 65536,
+                 max_buffered_rows: int = 262144, compression: str = 'zstd'):
+        self.filename = Path(filename)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.compression = compression
+        self.count = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._buffers: Dict[Any, List[Dict]] = {}
+        self._buffered = 0
+
+    def write(self, record: Dict, group: Any = None) -> None:
+        """Buffer one record under its group"""
+        buffer = self._buffers.setdefault(group, [])
+        buffer.append(record)
+        self._buffered += 1
+
+        if len(buffer) >= self.row_group_size:
+            self._write_group(group)
+        elif self._buffered > self.max_buffered_rows:
+            self._write_group(max(self._buffers, key=lambda key: len(self._buffers[key])))
+
+    def write_table(self, table: pa.Table) -> None:
+        """Write an Arrow table as (at most row_group_size sized) row groups"""
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.filename, self.schema, compression=self.compression)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.count += table.num_rows
+
+    def _write_group(self, group: Any) -> None:
+        records = self._buffers.pop(group)
+        self._buffered -= len(records)
+        self.write_table(pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self) -> None:
+        """Write all buffered records and close the file"""
+        for group in list(self._buffers):
+            self._write_group(group)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.filename, self.schema, compression=self.compression)
+        self._writer.close()
+
+
+def write_parquet(records: Iterable[Dict], filename, schema: pa.Schema,
+                  group_by: Optional[str] = None, row_group_size: int = 65536) -> int:
+    """Write records to a Parquet file, optionally one row group per value of group_by"""
+    writer = ParquetRecordWriter(filename, schema, row_group_size=row_group_size)
+    for record in records:
+        writer.write(record, record.get(group_by) if group_by else None)
+    writer.close()
+    return writer.count
+
+
+def merge_parquet_parts(sources: List, writer: ParquetRecordWriter, groups: Iterable,
+                        group_by: Optional[str] = None, order_by: str = '_seq') -> int:
+    """
+    Merge per-worker Parquet files into writer, one group at a time.
+
+    Each group is read from every source (row group statistics let the
+    reader skip other groups), sorted by order_by and written without that
+    column, so only one group is held in memory at a time. Returns the
+    number of records written.
+    """
+    count = 0
+    for group in groups:
+        filters = [(group_by, '=', group)] if group_by else None
+        table = pa.concat_tables([pq.read_table(source, filters=filters) for source in sources])
+        table = table.sort_by(order_by).drop_columns([order_by])
+        if table.num_rows:
+            writer.write_table(table.cast(writer.schema))
+            count += table.num_rows
+    return count
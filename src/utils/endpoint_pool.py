@@ -0,0 +1,211 @@
+# Pool of Overpass API endpoints with health based routing
+import asyncio
+import time
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import CONFIG
+from .metrics import METRICS
+
+# Weight of the newest sample in the latency and error rate averages
+EWMA_WEIGHT = 0.2
+
+# Error rate at which an endpoint stops improving (keeps its score finite)
+MAX_ERROR_RATE = 0.99
+
+
+class TokenBucket:
+    """
+    Token bucket limiting how fast queries are started on one endpoint.
+
+    capacity is the burst size (the number of query slots the server
+    grants) and rate the number of tokens added per second. The bucket is
+    only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if necessary; returns the time waited"""
+        start = time.monotonic()
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return time.monotonic() - start
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self) -> None:
+        """Give up all tokens (the server said we are too fast)"""
+        self._refill()
+        self.tokens = 0
+
+
+# Buckets are shared by all clients of the same endpoint
+_BUCKETS: Dict[str, TokenBucket] = {}
+
+
+def endpoint_bucket(url: str, rate: float, capacity: float) -> TokenBucket:
+    if url not in _BUCKETS:
+        _BUCKETS[url] = TokenBucket(rate, capacity)
+    return _BUCKETS[url]
+
+
+class Endpoint:
+    """
+    One Overpass API server: its HTTP session, rate limit and health.
+
+    At most `slots` queries run on it at a time, started through its
+    TokenBucket (refilled at `rate` per second, 0 for no limit). The
+    session keeps up to `slots` connections alive. Latency and error
+    rate are exponentially weighted averages over recent queries, and
+    `failures` counts the failures since the last success; after a
+    failure the endpoint is avoided until cooldown_until, for the
+    query's retry wait or longer the more failures in a row it had.
+    """
+
+    def __init__(self, url: str, slots: Optional[int] = None, rate: Optional[float] = None):
+        self.url = url
+        self.name = urlsplit(url).netloc or url
+        self.slots = slots or CONFIG.get('overpass_slots', 2)
+        self.rate = rate if rate is not None else CONFIG.get('overpass_rate', 1.0)
+        self.bucket = endpoint_bucket(url, self.rate, self.slots) if self.rate else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.slots)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.in_flight = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    @classmethod
+    def from_config(cls, entry: Union[str, Dict]) -> 'Endpoint':
+        """An endpoint from a URL or a {'url', 'slots', 'rate'} dict"""
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(entry['url'], entry.get('slots'), entry.get('rate'))
+
+    def score(self, now: float) -> float:
+        """
+        Expected seconds until a query sent now succeeds; lower is healthier.
+        
+        With attempts taking `latency` and failing at `error_rate`, that
+        is latency / (1 - error_rate), after any remaining cooldown.
+        """
+        return (max(self.cooldown_until - now, 0.0)
+                + self.latency / (1 - min(self.error_rate, MAX_ERROR_RATE)))
+
+    def record(self, seconds: Optional[float], ok: bool) -> None:
+        """Add the outcome of a query (seconds is None if it failed before an answer)"""
+        if seconds is not None:
+            self.latency += EWMA_WEIGHT * (seconds - self.latency) if self.latency else seconds
+        self.error_rate += EWMA_WEIGHT * ((0.0 if ok else 1.0) - self.error_rate)
+        self.failures = 0 if ok else self.failures + 1
+        METRICS.set('overpass_endpoint_latency_seconds', self.latency, endpoint=self.name)
+        METRICS.set('overpass_endpoint_error_rate', self.error_rate, endpoint=self.name)
+
+    def cool_down(self, seconds: float) -> None:
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class EndpointPool:
+    """
+    Overpass endpoints that queries are spread over.
+
+    acquire() hands out the endpoint with a free slot and the lowest
+    score (expected time to a successful answer, see Endpoint.score),
+    waiting while every endpoint is busy; unmeasured endpoints score 0,
+    so each one is tried early. Endpoints cooling down after a failure
+    are skipped unless all of them are, so queries fail over to a
+    mirror, and a failing endpoint gets one query again once its
+    cooldown ends.
+
+    The shared() pool, built from CONFIG['overpass_url'] and
+    CONFIG['overpass_mirrors'], is used by every OverpassClient that is
+    not given its own URL.
+    """
+
+    _shared: Optional['EndpointPool'] = None
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self._loop = None
+        self._released: Optional[asyncio.Condition] = None
+
+    @classmethod
+    def from_config(cls) -> 'EndpointPool':
+        entries = [CONFIG['overpass_url']] + list(CONFIG.get('overpass_mirrors') or [])
+        return cls([Endpoint.from_config(entry) for entry in entries])
+
+    @classmethod
+    def shared(cls) -> 'EndpointPool':
+        if cls._shared is None:
+            cls._shared = cls.from_config()
+        return cls._shared
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def _condition(self) -> asyncio.Condition:
+        # Conditions belong to one event loop; extractors run one loop per stage
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._released = asyncio.Condition()
+        return self._released
+
+    def _choose(self) -> Optional[Endpoint]:
+        now = time.monotonic()
+        ready = [e for e in self.endpoints if e.cooldown_until <= now] or self.endpoints
+        free = [e for e in ready if e.in_flight < e.slots]
+        return min(free, key=lambda e: e.score(now)) if free else None
+
+    async def acquire(self) -> Endpoint:
+        """Take a slot on the healthiest endpoint with one free"""
+        released = self._condition()
+        async with released:
+            endpoint = self._choose()
+            while endpoint is None:
+                await released.wait()
+                endpoint = self._choose()
+            endpoint.in_flight += 1
+        METRICS.inc('overpass_endpoint_queries_total', endpoint=endpoint.name)
+        return endpoint
+
+    async def release(self, endpoint: Endpoint) -> None:
+        released = self._condition()
+        async with released:
+            endpoint.in_flight -= 1
+            released.notify()
+
+    def alternative(self, endpoint: Endpoint) -> Optional[Endpoint]:
+        """A healthy endpoint other than endpoint (not cooling down), if there is one"""
+        now = time.monotonic()
+        others = [e for e in self.endpoints if e is not endpoint and e.cooldown_until <= now]
+        return min(others, key=lambda e: e.score(now)) if others else None
+
+    def close(self) -> None:
+        for endpoint in self.endpoints:
+            endpoint.close()
+        if EndpointPool._shared is self:
+            EndpointPool._shared = None
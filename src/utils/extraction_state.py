@@ -0,0 +1,218 @@
+# Persistent id-keyed store of extracted records for incremental updates
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS streets (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS streets_city ON streets (city);
+
+CREATE TABLE IF NOT EXISTS pois (
+    type TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    city TEXT NOT NULL,
+    record TEXT NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (type, id)
+);
+CREATE INDEX IF NOT EXISTS pois_city ON pois (city);
+
+CREATE TABLE IF NOT EXISTS boundaries (
+    id INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS way_nodes (
+    way_id INTEGER NOT NULL,
+    node_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS way_nodes_node ON way_nodes (node_id);
+CREATE INDEX IF NOT EXISTS way_nodes_way ON way_nodes (way_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# POIs in the order of a full extraction: nodes, then closed ways (each by
+# id, as in the PBF file), then multipolygons, which are assembled after all
+# their member ways were read; relations are ordered by the seq column, the
+# order in which they were first stored
+_POI_ORDER = "CASE type WHEN 'node' THEN 0 WHEN 'way' THEN 1 ELSE 2 END, seq, id"
+
+
+def _dumps(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+class ExtractionState:
+    """
+    SQLite store of streets, POIs and boundaries keyed by OSM id.
+
+    Written during a full PBF extraction and updated by applying OSM change
+    files, so that only the city files touched by a change need rewriting.
+    The node lists of streets and closed-way POIs are kept as well, to find
+    the records affected by a moved node. Upserts and deletes return the previous city of the record
+    (or None) so callers can track which city files are dirty.
+    """
+
+    def __init__(self, filename: str):
+        self.conn = sqlite3.connect(str(filename))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pois)")]
+        if 'seq' not in columns:
+            # States written before POIs had a position keep relations by id
+            self.conn.execute("ALTER TABLE pois ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self._relation_seq: Optional[int] = None
+
+    def _city(self, query: str, params: Tuple) -> Optional[str]:
+        row = self.conn.execute(query, params).fetchone()
+        return row[0] if row else None
+
+    # Streets
+
+    def put_street(self, record: Dict) -> Optional[str]:
+        old_city = self._city("SELECT city FROM streets WHERE id = ?", (record['id'],))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO streets (id, city, record) VALUES (?, ?, ?)",
+            (record['id'], record['city'], _dumps(record))
+        )
+        return old_city
+
+    def delete_street(self, way_id: int) -> Optional[str]:
+        old_city = self._city("SELECT city FROM streets WHERE id = ?", (way_id,))
+        if old_city is not None:
+            self.conn.execute("DELETE FROM streets WHERE id = ?", (way_id,))
+        return old_city
+
+    def get_street(self, way_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT record FROM streets WHERE id = ?", (way_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def streets_for_city(self, city: str) -> Iterator[Dict]:
+        for (record,) in self.conn.execute(
+                "SELECT record FROM streets WHERE city = ? ORDER BY id", (city,)):
+            yield json.loads(record)
+
+    # POIs
+
+    def put_poi(self, record: Dict) -> Optional[str]:
+        key = (record['type'], record['id'])
+        row = self.conn.execute(
+            "SELECT city, seq FROM pois WHERE type = ? AND id = ?", key
+        ).fetchone()
+        old_city, seq = row if row else (None, 0)
+        if row is None and record['type'] == 'relation':
+            seq = self._next_relation_seq()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pois (type, id, city, record, seq) VALUES (?, ?, ?, ?, ?)",
+            key + (record['city'], _dumps(record), seq)
+        )
+        return old_city
+
+    def _next_relation_seq(self) -> int:
+        """Position of a new multipolygon POI: after all stored ones"""
+        if self._relation_seq is None:
+            self._relation_seq = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM pois WHERE type = 'relation'").fetchone()[0]
+        self._relation_seq += 1
+        return self._relation_seq
+
+    def delete_poi(self, osm_type: str, osm_id: int) -> Optional[str]:
+        key = (osm_type, osm_id)
+        old_city = self._city("SELECT city FROM pois WHERE type = ? AND id = ?", key)
+        if old_city is not None:
+            self.conn.execute("DELETE FROM pois WHERE type = ? AND id = ?", key)
+        return old_city
+
+    def get_poi(self, osm_type: str, osm_id: int) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT record FROM pois WHERE type = ? AND id = ?", (osm_type, osm_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pois_for_city(self, city: str) -> Iterator[Dict]:
+        """POIs of a city in the order a full extraction writes them (see _POI_ORDER)"""
+        for (record,) in self.conn.execute(
+                f"SELECT record FROM pois WHERE city = ? ORDER BY {_POI_ORDER}", (city,)):
+            yield json.loads(record)
+
+    # Boundaries
+
+    def put_boundary(self, record: Dict) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO boundaries (id, record) VALUES (?, ?)",
+            (record['id'], _dumps(record))
+        )
+
+    def delete_boundary(self, relation_id: int) -> bool:
+        cursor = self.conn.execute("DELETE FROM boundaries WHERE id = ?", (relation_id,))
+        return cursor.rowcount > 0
+
+    def boundaries(self) -> List[Dict]:
+        return [
+            json.loads(record)
+            for (record,) in self.conn.execute("SELECT record FROM boundaries ORDER BY id")
+        ]
+
+    # Way node lists
+
+    def put_way_nodes(self, way_id: int, node_ids: Iterable[int]) -> None:
+        self.conn.execute("DELETE FROM way_nodes WHERE way_id = ?", (way_id,))
+        self.conn.executemany(
+            "INSERT INTO way_nodes (way_id, node_id) VALUES (?, ?)",
+            ((way_id, node_id) for node_id in node_ids)
+        )
+
+    def delete_way_nodes(self, way_id: int) -> None:
+        self.conn.execute("DELETE FROM way_nodes WHERE way_id = ?", (way_id,))
+
+    def way_nodes(self, way_id: int) -> List[int]:
+        return [
+            node_id for (node_id,) in self.conn.execute(
+                "SELECT node_id FROM way_nodes WHERE way_id = ? ORDER BY rowid", (way_id,))
+        ]
+
+    def ways_for_nodes(self, node_ids: Iterable[int], batch_size: int = 500) -> Set[int]:
+        node_ids = list(node_ids)
+        way_ids = set()
+        for start in range(0, len(node_ids), batch_size):
+            batch = node_ids[start:start + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            way_ids.update(
+                way_id for (way_id,) in self.conn.execute(
+                    f"SELECT DISTINCT way_id FROM way_nodes WHERE node_id IN ({placeholders})", batch)
+            )
+        return way_ids
+
+    # Summary and metadata
+
+    def city_counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Return (streets per city, POIs per city)"""
+        streets = dict(self.conn.execute("SELECT city, COUNT(*) FROM streets GROUP BY city"))
+        pois = dict(self.conn.execute("SELECT city, COUNT(*) FROM pois GROUP BY city"))
+        return streets, pois
+
+    def set_meta(self, key: str, value: Any) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+        )
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,258 @@
+# Compact binary store for street linestrings
+import mmap
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# File layout
+#   <name>.geom      MAGIC, then one block per way: zigzag varint deltas of
+#                    the E7 coordinates, interleaved lat, lon, lat, lon, ...
+#                    (the first point is a delta from 0)
+#   <name>.geom.idx  MAGIC, then (way_id, offset, length) int64 rows sorted
+#                    by way_id; offset/length locate the block in .geom
+MAGIC = b'OSMGEOM1'
+INDEX_SUFFIX = '.idx'
+_INDEX_DTYPE = np.dtype([('id', '<i8'), ('offset', '<i8'), ('length', '<i8')])
+
+# Coordinates are stored as int32 in units of 1e-7 degrees (as in OSM itself)
+E7 = 10_000_000
+
+# Zigzag encoded int32 deltas need at most 5 varint bytes
+_MAX_VARINT_BYTES = 5
+
+
+def _varint_sizes(zigzag: np.ndarray) -> np.ndarray:
+    sizes = np.ones(len(zigzag), dtype=np.int64)
+    for k in range(1, _MAX_VARINT_BYTES):
+        sizes += zigzag >= np.uint64(1 << (7 * k))
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """
+    Zigzag + LEB128 varint encode an array of signed integers (vectorized).
+
+    Returns the encoded bytes and the encoded size of each value.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+    sizes = _varint_sizes(zigzag)
+    starts = np.cumsum(sizes) - sizes
+
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(_MAX_VARINT_BYTES):
+        present = sizes > k
+        if not present.any():
+            break
+        byte = (zigzag[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[present] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[present] + k] = byte.astype(np.uint8)
+    return out.tobytes(), sizes
+
+
+def decode_varints(data) -> np.ndarray:
+    """Decode bytes written by encode_varints back to signed integers"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    zigzag = np.zeros(len(ends), dtype=np.uint64)
+    for k in range(_MAX_VARINT_BYTES):
+        present = starts + k <= ends
+        if not present.any():
+            break
+        byte = raw[starts[present] + k].astype(np.uint64) & np.uint64(0x7F)
+        zigzag[present] |= byte << np.uint64(7 * k)
+    return (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+
+
+def encode_linestrings(lats_e7: np.ndarray, lons_e7: np.ndarray,
+                       counts: Sequence[int]) -> Tuple[bytes, np.ndarray]:
+    """
+    Delta + varint encode a batch of linestrings given in E7 units.
+
+    lats_e7/lons_e7 hold the points of all linestrings back to back and
+    counts the number of points of each. Returns the encoded blocks
+    (back to back) and the byte length of each block.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    coords = np.empty(2 * len(lats_e7), dtype=np.int64)
+    coords[0::2] = lats_e7
+    coords[1::2] = lons_e7
+
+    deltas = coords.copy()
+    deltas[2:] -= coords[:-2]
+    firsts = 2 * (np.cumsum(counts) - counts)[counts > 0]
+    deltas[firsts] = coords[firsts]  # First point of each linestring is absolute
+    deltas[firsts + 1] = coords[firsts + 1]
+
+    data, sizes = encode_varints(deltas)
+    # Sum the value sizes per linestring (2 values per point)
+    ends = np.cumsum(np.concatenate(([0], sizes)))
+    bounds = 2 * np.cumsum(counts)
+    lengths = np.diff(ends[np.concatenate(([0], bounds))])
+    return data, lengths
+
+
+def decode_linestring(data) -> np.ndarray:
+    """Decode one block into an (n, 2) int32 array of E7 (lat, lon)"""
+    coords = np.cumsum(decode_varints(data).reshape(-1, 2), axis=0)
+    return coords.astype(np.int32)
+
+
+class GeometryWriter:
+    """
+    Append way linestrings to a geometry store.
+
+    Linestrings are encoded in batches of batch_size ways. The offset
+    index is written (sorted by way id) when the writer is closed.
+    """
+
+    def __init__(self, filename, batch_size: int = 4096):
+        self.filename = Path(filename)
+        self.batch_size = batch_size
+        self._file = open(self.filename, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._index: List[np.ndarray] = []
+        self._count = 0
+        self._ids: List[int] = []
+        self._counts: List[int] = []
+        self._lats: List[int] = []
+        self._lons: List[int] = []
+
+    def add_e7(self, way_id: int, lats_e7: Sequence[int], lons_e7: Sequence[int]) -> None:
+        """Store a linestring given as int E7 latitudes and longitudes"""
+        self._ids.append(way_id)
+        self._counts.append(len(lats_e7))
+        self._lats.extend(lats_e7)
+        self._lons.extend(lons_e7)
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def add(self, way_id: int, coords: Iterable[Tuple[float, float]]) -> None:
+        """Store a linestring given as (lat, lon) degrees"""
+        coords = list(coords)
+        self.add_e7(
+            way_id,
+            [int(round(lat * E7)) for lat, lon in coords],
+            [int(round(lon * E7)) for lat, lon in coords]
+        )
+
+    def flush(self) -> None:
+        """Encode and write the buffered linestrings"""
+        if not self._ids:
+            return
+        data, lengths = encode_linestrings(
+            np.array(self._lats, dtype=np.int64), np.array(self._lons, dtype=np.int64), self._counts
+        )
+        self._file.write(data)
+
+        index = np.zeros(len(self._ids), dtype=_INDEX_DTYPE)
+        index['id'] = self._ids
+        index['offset'] = self._offset + np.cumsum(lengths) - lengths
+        index['length'] = lengths
+        self._index.append(index)
+
+        self._offset += len(data)
+        self._count += len(self._ids)
+        self._ids, self._counts, self._lats, self._lons = [], [], [], []
+
+    def __len__(self) -> int:
+        return self._count + len(self._ids)
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+        write_index(self.filename, np.concatenate(self._index) if self._index
+                    else np.zeros(0, dtype=_INDEX_DTYPE))
+
+
+def index_filename(filename) -> Path:
+    return Path(str(filename) + INDEX_SUFFIX)
+
+
+def write_index(filename, index: np.ndarray) -> None:
+    index = np.sort(index, order='id', kind='stable')
+    with open(index_filename(filename), 'wb') as f:
+        f.write(MAGIC)
+        f.write(index.tobytes())
+
+
+class GeometryStore:
+    """
+    Random access to a geometry store written by GeometryWriter.
+
+    The data file is memory mapped and the index is binary searched, so a
+    lookup touches only the block of the requested way.
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        with open(index_filename(self.filename), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a geometry index: {index_filename(self.filename)}")
+            self.index = np.frombuffer(f.read(), dtype=_INDEX_DTYPE)
+
+        self._file = open(self.filename, 'rb')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a geometry store: {self.filename}")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, way_id: int) -> bool:
+        return self._find(way_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(way_id) for way_id in self.index['id'])
+
+    def _find(self, way_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.index['id'], way_id))
+        if i < len(self.index) and self.index['id'][i] == way_id:
+            return i
+        return None
+
+    def get_e7(self, way_id: int) -> np.ndarray:
+        """Return an (n, 2) int32 array of E7 (lat, lon); KeyError if unknown"""
+        i = self._find(way_id)
+        if i is None:
+            raise KeyError(way_id)
+        offset, length = int(self.index['offset'][i]), int(self.index['length'][i])
+        return decode_linestring(self._data[offset:offset + length])
+
+    def get(self, way_id: int) -> List[Tuple[float, float]]:
+        """Return the linestring as a list of (lat, lon) degrees; KeyError if unknown"""
+        return [(lat / E7, lon / E7) for lat, lon in self.get_e7(way_id).tolist()]
+
+    def close(self) -> None:
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> 'GeometryStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def merge_geometry_stores(sources: Sequence, target) -> int:
+    """Concatenate stores (e.g. from parallel workers) into one; returns the way count"""
+    indexes = []
+    with open(target, 'wb') as out:
+        out.write(MAGIC)
+        offset = len(MAGIC)
+        for source in sources:
+            with GeometryStore(source) as store:
+                index = store.index.copy()
+                index['offset'] += offset - len(MAGIC)
+                out.write(store._data[len(MAGIC):])
+                offset += len(store._data) - len(MAGIC)
+            indexes.append(index)
+    index = np.concatenate(indexes) if indexes else np.zeros(0, dtype=_INDEX_DTYPE)
+    write_index(target, index)
+    return len(index)
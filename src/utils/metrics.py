@@ -0,0 +1,237 @@
+# Throughput and resource metrics for long running extractions
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Prefix of every exported metric name
+PREFIX = 'osm_extractor'
+
+# Seconds between two exports of a MetricsExporter
+EXPORT_INTERVAL = 30
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def process_stats() -> Dict[str, float]:
+    """
+    Resource usage of the current process.
+
+    rss_bytes and read_bytes come from /proc (Linux only); read_bytes is
+    everything read through read() calls, files and sockets included.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    stats = {
+        'peak_rss_bytes': peak,
+        'cpu_user_seconds': usage.ru_utime,
+        'cpu_system_seconds': usage.ru_stime
+    }
+    try:
+        with open('/proc/self/statm') as f:
+            stats['rss_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        with open('/proc/self/io') as f:
+            io = dict(line.split(':') for line in f if ':' in line)
+        stats['read_bytes'] = int(io['rchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return stats
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and summaries (count/sum/max).
+
+    Metrics are identified by name and labels, e.g.
+    inc('pbf_callbacks_total', type='node'). Hot loops should keep plain
+    ints and publish them from a collector (add_collector), which is
+    called before every snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.monotonic()
+            self.counters: Dict[_Key, float] = defaultdict(float)
+            self.gauges: Dict[_Key, float] = {}
+            self.summaries: Dict[_Key, List[float]] = {}
+            self.collectors: List[Callable[['Metrics'], None]] = []
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self.counters[_key(name, labels)] += value
+
+    def set_counter(self, name: str, value: float, **labels) -> None:
+        """Publish a counter kept elsewhere (its total so far)"""
+        with self._lock:
+            self.counters[_key(name, labels)] = value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            summary = self.summaries.setdefault(_key(name, labels), [0, 0.0, value])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of a block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector: Callable[['Metrics'], None]) -> None:
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[['Metrics'], None]) -> None:
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def snapshot(self) -> Dict:
+        """
+        Current values as a JSON serializable dict.
+
+        Counters also get their average rate per second since the start
+        (or the last reset).
+        """
+        for collector in list(self.collectors):
+            collector(self)
+        for name, value in process_stats().items():
+            self.set(f'process_{name}', value)
+
+        with self._lock:
+            uptime = time.monotonic() - self.started
+            return {
+                'timestamp': time.time(),
+                'uptime_seconds': round(uptime, 3),
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value,
+                     'rate': round(value / uptime, 3) if uptime > 0 else 0.0}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'gauges': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+                'summaries': [
+                    {'name': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                     'max': maximum, 'mean': total / count if count else 0.0}
+                    for (name, labels), (count, total, maximum) in sorted(self.summaries.items())
+                ]
+            }
+
+
+def _prometheus_labels(labels: Dict, extra: Optional[Dict] = None) -> str:
+    labels = {**labels, **(extra or {})}
+    if not labels:
+        return ''
+    pairs = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{k}="{v}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def to_prometheus(snapshot: Dict, labels: Optional[Dict] = None) -> str:
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines: List[str] = []
+    typed = set()
+
+    def add(name, kind, sample_labels, value, suffix=''):
+        metric = f'{PREFIX}_{name}'
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f'# TYPE {metric} {kind}')
+        lines.append(f'{metric}{suffix}{_prometheus_labels(sample_labels, labels)} {value}')
+
+    for sample in snapshot['counters']:
+        add(sample['name'], 'counter', sample['labels'], sample['value'])
+    for sample in snapshot['gauges']:
+        add(sample['name'], 'gauge', sample['labels'], sample['value'])
+    for sample in snapshot['summaries']:
+        add(sample['name'], 'summary', sample['labels'], sample['count'], '_count')
+        lines.append(f"{PREFIX}_{sample['name']}_sum"
+                     f"{_prometheus_labels(sample['labels'], labels)} {sample['sum']}")
+    add('uptime_seconds', 'gauge', {}, snapshot['uptime_seconds'])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    Write metrics snapshots to a file every interval seconds.
+
+    A .prom file is written in the Prometheus text format (for the node
+    exporter textfile collector), anything else as JSON. The file is
+    replaced atomically, and written one last time on stop().
+    """
+
+    def __init__(self, metrics: Metrics, filename, interval: float = EXPORT_INTERVAL,
+                 labels: Optional[Dict] = None):
+        self.metrics = metrics
+        self.filename = Path(filename)
+        self.interval = interval
+        self.labels = labels or {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self) -> None:
+        snapshot = self.metrics.snapshot()
+        if self.filename.suffix == '.prom':
+            content = to_prometheus(snapshot, self.labels)
+        else:
+            content = json.dumps({**snapshot, 'labels': self.labels}, indent=2)
+        tmp = self.filename.with_name(self.filename.name + '.tmp')
+        tmp.write_text(content, encoding='utf-8')
+        tmp.replace(self.filename)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self) -> 'MetricsExporter':
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+    def __enter__(self) -> 'MetricsExporter':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def worker_metrics_file(filename, worker: int) -> Path:
+    """metrics.prom -> metrics.worker-1.prom"""
+    filename = Path(filename)
+    return filename.with_name(f"{filename.stem}.worker-{worker}{filename.suffix}")
+
+
+# Process wide registry (each worker process has its own)
+METRICS = Metrics()
@@ -0,0 +1,88 @@
+# Streaming NDJSON output helpers
+import heapq
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+def dump_record(record: Any) -> str:
+    """Serialize one record as a single NDJSON line"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def iter_ndjson(filename) -> Iterator[Any]:
+    """Yield records from an NDJSON file one at a time"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class NDJSONWriterPool:
+    """
+    Append NDJSON records to many files while capping open file handles.
+
+    Files are kept open in LRU order; when more than max_open_files are
+    needed the least recently used one is flushed and closed, and reopened
+    in append mode on its next write. A file is truncated the first time
+    the pool writes to it.
+    """
+
+    def __init__(self, max_open_files: int = 64, buffer_size: int = 1024 * 1024):
+        self.max_open_files = max_open_files
+        self.buffer_size = buffer_size
+        self.counts: Dict[Path, int] = {}
+        self._files: "OrderedDict[Path, Any]" = OrderedDict()
+
+    def _get_file(self, path: Path):
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+
+        if len(self._files) >= self.max_open_files:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+
+        mode = 'a' if path in self.counts else 'w'
+        f = open(path, mode, encoding='utf-8', buffering=self.buffer_size)
+        self._files[path] = f
+        self.counts.setdefault(path, 0)
+        return f
+
+    def write(self, path, record: Any) -> None:
+        """Append one record to the given file"""
+        path = Path(path)
+        self._get_file(path).write(dump_record(record))
+        self.counts[path] += 1
+
+    def flush(self) -> None:
+        """Flush all open files"""
+        for f in self._files.values():
+            f.flush()
+
+    def close(self) -> None:
+        """Flush and close all open files"""
+        while self._files:
+            _, f = self._files.popitem(last=False)
+            f.close()
+
+
+def merge_ndjson(sources: Iterable, target, key: Callable[[Any], Any],
+                 transform: Optional[Callable[[Any], Any]] = None) -> int:
+    """
+    Merge NDJSON files that are each sorted by key into one sorted file.
+
+    Only one record per source is held in memory at a time. If transform
+    is given, it is applied to each record before it is written.
+    Returns the number of records written.
+    """
+    count = 0
+    with open(target, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+        for record in heapq.merge(*(iter_ndjson(source) for source in sources), key=key):
+            if transform is not None:
+                record = transform(record)
+            f.write(dump_record(record))
+            count += 1
+    return count
@@ -0,0 +1,239 @@
+# Persistent cache of Overpass API responses
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from config import CONFIG
+from .metrics import METRICS
+
+# Seconds a response stays valid, by query kind (see OverpassClient.query)
+DEFAULT_TTLS = {
+    'admin': 30 * 86400,  # boundaries hardly change
+    'streets': 7 * 86400,
+    'poi': 86400,
+    'query': 86400,
+}
+
+DEFAULT_MAX_BYTES = 2 * 2**30
+
+# Bytes read from a cache file at a time
+CHUNK_SIZE = 2**20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+# A quoted string, or a run of whitespace outside of one
+_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Collapse the whitespace of an Overpass QL query (quoted strings are kept as is)"""
+    return _TOKEN.sub(lambda m: m.group(1) or ' ', query).strip()
+
+
+def cache_key(url: str, query: str) -> str:
+    return hashlib.sha256(f"{url}\n{normalize_query(query)}".encode('utf-8')).hexdigest()
+
+
+class OverpassCache:
+    """
+    On-disk cache of raw Overpass responses.
+
+    Entries are keyed by the SHA-256 of the endpoint and the normalized
+    query text and stored zlib compressed as <dir>/<ab>/<key>.z, with
+    an SQLite index holding their kind, age, last access and size. A
+    response older than the TTL of its kind is a miss, and once the
+    compressed files exceed max_bytes the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, float]] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.directory / 'index.sqlite'), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls) -> Optional['OverpassCache']:
+        """The cache configured in CONFIG, or None if caching is disabled"""
+        if not CONFIG.get('cache_dir'):
+            return None
+        return cls(CONFIG['cache_dir'], CONFIG.get('cache_max_bytes', DEFAULT_MAX_BYTES),
+                   CONFIG.get('cache_ttl'))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.z"
+
+    def _ttl(self, kind: str) -> float:
+        return self.ttls.get(kind, self.ttls['query'])
+
+    def _valid(self, key: str, kind: str) -> bool:
+        """Whether key has an unexpired entry; marks it as used"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[0] > self._ttl(kind):
+                self._delete(key)
+                row = None
+            if row is not None:
+                self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+        METRICS.inc('overpass_cache_hits_total' if row is not None else 'overpass_cache_misses_total',
+                    kind=kind)
+        return row is not None
+
+    def open(self, url: str, query: str, kind: str = 'query') -> Optional[Iterator[bytes]]:
+        """The cached response body as decompressed chunks, or None if missing or expired"""
+        key = cache_key(url, query)
+        if not self._valid(key, kind):
+            return None
+        return self._chunks(key)
+
+    def _chunks(self, key: str) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj()
+        try:
+            with open(self._path(key), 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    yield decompressor.decompress(chunk)
+            yield decompressor.flush()
+        except (OSError, zlib.error) as e:
+            logging.warning(f"Dropping unreadable cache entry {key}: {e}")
+            with self._lock:
+                self._delete(key)
+            raise
+
+    def get(self, url: str, query: str, kind: str = 'query') -> Optional[bytes]:
+        """The cached response body, or None if missing or expired"""
+        chunks = self.open(url, query, kind)
+        if chunks is None:
+            return None
+        try:
+            return b''.join(chunks)
+        except (OSError, zlib.error):
+            return None
+
+    def writer(self, url: str, query: str, kind: str = 'query') -> 'CacheWriter':
+        """A writer storing a response as it is received (see CacheWriter)"""
+        return CacheWriter(self, cache_key(url, query), kind)
+
+    def put(self, url: str, query: str, data: bytes, kind: str = 'query') -> None:
+        writer = self.writer(url, query, kind)
+        writer.write(data)
+        writer.commit()
+
+    def _add(self, key: str, kind: str, size: int, raw_size: int) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, created, accessed, size, raw_size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, now, now, size, raw_size)
+            )
+            self.conn.commit()
+            self._evict()
+        METRICS.inc('overpass_cache_stored_bytes_total', size, kind=kind)
+
+    def _delete(self, key: str) -> None:
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.conn.commit()
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed"
+        ).fetchall():
+            self._delete(key)
+            METRICS.inc('overpass_cache_evictions_total')
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def size(self) -> int:
+        """Compressed bytes on disk"""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def prune(self) -> int:
+        """Remove all expired entries; returns how many were removed"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for key, kind, created in self.conn.execute(
+                "SELECT key, kind, created FROM entries"
+            ).fetchall():
+                if now - created > self._ttl(kind):
+                    self._delete(key)
+                    removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            for (key,) in self.conn.execute("SELECT key FROM entries").fetchall():
+                self._delete(key)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CacheWriter:
+    """
+    Compress a response into the cache chunk by chunk.
+
+    The entry only becomes visible on commit(); discard() (or an
+    exception before commit) drops the partial file.
+    """
+
+    def __init__(self, cache: OverpassCache, key: str, kind: str):
+        self.cache = cache
+        self.key = key
+        self.kind = kind
+        self.path = cache._path(key)
+        self.path.parent.mkdir(exist_ok=True)
+        self.tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._file = open(self.tmp, 'wb')
+        self._compressor = zlib.compressobj(6)
+        self.raw_size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.raw_size += len(chunk)
+        self._file.write(self._compressor.compress(chunk))
+
+    def commit(self) -> None:
+        self._file.write(self._compressor.flush())
+        size = self._file.tell()
+        self._file.close()
+        self.tmp.replace(self.path)
+        self.cache._add(self.key, self.kind, size, self.raw_size)
+
+    def discard(self) -> None:
+        self._file.close()
+        self.tmp.unlink(missing_ok=True)
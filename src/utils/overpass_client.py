@@ -0,0 +1,265 @@
+# Concurrent Overpass API client with per-endpoint rate limiting and failover
+import asyncio
+import logging
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union
+
+import overpy
+
+from config import CONFIG
+from .endpoint_pool import Endpoint, EndpointPool
+from .metrics import METRICS
+from .overpass_cache import OverpassCache
+from .overpass_stream import iter_elements
+from .retry_policy import FATAL, RetryPolicy, classify, parse_retry_after
+
+DEFAULT_URL = "https://overpass-api.de/api/interpreter"
+
+# Bytes read from a response at a time
+CHUNK_SIZE = 2**20
+
+_ERROR_MESSAGE = re.compile(r'<p><strong[^>]*>Error</strong>: (.*?)</p>', re.S)
+
+
+class OverpassClient:
+    """
+    asyncio Overpass client used by the extractors.
+
+    Queries go to the endpoints of an EndpointPool: the shared pool of
+    CONFIG['overpass_url'] and its mirrors, or with url a single endpoint
+    with `slots` slots and `rate`. At most `concurrency` queries are in
+    flight at a time; each runs on the healthiest endpoint with a free
+    slot, after taking a token from that endpoint's TokenBucket, so
+    queries start as fast as the servers allow instead of after fixed
+    sleeps. HTTP requests run in a thread pool on the endpoint's pooled
+    requests.Session. query() parses responses with overpy into the usual
+    overpy.Result, stream() hands the elements to a callback as they are
+    read.
+
+    Failed queries are retried as the RetryPolicy decides (built from
+    max_retries and retry_delay unless one is passed): fatal errors and
+    those for which give_up(error) is true are raised at once. Otherwise
+    the failing endpoint cools down for the policy's wait (Retry-After, a
+    free slot on /api/status or an exponential backoff) and the query is
+    retried at once on another healthy endpoint, or after the wait if
+    there is none. A 429 also empties the endpoint's bucket.
+    Responses are kept in an OverpassCache (by default the one configured
+    in CONFIG, pass cache=False to disable) under the primary endpoint's
+    URL, since mirrors serve the same data, so repeated queries are
+    answered without touching the network.
+    Latency, payload size and time spent waiting for a token are
+    recorded in METRICS by query kind, endpoint health by endpoint.
+    """
+
+    def __init__(self, url: str = None, concurrency: int = None, rate: Optional[float] = None,
+                 slots: int = None, timeout: float = None, max_retries: int = None,
+                 retry_delay: float = None, cache: Union[OverpassCache, bool, None] = True,
+                 retry: Optional[RetryPolicy] = None, pool: Optional[EndpointPool] = None):
+        # With url, a pool of that endpoint alone (a rate of 0 disables its
+        # token bucket, e.g. for a local server)
+        self._own_pool = pool is None and url is not None
+        if self._own_pool:
+            pool = EndpointPool([Endpoint(url, slots, rate)])
+        self.pool = pool or EndpointPool.shared()
+        self.url = self.pool.primary.url
+        self.concurrency = (concurrency or CONFIG.get('overpass_concurrency')
+                            or sum(endpoint.slots for endpoint in self.pool.endpoints))
+        self.timeout = timeout or CONFIG['timeout']
+        self.retry = retry or RetryPolicy(max_retries, retry_delay)
+        if cache is True:
+            cache = OverpassCache.from_config()
+        self.cache = cache if isinstance(cache, OverpassCache) else None
+        self.parser = overpy.Overpass(url=self.url)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='overpass')
+        self._loop = None
+        self._semaphore = None
+
+    def _limit(self) -> asyncio.Semaphore:
+        # Semaphores belong to one event loop; extractors run one loop per stage
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _open(self, endpoint: Endpoint, query: str) -> Tuple[int, Mapping[str, str], Iterator[bytes]]:
+        """Send one query to endpoint (blocking); returns status code, headers and the body in chunks"""
+        response = endpoint.session.post(endpoint.url, data={'data': query}, timeout=self.timeout,
+                                         stream=True)
+        
+        def chunks():
+            try:
+                yield from response.iter_content(CHUNK_SIZE)
+            finally:
+                response.close()
+        
+        return response.status_code, response.headers, chunks()
+
+    def _raise_for_status(self, query: str, status: int, body: bytes,
+                          headers: Mapping[str, str]) -> None:
+        """Raise the overpy exception for an unsuccessful response, with its Retry-After as retry_after"""
+        if status == 400:
+            messages = _ERROR_MESSAGE.findall(body.decode('utf-8', 'replace'))
+            error = overpy.exception.OverpassBadRequest(query.encode('utf-8'), msgs=messages)
+        elif status == 429:
+            error = overpy.exception.OverpassTooManyRequests()
+        elif status == 504:
+            error = overpy.exception.OverpassGatewayTimeout()
+        else:
+            error = overpy.exception.OverpassUnknownHTTPStatusCode(status)
+        error.retry_after = parse_retry_after(headers.get('Retry-After'))
+        raise error
+
+    def _consume(self, chunks: Iterable[bytes], consume: Optional[Callable]) -> Any:
+        """Parse a JSON body into a Result, or hand its elements to consume"""
+        if consume is None:
+            return self.parser.parse_json(b''.join(chunks))
+        return consume(iter_elements(chunks))
+
+    def _fetch(self, endpoint: Endpoint, query: str, kind: str,
+               consume: Optional[Callable]) -> Tuple[int, Any, int, Mapping[str, str]]:
+        """
+        One attempt (blocking, run in the executor).
+
+        Returns the status code, the parsed value (the error body if the
+        status is not 200), the payload size and the headers. JSON
+        responses are written to the cache while they are read and
+        committed once they were consumed completely.
+        """
+        status, headers, chunks = self._open(endpoint, query)
+        if status != 200:
+            body = b''.join(chunks)
+            return status, body, len(body), headers
+        if headers.get('Content-Type', '').startswith('application/osm3s+xml'):
+            body = b''.join(chunks)
+            return status, self.parser.parse_xml(body), len(body), headers
+
+        writer = self.cache.writer(self.url, query, kind) if self.cache is not None else None
+        size = 0
+        
+        def received():
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                if writer is not None:
+                    writer.write(chunk)
+                yield chunk
+        
+        try:
+            value = self._consume(received(), consume)
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        if writer is not None:
+            writer.commit()
+        return status, value, size, headers
+
+    async def _attempt(self, endpoint: Endpoint, query: str, kind: str,
+                       consume: Optional[Callable]) -> Any:
+        loop = asyncio.get_running_loop()
+        if endpoint.bucket is not None:
+            METRICS.observe('overpass_wait_seconds', await endpoint.bucket.acquire(), kind=kind)
+        start = time.perf_counter()
+        try:
+            status, value, size, headers = await loop.run_in_executor(
+                self._executor, self._fetch, endpoint, query, kind, consume
+            )
+        except Exception as e:
+            METRICS.observe('overpass_query_seconds', time.perf_counter() - start,
+                            kind=kind, status='error')
+            # Errors in parsing or consume are not the endpoint's fault
+            if classify(e) != FATAL:
+                endpoint.record(None, ok=False)
+            raise
+        elapsed = time.perf_counter() - start
+        METRICS.observe('overpass_query_seconds', elapsed, kind=kind,
+                        status='ok' if status == 200 else str(status))
+        if status == 429 and endpoint.bucket is not None:
+            endpoint.bucket.drain()
+        if status != 200:
+            # A syntax error is the query's fault, not the endpoint's
+            endpoint.record(elapsed, ok=status == 400)
+            self._raise_for_status(query, status, value, headers)
+        endpoint.record(elapsed, ok=True)
+        METRICS.observe('overpass_response_bytes', size, kind=kind)
+        logging.debug(f"Overpass {kind} query on {endpoint.name} took {elapsed:.1f}s ({size:,} bytes)")
+        return value
+
+    async def _run(self, query: str, kind: str, consume: Optional[Callable],
+                   give_up: Optional[Callable[[Exception], bool]] = None) -> Any:
+        if self.cache is not None:
+            chunks = self.cache.open(self.url, query, kind)
+            if chunks is not None:
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._consume, chunks, consume
+                    )
+                except (OSError, zlib.error):
+                    pass  # the broken entry was dropped, query the server instead
+        attempt = 0
+        while True:
+            async with self._limit():
+                endpoint = await self.pool.acquire()
+                try:
+                    return await self._attempt(endpoint, query, kind, consume)
+                except Exception as e:
+                    error = e
+                finally:
+                    await self.pool.release(endpoint)
+            
+            METRICS.inc('overpass_errors_total', kind=kind, error=type(error).__name__)
+            if not self.retry.should_retry(attempt, error) or (give_up and give_up(error)):
+                raise error
+            status = None
+            if self.retry.needs_status(error):
+                status = await asyncio.get_running_loop().run_in_executor(
+                    None, self.retry.fetch_status, endpoint.url, endpoint.session
+                )
+            wait_time = self.retry.wait_time(attempt, error, status)
+            endpoint.cool_down(max(wait_time, self.retry.cooldown(endpoint.failures)))
+            alternative = self.pool.alternative(endpoint)
+            if alternative is not None:
+                METRICS.inc('overpass_failovers_total', kind=kind, endpoint=endpoint.name)
+                logging.warning(f"Query failed on {endpoint.name} (attempt {attempt + 1}), "
+                                f"retrying on {alternative.name}: {error}")
+            else:
+                METRICS.observe('overpass_retry_wait_seconds', wait_time, kind=kind,
+                                error=classify(error))
+                logging.warning(f"Query failed (attempt {attempt + 1}), retrying in {wait_time:.1f}s: {error}")
+                await asyncio.sleep(wait_time)
+            attempt += 1
+
+    async def query(self, query: str, kind: str = 'query') -> overpy.Result:
+        """Run a query, retrying failed attempts"""
+        return await self._run(query, kind, None)
+
+    async def stream(self, query: str, consume: Callable[[Iterator[Dict]], Any],
+                     kind: str = 'query',
+                     give_up: Optional[Callable[[Exception], bool]] = None) -> Any:
+        """
+        Run a query and pass its elements to consume while they arrive.
+
+        consume(elements) gets an iterator of element dicts (see
+        iter_elements) and runs in the client's thread pool; its return
+        value is returned. No overpy.Result is built, so memory stays
+        bounded by what consume keeps. A failed attempt is retried with
+        a fresh call of consume, unless give_up(error) is true.
+        """
+        return await self._run(query, kind, consume, give_up)
+
+    def query_sync(self, query: str, kind: str = 'query') -> overpy.Result:
+        """Run a single query from synchronous code"""
+        return asyncio.run(self.query(query, kind))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        # The shared pool outlives a client
+        if self._own_pool:
+            self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
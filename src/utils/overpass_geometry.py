@@ -0,0 +1,58 @@
+# Geometry output modes of Overpass queries
+from typing import Dict, Optional, Sequence, Tuple
+
+from config import CONFIG
+
+# Output statements by mode. 'full' recurses into every member way and
+# node ('>'), the others answer with the selected elements only:
+#   none    tags, members and node references, no coordinates but the nodes'
+#   center  plus the center of each way's / relation's bounding box
+#   bbox    plus each way's / relation's bounding box ('bounds')
+#   geom    plus the coordinates of each way node and relation member inline
+# Admin boundaries default to 'none' and POIs to 'center', which leaves out
+# the member nodes that made up most of those responses: a way or relation
+# POI then gets the center of its bounding box instead of the mean of its
+# nodes, and admin records get a center/bounds where the mode returns one.
+GEOMETRY_MODES = {
+    'none': ['out body;'],
+    'center': ['out center;'],
+    'bbox': ['out bb;'],
+    'geom': ['out geom;'],
+    'full': ['out body;', '>;', 'out skel qt;'],
+}
+
+
+def geometry_mode(kind: str, allowed: Sequence[str] = tuple(GEOMETRY_MODES)) -> str:
+    """The mode CONFIG['overpass_geometry'] sets for a query kind (admin, streets, poi)"""
+    mode = (CONFIG.get('overpass_geometry') or {}).get(kind, 'full')
+    if mode not in allowed:
+        raise ValueError(f"Unknown {kind} overpass_geometry {mode!r}, expected one of {tuple(allowed)}")
+    return mode
+
+
+def out_statement(mode: str, indent: str = '') -> str:
+    """Output statements of a mode, one per line (continued with indent)"""
+    return f"\n{indent}".join(GEOMETRY_MODES[mode])
+
+
+def element_point(element: Dict) -> Optional[Tuple[float, float]]:
+    """
+    A (lat, lon) point for an element, from whatever geometry it came with.
+
+    Nodes have their own coordinates, ways with geometry the mean of
+    their nodes (like the mean of the 'full' mode's member nodes);
+    otherwise the center, or the middle of the bounds. None if the
+    element has no geometry (e.g. a way in 'none' or 'full' mode).
+    """
+    if 'lat' in element:
+        return element['lat'], element['lon']
+    points = [point for point in element.get('geometry') or () if point]
+    if points:
+        return (sum(point['lat'] for point in points) / len(points),
+                sum(point['lon'] for point in points) / len(points))
+    if 'center' in element:
+        return element['center']['lat'], element['center']['lon']
+    if 'bounds' in element:
+        bounds = element['bounds']
+        return (bounds['minlat'] + bounds['maxlat']) / 2, (bounds['minlon'] + bounds['maxlon']) / 2
+    return None
@@ -0,0 +1,171 @@
+# Incremental parsing of Overpass JSON responses
+import codecs
+import json
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import overpy
+
+_ELEMENTS = re.compile(r'"elements"\s*:\s*\[')
+_REMARK = re.compile(r'"remark"\s*:\s*("(?:[^"\\]|\\.)*")')
+_SKIP = re.compile(r'[\s,]*')
+
+
+def _raise_remark(tail: str) -> None:
+    """Raise the overpy exception for a remark after the elements, like Overpass.parse_json"""
+    m = _REMARK.search(tail)
+    if m is None:
+        return
+    msg = json.loads(m.group(1)).strip()
+    if msg.startswith("runtime error:"):
+        raise overpy.exception.OverpassRuntimeError(msg=msg)
+    if msg.startswith("runtime remark:"):
+        raise overpy.exception.OverpassRuntimeRemark(msg=msg)
+    raise overpy.exception.OverpassUnknownError(msg=msg)
+
+
+def iter_elements(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    Yield the elements of an Overpass JSON response as dicts while it arrives.
+
+    Only the undecoded text is held in memory, at most about twice the
+    current element: an element cut off by the end of a chunk is parsed
+    again once the text from its start has doubled, so a large element
+    costs a few attempts rather than one per chunk. Runtime errors that Overpass
+    appends after the elements (a "remark") are raised as the same overpy
+    exceptions as Overpass.parse_json raises, once all elements were
+    yielded.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pending: List[str] = []  # Text received since the buffer was last parsed
+    pending_size = 0
+    retry_size = 0  # Buffer size at which a cut off element is parsed again
+    pos = 0
+    in_elements = False
+    chunks = iter(chunks)
+    finished = False
+
+    while True:
+        if pending:
+            buffer += ''.join(pending)
+            pending, pending_size = [], 0
+        if not in_elements:
+            m = _ELEMENTS.search(buffer)
+            if m is not None:
+                in_elements = True
+                pos = m.end()
+        if in_elements:
+            while True:
+                pos = _SKIP.match(buffer, pos).end()
+                if pos >= len(buffer):
+                    break
+                if buffer[pos] == ']':
+                    tail = buffer[pos + 1:] + ''.join(text.decode(chunk) for chunk in chunks)
+                    _raise_remark(tail + text.decode(b'', final=True))
+                    return
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Element continues in the next chunks
+                    if finished:
+                        raise
+                    retry_size = 2 * (len(buffer) - pos)
+                    break
+                retry_size = 0
+                yield element
+                pos = end
+            buffer = buffer[pos:]
+            pos = 0
+        if finished:
+            break
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                finished = True
+                pending.append(text.decode(b'', final=True))
+                break
+            pending.append(text.decode(chunk))
+            pending_size += len(pending[-1])
+            if len(buffer) + pending_size >= retry_size:
+                break
+
+    if not in_elements:
+        # No element list at all, e.g. only an error remark
+        _raise_remark(buffer)
+        raise ValueError("Overpass response has no elements")
+    raise ValueError("Overpass response ended inside the element list")
+
+
+class NodeCoordinates:
+    """
+    Compact node id -> (lat, lon) map.
+
+    Ids and coordinates are appended to typed arrays while a response is
+    read (Overpass sends the `>; out skel qt;` nodes after the ways that
+    reference them) and sorted once on first lookup, instead of holding
+    a Python object per node. A node added more than once (e.g. from
+    overlapping tiles) keeps its first coordinates.
+    """
+
+    def __init__(self):
+        self._ids = array('q')
+        self._lats = array('d')
+        self._lons = array('d')
+        self._sorted: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def add(self, node_id: int, lat: float, lon: float) -> None:
+        self._ids.append(node_id)
+        self._lats.append(lat)
+        self._lons.append(lon)
+        self._sorted = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def update(self, other: 'NodeCoordinates') -> None:
+        """Add all nodes of another map"""
+        self._ids.extend(other._ids)
+        self._lats.extend(other._lats)
+        self._lons.extend(other._lons)
+        self._sorted = None
+
+    def lookup(self, node_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitudes and longitudes of node_ids; nodes not in the map are left out"""
+        if self._sorted is None:
+            ids = np.frombuffer(self._ids, dtype=np.int64)
+            ids, first = np.unique(ids, return_index=True)
+            self._sorted = (ids, np.frombuffer(self._lats)[first], np.frombuffer(self._lons)[first])
+        ids, lats, lons = self._sorted
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if not len(ids):
+            return np.zeros(0), np.zeros(0)
+        positions = np.minimum(np.searchsorted(ids, node_ids), len(ids) - 1)
+        found = ids[positions] == node_ids
+        return lats[positions[found]], lons[positions[found]]
+
+
+class WayRefs:
+    """Node references of many ways in flat typed arrays, for resolving once all nodes are read"""
+
+    def __init__(self):
+        self.way_ids = array('q')
+        self._refs = array('q')
+        self._offsets = array('q', [0])
+
+    def add(self, way_id: int, node_ids: List[int]) -> None:
+        self.way_ids.append(way_id)
+        self._refs.extend(node_ids)
+        self._offsets.append(len(self._refs))
+
+    def __len__(self) -> int:
+        return len(self.way_ids)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """(way_id, node_ids) pairs in insertion order"""
+        refs = np.frombuffer(self._refs, dtype=np.int64)
+        for i, way_id in enumerate(self.way_ids):
+            yield way_id, refs[self._offsets[i]:self._offsets[i + 1]]
@@ -0,0 +1,109 @@
+# Quadtree tiling of large Overpass queries
+import asyncio
+import logging
+import re
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import overpy
+
+from config import CONFIG
+from .metrics import METRICS
+
+# Runtime errors Overpass reports when a query is too big for its limits
+_TOO_LARGE = re.compile(r'timed out|out of memory', re.I)
+
+
+class TileTooLarge(ValueError):
+    """A tile's response has more elements than the planner allows"""
+
+
+class Tile(NamedTuple):
+    """Bounding box of one sub-query, `depth` splits below the region's box"""
+    south: float
+    west: float
+    north: float
+    east: float
+    depth: int = 0
+
+    def bbox(self) -> str:
+        """Overpass QL bbox filter, '(south,west,north,east)'"""
+        return f"({self.south:.7f},{self.west:.7f},{self.north:.7f},{self.east:.7f})"
+
+    def split(self) -> List['Tile']:
+        """The four quadrants (south-west, south-east, north-west, north-east)"""
+        lat = (self.south + self.north) / 2
+        lon = (self.west + self.east) / 2
+        depth = self.depth + 1
+        return [
+            Tile(self.south, self.west, lat, lon, depth),
+            Tile(self.south, lon, lat, self.east, depth),
+            Tile(lat, self.west, self.north, lon, depth),
+            Tile(lat, lon, self.north, self.east, depth),
+        ]
+
+
+def too_large(error: Exception) -> bool:
+    """Whether a query failed because of its size, so a smaller tile may succeed"""
+    if isinstance(error, TileTooLarge):
+        return True
+    return (isinstance(error, overpy.exception.OverpassRuntimeError)
+            and _TOO_LARGE.search(error.msg or '') is not None)
+
+
+class TilePlanner:
+    """
+    Run a region query as a quadtree of bounding box tiles.
+
+    The region's box is queried as one tile first. A tile whose query
+    times out or runs out of memory on the server, or whose response has
+    more than max_elements elements, is split into its four quadrants,
+    down to max_depth splits; the quadrants are queried concurrently
+    through the same client, so they share its concurrency and rate
+    limits. Size failures are only retried (as the client retries any
+    failure) on tiles at max_depth.
+
+    run() returns the consume results of the leaf tiles in quadtree
+    order. Ways crossing a tile edge are returned by every tile they
+    touch, so callers merge the results by element id.
+    """
+
+    def __init__(self, max_elements: Optional[int] = None, max_depth: Optional[int] = None):
+        self.max_elements = max_elements if max_elements is not None else CONFIG.get('tile_max_elements')
+        self.max_depth = max_depth if max_depth is not None else CONFIG.get('tile_max_depth', 4)
+
+    def _limit(self, elements: Iterator[Dict]) -> Iterator[Dict]:
+        for count, element in enumerate(elements, 1):
+            if count > self.max_elements:
+                raise TileTooLarge(f"Tile response has more than {self.max_elements:,} elements")
+            yield element
+
+    async def _fetch(self, client, tile: Tile, query: Callable[[Tile], str],
+                     consume: Callable[[Iterator[Dict]], Any], kind: str) -> List[Any]:
+        def limited(elements):
+            return consume(self._limit(elements) if self.max_elements else elements)
+
+        # Tiles that can still be split are not retried on a size failure
+        give_up = too_large if tile.depth < self.max_depth else None
+        try:
+            return [await client.stream(query(tile), limited, kind=kind, give_up=give_up)]
+        except Exception as e:
+            if not too_large(e) or tile.depth >= self.max_depth:
+                raise
+            METRICS.inc('overpass_tile_splits_total', kind=kind)
+            logging.info(f"Splitting tile {tile.bbox()} (depth {tile.depth}): {e}")
+
+        parts = await asyncio.gather(*(self._fetch(client, quadrant, query, consume, kind)
+                                       for quadrant in tile.split()))
+        return [result for part in parts for result in part]
+
+    async def run(self, client, bounds, query: Callable[[Tile], str],
+                  consume: Callable[[Iterator[Dict]], Any], kind: str = 'query') -> List[Any]:
+        """
+        Query the tiles of bounds (south, west, north, east) with an OverpassClient.
+
+        query(tile) builds the Overpass query of a tile; the root tile
+        (depth 0) covers the whole box, so it may leave out the bbox
+        filter. consume is called on each tile's elements as in
+        OverpassClient.stream.
+        """
+        return await self._fetch(client, Tile(*bounds), query, consume, kind)
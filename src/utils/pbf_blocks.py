@@ -0,0 +1,210 @@
+# Block level access to .osm.pbf files
+import lzma
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# A PBF file is a sequence of blobs, each prefixed by a 4 byte big endian
+# BlobHeader length and the BlobHeader (a protobuf message with the blob
+# type in field 1 and the size of the following Blob in field 3). The
+# first blob is the OSMHeader, all others are OSMData blocks that can be
+# decoded on their own.
+_HEADER_TYPE_FIELD = 1
+_DATASIZE_FIELD = 3
+
+# Fields needed to count the elements of an OSMData block: the Blob holds
+# the PrimitiveBlock raw or compressed, its primitive groups each hold
+# one kind of element, and dense nodes store their ids as a packed array
+_BLOB_DATA = {1: None, 3: zlib.decompress, 4: lzma.decompress}  # raw, zlib_data, lzma_data
+_BLOCK_GROUP_FIELD = 2
+_GROUP_ELEMENTS = {1: 'nodes', 3: 'ways', 4: 'relations'}
+_GROUP_DENSE_FIELD = 2
+_DENSE_IDS_FIELD = 1
+
+# Bytes that continue a varint; a packed array holds one value per other byte
+_VARINT_CONTINUATION = bytes(range(0x80, 0x100))
+
+
+class Block(NamedTuple):
+    offset: int
+    length: int
+
+
+def _read_varint(data: bytes, pos: int):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def _parse_blob_header(data: bytes):
+    """Return (type, datasize) of a BlobHeader message"""
+    blob_type, datasize, pos = None, None, 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+            if field == _DATASIZE_FIELD:
+                datasize = value
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            if field == _HEADER_TYPE_FIELD:
+                blob_type = data[pos:pos + length].decode('ascii')
+            pos += length
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type} in PBF BlobHeader")
+    if blob_type is None or datasize is None:
+        raise ValueError("Incomplete PBF BlobHeader")
+    return blob_type, datasize
+
+
+def _fields(data: bytes, pos: int, end: int) -> Iterator[tuple]:
+    """Yield (field, start, end) of the length delimited fields of a message, skipping others"""
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            yield key >> 3, pos, pos + length
+            pos += length
+        elif wire_type == 0:
+            _, pos = _read_varint(data, pos)
+        elif wire_type in (1, 5):
+            pos += 8 if wire_type == 1 else 4
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type} in PBF block")
+
+
+def _count_block(block: bytes, counts: Dict[str, int]) -> None:
+    for field, start, end in _fields(block, 0, len(block)):
+        if field != _BLOCK_GROUP_FIELD:
+            continue
+        for kind, member_start, member_end in _fields(block, start, end):
+            if kind == _GROUP_DENSE_FIELD:
+                for dense_field, ids_start, ids_end in _fields(block, member_start, member_end):
+                    if dense_field == _DENSE_IDS_FIELD:
+                        ids = block[ids_start:ids_end]
+                        counts['nodes'] += len(ids.translate(None, _VARINT_CONTINUATION))
+            elif kind in _GROUP_ELEMENTS:
+                counts[_GROUP_ELEMENTS[kind]] += 1
+
+
+def count_elements(data: bytes) -> Dict[str, int]:
+    """
+    Count the nodes, ways and relations in PBF data (e.g. a segment of PBFBlocks).
+
+    Blocks are decompressed again, but elements are not decoded: dense
+    node ids are counted by their varint bytes, other elements by their
+    message headers. ValueError for compression other than zlib or lzma.
+    """
+    counts = {'nodes': 0, 'ways': 0, 'relations': 0}
+    pos = 0
+    while pos < len(data):
+        (header_length,) = struct.unpack_from('>I', data, pos)
+        pos += 4
+        blob_type, datasize = _parse_blob_header(data[pos:pos + header_length])
+        pos += header_length
+        if blob_type == 'OSMData':
+            for field, start, end in _fields(data, pos, pos + datasize):
+                if field in _BLOB_DATA:
+                    decompress = _BLOB_DATA[field]
+                    _count_block(decompress(data[start:end]) if decompress else data[start:end],
+                                 counts)
+                    break
+            else:
+                raise ValueError("Unsupported PBF block compression")
+        pos += datasize
+    return counts
+
+
+class PBFBlocks:
+    """
+    Offsets of the data blocks of a PBF file.
+
+    Only the small BlobHeaders are read; segments() then hands out runs of
+    whole blocks (with the OSMHeader in front) that libosmium can read as
+    a complete file, e.g. through osmium.io.FileBuffer. split() divides
+    the file into block ranges for parallel workers.
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.header: Optional[Block] = None
+        self.blocks: List[Block] = []
+
+        size = self.filename.stat().st_size
+        with open(self.filename, 'rb') as f:
+            offset = 0
+            while offset < size:
+                f.seek(offset)
+                (header_length,) = struct.unpack('>I', f.read(4))
+                blob_type, datasize = _parse_blob_header(f.read(header_length))
+                block = Block(offset, 4 + header_length + datasize)
+                if blob_type == 'OSMHeader':
+                    self.header = block
+                elif blob_type == 'OSMData':
+                    self.blocks.append(block)
+                offset += block.length
+        if self.header is None:
+            raise ValueError(f"No OSMHeader block in {self.filename}")
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    @property
+    def end(self) -> int:
+        """Offset just behind the last block"""
+        return self.blocks[-1].offset + self.blocks[-1].length if self.blocks else 0
+
+    def segments(self, start: int = 0, segment_bytes: int = 32 * 2**20,
+                 end: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Yield (start_offset, end_offset, data) for runs of blocks in [start, end).
+
+        Each run holds at least one block and about segment_bytes of them;
+        data is a complete PBF file (OSMHeader first). Offsets are block
+        boundaries, so an end_offset can be used as a later start.
+        """
+        end = self.end if end is None else end
+        selected = [block for block in self.blocks if start <= block.offset < end]
+        with open(self.filename, 'rb') as f:
+            f.seek(self.header.offset)
+            header = f.read(self.header.length)
+            i = 0
+            while i < len(selected):
+                j = i + 1
+                while (j < len(selected)
+                       and selected[j].offset + selected[j].length - selected[i].offset <= segment_bytes):
+                    j += 1
+                first_offset = selected[i].offset
+                end_offset = selected[j - 1].offset + selected[j - 1].length
+                f.seek(first_offset)
+                yield first_offset, end_offset, header + f.read(end_offset - first_offset)
+                i = j
+
+    def split(self, parts: int) -> List[tuple]:
+        """
+        Split the blocks into up to `parts` contiguous runs of about equal size.
+
+        Returns (start_offset, end_offset) pairs in file order, for
+        segments(start, end=end); every run holds at least one block.
+        """
+        if not self.blocks:
+            return []
+        total = self.end - self.blocks[0].offset
+        ranges = []
+        start = self.blocks[0].offset
+        for block in self.blocks[1:]:
+            # Cut in front of the first block past the next equal share
+            if (len(ranges) < parts - 1
+                    and block.offset - self.blocks[0].offset >= total * (len(ranges) + 1) / parts):
+                ranges.append((start, block.offset))
+                start = block.offset
+        ranges.append((start, self.end))
+        return ranges
@@ -0,0 +1,88 @@
+# Compact in-memory storage for extracted records
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+# Columns with more distinct strings than this stop deduplicating them
+# (names, phone numbers, ... would only grow the lookup table)
+MAX_SHARED_STRINGS = 4096
+
+_ARRAY_TYPES = {float: 'd', int: 'q'}
+
+
+class _StringColumn:
+    """List of strings that shares equal values while the column has few of them"""
+
+    __slots__ = ('values', 'shared')
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.shared: Optional[Dict[str, str]] = {}
+
+    def append(self, value: str) -> None:
+        if self.shared is not None:
+            value = self.shared.setdefault(value, value)
+            if len(self.shared) > MAX_SHARED_STRINGS:
+                self.shared = None
+        self.values.append(value)
+
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self.values)
+        seen = set()
+        for value in self.values:
+            if id(value) not in seen:
+                seen.add(id(value))
+                size += sys.getsizeof(value)
+        return size
+
+
+class RecordColumns:
+    """
+    Column-oriented list of flat records that all have the same keys.
+
+    Numbers go into typed arrays and strings into lists in which repeated
+    values (highway types, empty tags, city names, ...) share one object,
+    so a record costs a few machine words per field instead of a dict.
+    The keys and column types are taken from the first record; iterating
+    yields the records as dicts again, in insertion order.
+    """
+
+    __slots__ = ('fields', 'columns')
+
+    def __init__(self):
+        self.fields: Optional[List[str]] = None
+        self.columns: List[Any] = []
+
+    def _init_columns(self, record: Dict) -> None:
+        self.fields = list(record)
+        for value in record.values():
+            typecode = _ARRAY_TYPES.get(type(value))
+            self.columns.append(array(typecode) if typecode else _StringColumn())
+
+    def append(self, record: Dict) -> None:
+        if self.fields is None:
+            self._init_columns(record)
+        elif len(record) != len(self.fields):
+            raise ValueError(f"Record fields {list(record)} do not match {self.fields}")
+        for field, column in zip(self.fields, self.columns):
+            column.append(record[field])
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self.fields is None:
+            return iter(())
+        columns = [c.values if isinstance(c, _StringColumn) else c for c in self.columns]
+        return (dict(zip(self.fields, row)) for row in zip(*columns))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the stored values"""
+        return sum(
+            column.nbytes() if isinstance(column, _StringColumn) else sys.getsizeof(column)
+            for column in self.columns
+        )
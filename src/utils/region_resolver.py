@@ -0,0 +1,140 @@
+# Overpass area ids of the extracted regions
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import CONFIG
+
+# Overpass derives the id of the area of a relation by adding this offset
+AREA_ID_OFFSET = 3600000000
+
+REGION_ADMIN_LEVEL = '4'
+
+
+class RegionResolver:
+    """
+    Overpass area ids of regions, looked up once and kept in a JSON index.
+
+    Queries can then select a region with area(id) instead of making the
+    server search areas by name on every call. The index maps a region
+    name to its boundary relation, area id and bounding box; it is re-read
+    before a lookup and merged on write, so several extractors can share
+    it. A name without an admin_level 4 boundary in Turkey raises a
+    ValueError. Delete an entry from the file to look the region up again.
+    """
+
+    def __init__(self, filename=None, admin_level: str = REGION_ADMIN_LEVEL):
+        self.filename = Path(filename or CONFIG['region_index'])
+        self.admin_level = admin_level
+        self.regions: Dict[str, Dict] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+        self._load()
+
+    def _load(self) -> None:
+        if self.filename.exists():
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                self.regions.update(json.load(f))
+
+    def _save(self) -> None:
+        regions = dict(self.regions)
+        if self.filename.exists():
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                regions = {**json.load(f), **regions}
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.filename.with_name(self.filename.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(regions, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.filename)
+        self.regions = regions
+
+    def _query(self, region_name: str) -> str:
+        return f"""
+        [out:json][timeout:60];
+        area["name:en"="Turkey"]["admin_level"="2"]->.country;
+        relation["boundary"="administrative"]["admin_level"="{self.admin_level}"]["name"="{region_name}"](area.country);
+        out ids bb;
+        """
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Locks belong to one event loop; extractors run one loop per stage
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _cached(self, region_name: str) -> Optional[Dict]:
+        entry = self.regions.get(region_name)
+        # Entries written before bounding boxes were kept are looked up again
+        if entry is None or 'bounds' not in entry:
+            return None
+        return entry
+
+    async def _entry(self, client, region_name: str) -> Dict:
+        entry = self._cached(region_name)
+        if entry is not None:
+            return entry
+
+        async with self._get_lock():
+            self._load()
+            entry = self._cached(region_name)
+            if entry is not None:
+                return entry
+
+            relations = await client.stream(
+                self._query(region_name),
+                lambda elements: sorted((e['id'], e.get('bounds')) for e in elements
+                                        if e['type'] == 'relation'),
+                kind='resolve'
+            )
+            if not relations:
+                raise ValueError(f"Region {region_name!r} does not match an admin_level "
+                                 f"{self.admin_level} boundary in Turkey on Overpass")
+            relation_id, bounds = relations[0]
+            if len(relations) > 1:
+                logging.warning(f"Region {region_name!r} matches relations "
+                                f"{[r for r, _ in relations]}, using {relation_id}")
+            if bounds is None:
+                raise ValueError(f"Overpass returned no bounding box for region {region_name!r}")
+
+            self.regions[region_name] = {
+                'relation_id': relation_id,
+                'area_id': AREA_ID_OFFSET + relation_id,
+                'admin_level': self.admin_level,
+                'bounds': [bounds['minlat'], bounds['minlon'], bounds['maxlat'], bounds['maxlon']],
+                'resolved_at': datetime.now().isoformat(timespec='seconds')
+            }
+            self._save()
+            logging.info(f"Resolved region {region_name} to relation {relation_id}")
+            return self.regions[region_name]
+
+    async def resolve(self, client, region_name: str) -> int:
+        """Area id of a region, from the index or looked up with an OverpassClient"""
+        return (await self._entry(client, region_name))['area_id']
+
+    async def bounds(self, client, region_name: str) -> Tuple[float, float, float, float]:
+        """Bounding box (south, west, north, east) of a region's boundary relation"""
+        return tuple((await self._entry(client, region_name))['bounds'])
+
+    async def resolve_all(self, client, region_names: Iterable[str]) -> Dict[str, int]:
+        """
+        Area ids of several regions.
+
+        Raises one ValueError naming every region that does not resolve,
+        before any region query is sent.
+        """
+        region_names = list(region_names)
+        results = await asyncio.gather(*(self.resolve(client, name) for name in region_names),
+                                       return_exceptions=True)
+        missing = [name for name, result in zip(region_names, results) if isinstance(result, ValueError)]
+        if missing:
+            raise ValueError(f"Regions without an admin_level {self.admin_level} boundary on "
+                             f"Overpass: {', '.join(missing)}")
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return dict(zip(region_names, results))
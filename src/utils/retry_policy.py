@@ -0,0 +1,152 @@
+# When and how long to wait before retrying a failed Overpass query
+import logging
+import random
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import overpy
+import requests
+
+from config import CONFIG
+
+# Error classes (see classify)
+FATAL = 'fatal'
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+
+DEFAULT_MAX_DELAY = 300
+
+# /api/status lines telling when the next slot frees up
+_SLOTS_NOW = re.compile(r'^(\d+) slots available now', re.M)
+_SLOT_AFTER = re.compile(r'^Slot available after: \S+, in (-?\d+) seconds', re.M)
+
+# Seconds to wait for /api/status itself
+STATUS_TIMEOUT = 10
+
+
+def classify(error: Exception) -> str:
+    """
+    Whether a failed query is worth retrying.
+
+    RATE_LIMITED: the server refused it for lack of a free slot (429).
+    TRANSIENT: the server was overloaded or the connection failed (504,
+    5xx, a runtime error such as a timeout, network errors); the same
+    query may succeed later. FATAL: it can never succeed as sent (a
+    syntax error or another 4xx) or failed locally while parsing or
+    processing the response.
+    """
+    if isinstance(error, overpy.exception.MaxRetriesReached) and error.exceptions:
+        error = error.exceptions[-1]
+    if isinstance(error, overpy.exception.OverpassTooManyRequests):
+        return RATE_LIMITED
+    if isinstance(error, (overpy.exception.OverpassGatewayTimeout,
+                          overpy.exception.OverpassRuntimeError,
+                          overpy.exception.OverpassUnknownContentType)):
+        return TRANSIENT
+    if isinstance(error, overpy.exception.OverpassUnknownHTTPStatusCode):
+        return TRANSIENT if error.code >= 500 or error.code == 408 else FATAL
+    if isinstance(error, requests.exceptions.RequestException):
+        return TRANSIENT
+    # urllib errors of overpy.Overpass.query (URLError, socket.timeout)
+    if isinstance(error, OSError) and not isinstance(error, (FileNotFoundError, PermissionError)):
+        return TRANSIENT
+    return FATAL
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds of a Retry-After header (delay in seconds or an HTTP date), None if absent or invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def parse_status(text: str) -> Optional[float]:
+    """
+    Seconds until a query slot is free, from the text of /api/status.
+
+    0 if a slot is available now, None if the status tells neither (e.g.
+    all slots are taken by running queries with no known end).
+    """
+    m = _SLOTS_NOW.search(text)
+    if m is not None and int(m.group(1)) > 0:
+        return 0.0
+    waits = [max(int(seconds), 0) for seconds in _SLOT_AFTER.findall(text)]
+    return float(min(waits)) if waits else None
+
+
+def status_url(url: str) -> Optional[str]:
+    """The /api/status endpoint next to an /api/interpreter URL"""
+    if not url.startswith(('http://', 'https://')) or not url.rstrip('/').endswith('/interpreter'):
+        return None
+    return url.rstrip('/')[:-len('interpreter')] + 'status'
+
+
+class RetryPolicy:
+    """
+    Retry decisions for Overpass queries.
+
+    Fatal errors (see classify) are not retried. Otherwise a query is
+    tried max_retries times; the wait before the next attempt is the
+    server's Retry-After if it sent one, for a 429 the time /api/status
+    gives until a slot is free, and else an exponential backoff with
+    full jitter: a random time up to base_delay * 2**attempt, capped at
+    max_delay. Defaults come from CONFIG (max_retries, retry_delay,
+    retry_max_delay).
+    """
+
+    def __init__(self, max_retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, seed: Optional[int] = None):
+        self.max_retries = CONFIG['max_retries'] if max_retries is None else max_retries
+        self.base_delay = base_delay if base_delay is not None else CONFIG['retry_delay']
+        self.max_delay = max_delay if max_delay is not None else CONFIG.get('retry_max_delay',
+                                                                             DEFAULT_MAX_DELAY)
+        self._random = random.Random(seed)
+
+    def should_retry(self, attempt: int, error: Exception) -> bool:
+        """Whether to try again after attempt (0-based) failed with error"""
+        return attempt < self.max_retries - 1 and classify(error) != FATAL
+
+    def needs_status(self, error: Exception) -> bool:
+        """Whether wait_time would use /api/status for this error"""
+        return classify(error) == RATE_LIMITED and getattr(error, 'retry_after', None) is None
+
+    def fetch_status(self, url: str, session: Optional[requests.Session] = None) -> Optional[str]:
+        """Text of the endpoint's /api/status (blocking), None if it has none or it failed"""
+        endpoint = status_url(url)
+        if endpoint is None:
+            return None
+        try:
+            response = (session or requests).get(endpoint, timeout=STATUS_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logging.debug(f"Overpass status {endpoint} unavailable: {e}")
+            return None
+        return response.text if response.status_code == 200 else None
+
+    def backoff(self, attempt: int) -> float:
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def cooldown(self, failures: int) -> float:
+        """Seconds to avoid an endpoint after `failures` failures in a row (backoff without jitter)"""
+        return min(self.max_delay, self.base_delay * 2 ** max(failures - 1, 0))
+
+    def wait_time(self, attempt: int, error: Exception, status: Optional[str] = None) -> float:
+        """Seconds to wait before retrying after attempt (0-based); status is the /api/status text"""
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        if status is not None and classify(error) == RATE_LIMITED:
+            slot_wait = parse_status(status)
+            if slot_wait is not None:
+                return min(slot_wait, self.max_delay)
+        return self.backoff(attempt)
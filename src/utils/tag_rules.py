@@ -0,0 +1,77 @@
+# Compiled POI tag rules shared by the Overpass and PBF extractors
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class TagRule(NamedTuple):
+    """One 'key=value' filter of a POI category"""
+    category: str
+    key: str
+    value: str
+
+    @property
+    def filter(self) -> str:
+        return f"{self.key}={self.value}"
+
+    def overpass(self) -> str:
+        """Overpass QL tag selector, e.g. ["amenity"="hospital"]"""
+        return f'["{self.key}"="{self.value}"]'
+
+
+class TagRules:
+    """
+    POI category filters compiled into a hash lookup.
+
+    The filters of every category (strings like 'amenity=hospital' or
+    'railway=station', as in config.POI_CATEGORIES) are indexed by their
+    (key, value) pair, so matching an element costs one dict lookup per
+    tag instead of a scan over all categories. If several filters match,
+    the one listed first in the configuration wins.
+    """
+
+    def __init__(self, categories: Dict[str, Dict]):
+        self.rules: List[TagRule] = []
+        self._lookup: Dict[Tuple[str, str], int] = {}
+
+        for category, config in categories.items():
+            for filter_str in config['filters']:
+                key, sep, value = filter_str.partition('=')
+                if not sep or not key or not value:
+                    raise ValueError(f"Invalid POI filter {filter_str!r} in category {category!r}")
+                if (key, value) in self._lookup:
+                    continue  # Listed under an earlier category
+                self._lookup[(key, value)] = len(self.rules)
+                self.rules.append(TagRule(category, key, value))
+
+    def match(self, tags) -> Optional[TagRule]:
+        """
+        Return the rule matching a set of tags, or None.
+
+        tags is a dict or an osmium TagList (any iterable of key/value pairs).
+        """
+        pairs = tags.items() if hasattr(tags, 'items') else tags
+        best = None
+        for key, value in pairs:
+            position = self._lookup.get((key, value))
+            if position is not None and (best is None or position < best):
+                best = position
+        return self.rules[best] if best is not None else None
+
+    def tag_pairs(self) -> List[Tuple[str, str]]:
+        """All (key, value) pairs, e.g. for an osmium TagFilter"""
+        return [(rule.key, rule.value) for rule in self.rules]
+
+    def keys(self) -> List[str]:
+        """Distinct tag keys used by the rules"""
+        return list(dict.fromkeys(rule.key for rule in self.rules))
+
+    def for_category(self, category: str) -> List[TagRule]:
+        return [rule for rule in self.rules if rule.category == category]
+
+    def categories(self) -> List[str]:
+        return list(dict.fromkeys(rule.category for rule in self.rules))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __iter__(self) -> Iterable[TagRule]:
+        return iter(self.rules)
@@ -3,8 +3,11 @@ import time
 import logging
 import json
 from datetime import datetime
-from typing import Dict, List, Any
+from pathlib import Path
+from typing import Dict, List, Any, Optional
 import overpy
+from .columnar import write_parquet
+from .retry_policy import RetryPolicy
 
 def setup_logging(log_file: str) -> logging.Logger:
     """Setup logging configuration"""
@@ -36,23 +39,43 @@ def save_json(data: Any, filename: str) -> None:
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
+def save_records(records: List[Dict], filename: str, output_format: str = 'json',
+                 schema: Optional[Any] = None) -> str:
+    """Save a list of records as JSON or as Parquet (same name, .parquet suffix)"""
+    if output_format == 'parquet':
+        filename = str(Path(filename).with_suffix('.parquet'))
+        write_parquet(records, filename, schema)
+    else:
+        save_json(records, filename)
+    return filename
+
 def load_json(filename: str) -> Any:
     """Load data from JSON file"""
     with open(filename, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def execute_query_with_retry(api: overpy.Overpass, query: str, max_retries: int = 3) -> overpy.Result:
-    """Execute Overpass query with retry logic"""
-    for attempt in range(max_retries):
+def execute_query_with_retry(api: overpy.Overpass, query: str, max_retries: Optional[int] = None,
+                             policy: Optional[RetryPolicy] = None) -> overpy.Result:
+    """Execute Overpass query with retry logic
+    
+    Retries follow a RetryPolicy (by default from max_retries and
+    CONFIG): fatal errors such as syntax errors are raised at once, a 429
+    waits until /api/status reports a free slot and other failures back
+    off exponentially with jitter.
+    """
+    policy = policy or RetryPolicy(max_retries)
+    attempt = 0
+    while True:
         try:
             return api.query(query)
         except Exception as e:
-            if attempt < max_retries - 1:
-                wait_time = 30 * (attempt + 1)
-                logging.warning(f"Query failed (attempt {attempt + 1}), retrying in {wait_time}s: {e}")
-                time.sleep(wait_time)
-            else:
+            if not policy.should_retry(attempt, e):
                 raise e
+            status = policy.fetch_status(api.url) if policy.needs_status(e) else None
+            wait_time = policy.wait_time(attempt, e, status)
+            logging.warning(f"Query failed (attempt {attempt + 1}), retrying in {wait_time:.1f}s: {e}")
+            time.sleep(wait_time)
+            attempt += 1
 
 def extract_address_from_tags(tags: Dict) -> str:
     """Extract complete address from OSM tags"""
@@ -0,0 +1,77 @@
+import json
+import sys
+from pathlib import Path
+
+import osmium
+import pytest
+
+# The extraction scripts import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+CITIES = ['Ankara', 'İzmir', 'Bursa']
+POI_AMENITIES = ['school', 'hospital', 'pharmacy', 'bank']
+
+
+def write_sample_pbf(filename, streets=6000):
+    """
+    A small PBF file spanning several blocks of each element type.
+
+    Every street is a named highway of four nodes, every tenth street node
+    a POI; streets, POIs, closed-way POIs and multipolygon POIs are spread
+    over CITIES by addr:city.
+    """
+    m = osmium.osm.mutable
+    writer = osmium.SimpleWriter(str(filename))
+    for i in range(1, streets * 4 + 1):
+        tags = {}
+        if i % 10 == 0:
+            tags = {'amenity': POI_AMENITIES[i % 4], 'name': f"POI {i}",
+                    'addr:city': CITIES[i % 3]}
+        # Each run of four nodes is the corners of a small square
+        square, corner = divmod(i - 1, 4)
+        location = (29 + square % 100 / 100 + (corner in (1, 2)) / 1000,
+                    41 + square // 100 / 100 + (corner >= 2) / 1000)
+        writer.add_node(m.Node(id=i, location=location, tags=tags))
+    for w in range(1, streets + 1):
+        writer.add_way(m.Way(id=w, nodes=[w * 4 - 3, w * 4 - 2, w * 4 - 1, w * 4],
+                             tags={'highway': 'residential', 'name': f"Sokak {w}",
+                                   'addr:city': CITIES[w % 3]}))
+    # Closed ways: POIs themselves or the outer rings of multipolygons
+    for w in range(streets + 1, streets + 301):
+        start = (w - streets) * 4 - 3
+        tags = {}
+        if w % 2:
+            tags = {'amenity': POI_AMENITIES[w % 4], 'name': f"Area {w}",
+                    'addr:city': CITIES[w % 3]}
+        writer.add_way(m.Way(id=w, nodes=[start, start + 1, start + 2, start + 3, start],
+                             tags=tags))
+    for r, w in enumerate(range(streets + 2, streets + 301, 2), start=1):
+        writer.add_relation(m.Relation(
+            id=r, members=[('w', w, 'outer')],
+            tags={'type': 'multipolygon', 'amenity': 'school', 'name': f"Campus {r}",
+                  'addr:city': CITIES[r % 3]}))
+    writer.close()
+    return filename
+
+
+@pytest.fixture
+def sample_pbf(tmp_path):
+    return write_sample_pbf(tmp_path / 'sample.osm.pbf')
+
+
+def read_outputs(output_dir):
+    """Records of the city and boundary files of any output format, without timestamps"""
+    outputs = {}
+    for path in sorted(Path(output_dir).iterdir()):
+        if path.name.startswith('extraction_summary'):
+            continue
+        if path.suffix == '.json':
+            data = json.loads(path.read_text(encoding='utf-8'))
+            data.pop('extracted_at', None)
+            outputs[path.name] = data
+        elif path.suffix == '.ndjson':
+            outputs[path.name] = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        elif path.suffix == '.parquet':
+            import pyarrow.parquet as pq
+            outputs[path.name] = pq.read_table(path).to_pylist()
+    return outputs
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import extract_from_pbf
+from extract_from_pbf import CHECKPOINT_MANIFEST, ExtractionCheckpoint, TurkeyExtractor
+from .conftest import read_outputs
+
+FORMATS = ['json', 'ndjson', 'parquet']
+
+
+@pytest.fixture(autouse=True)
+def one_block_segments(monkeypatch):
+    # A checkpoint after every block of the small sample file
+    monkeypatch.setattr(extract_from_pbf, 'SEGMENT_BYTES', 1)
+
+
+def extract(pbf_file, output_dir, output_format, checkpoint=None):
+    output_dir.mkdir(exist_ok=True)
+    output = extract_from_pbf.make_output(output_format, output_dir)
+    handler = extract_from_pbf.run_extraction(str(pbf_file), output=output, checkpoint=checkpoint)
+    extract_from_pbf.write_outputs(handler, output, output_dir, str(pbf_file))
+    return handler
+
+
+def interrupt_after(monkeypatch, segments):
+    """Make the main pass fail like a killed process once `segments` segments were read"""
+    apply_segment = TurkeyExtractor.apply_segment
+    calls = []
+
+    def interrupted(self, data, chain):
+        if len(calls) == segments:
+            raise KeyboardInterrupt("preempted")
+        calls.append(data)
+        apply_segment(self, data, chain)
+
+    monkeypatch.setattr(TurkeyExtractor, 'apply_segment', interrupted)
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_checkpointed_run_matches_plain_run(tmp_path, sample_pbf, output_format):
+    plain = extract(sample_pbf, tmp_path / 'plain', output_format)
+    checkpoint = ExtractionCheckpoint(tmp_path / 'checkpoint', sample_pbf, output_format, interval=0)
+    checkpointed = extract(sample_pbf, tmp_path / 'out', output_format, checkpoint)
+
+    assert read_outputs(tmp_path / 'out') == read_outputs(tmp_path / 'plain')
+    assert checkpointed.stats == plain.stats
+    assert list((tmp_path / 'checkpoint').iterdir()) == []
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+@pytest.mark.parametrize('segments', [1, 3])
+def test_resume_after_interruption(tmp_path, monkeypatch, sample_pbf, output_format, segments):
+    plain = extract(sample_pbf, tmp_path / 'plain', output_format)
+    directory = tmp_path / 'checkpoint'
+
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, segments)
+        with pytest.raises(KeyboardInterrupt):
+            extract(sample_pbf, tmp_path / 'out', output_format,
+                    ExtractionCheckpoint(directory, sample_pbf, output_format, interval=0))
+    manifest = json.loads((directory / CHECKPOINT_MANIFEST).read_text(encoding='utf-8'))
+    assert manifest['offset'] > 0
+    assert len(manifest['parts']) == segments
+    # The part being written when the run stopped is incomplete
+    assert (directory / f"part-{segments}").exists()
+
+    checkpoint = ExtractionCheckpoint(directory, sample_pbf, output_format, interval=0, resume=True)
+    assert checkpoint.resuming and not (directory / f"part-{segments}").exists()
+    resumed = extract(sample_pbf, tmp_path / 'out', output_format, checkpoint)
+
+    assert read_outputs(tmp_path / 'out') == read_outputs(tmp_path / 'plain')
+    assert resumed.stats == plain.stats
+    assert list(directory.iterdir()) == []
+
+
+def test_resume_refuses_other_input(tmp_path, sample_pbf):
+    directory = tmp_path / 'checkpoint'
+    ExtractionCheckpoint(directory, sample_pbf, 'ndjson')
+    with pytest.raises(ValueError, match="another input file or output options"):
+        ExtractionCheckpoint(directory, sample_pbf, 'parquet', resume=True)
+
+
+def test_refuses_foreign_directory(tmp_path, sample_pbf):
+    (tmp_path / 'results.json').write_text('{}')
+    with pytest.raises(ValueError, match="refusing"):
+        ExtractionCheckpoint(tmp_path, sample_pbf)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from src.utils.endpoint_pool import Endpoint, EndpointPool
+
+
+@pytest.fixture
+def pool():
+    pool = EndpointPool([Endpoint(f'https://{name}.example/api/interpreter', slots=1, rate=0)
+                         for name in ('primary', 'mirror1', 'mirror2')])
+    yield pool
+    pool.close()
+
+
+def test_needs_an_endpoint():
+    with pytest.raises(ValueError):
+        EndpointPool([])
+
+
+def test_score():
+    endpoint = Endpoint('https://a.example/api/interpreter', rate=0)
+    assert endpoint.score(0) == 0.0
+    endpoint.record(2.0, ok=True)
+    endpoint.record(4.0, ok=True)
+    assert endpoint.latency == pytest.approx(2.4)
+    endpoint.record(None, ok=False)
+    assert endpoint.failures == 1
+    assert endpoint.score(0) == pytest.approx(2.4 / (1 - 0.2))
+    endpoint.close()
+
+
+def test_ranking(pool):
+    primary, mirror1, mirror2 = pool.endpoints
+    # Unmeasured endpoints (score 0) are tried first, in order
+    assert pool._choose() is primary
+    primary.record(3.0, ok=True)
+    mirror1.record(1.0, ok=True)
+    mirror2.record(1.0, ok=False)
+    assert pool._choose() is mirror1
+    mirror1.in_flight = mirror1.slots
+    assert pool._choose() is mirror2  # 1.0 / 0.8 still beats 3.0
+    mirror2.in_flight = mirror2.slots
+    assert pool._choose() is primary
+    primary.in_flight = primary.slots
+    assert pool._choose() is None
+
+
+def test_failover(pool):
+    primary, mirror1, mirror2 = pool.endpoints
+    for endpoint in pool.endpoints:
+        endpoint.record(1.0, ok=True)
+    primary.cool_down(60)
+    assert pool._choose() in (mirror1, mirror2)
+    assert pool.alternative(mirror1) is mirror2
+    mirror1.cool_down(60)
+    mirror2.cool_down(60)
+    assert pool.alternative(mirror1) is None
+    # With every endpoint cooling down, the one free again first is used
+    primary.cooldown_until -= 30
+    assert pool._choose() is primary
+
+
+def test_acquire_waits_for_a_slot(pool):
+    async def scenario():
+        taken = [await pool.acquire() for _ in pool.endpoints]
+        waiting = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await pool.release(taken[1])
+        assert await asyncio.wait_for(waiting, 1) is taken[1]
+        return taken
+
+    taken = asyncio.run(scenario())
+    assert taken == pool.endpoints
+    assert [endpoint.in_flight for endpoint in pool.endpoints] == [1, 1, 1]
@@ -21,8 +21,8 @@ TEST_DISTRICT = "Kadıköy"  # Well-known district with lots of data
 OUTPUT_DIR = "test_output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Overpass API endpoint
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+# Overpass API endpoint (OVERPASS_URL can point to benchmarks/overpass_server.py instead)
+OVERPASS_URL = os.environ.get('OVERPASS_URL', "https://overpass-api.de/api/interpreter")
 
 
 class OSMTestExtractor:
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from src.utils.geometry_store import (
+    GeometryStore, GeometryWriter, decode_varints, encode_varints, merge_geometry_stores
+)
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, -1, 63, -64, 64, -65, 8191, -8192, 2**31 - 1, -2**31, 1_234_567, -89_012_345])
+    data, sizes = encode_varints(values)
+    assert len(data) == sizes.sum()
+    assert sizes.tolist()[:7] == [1, 1, 1, 1, 1, 2, 2]
+    assert sizes.tolist()[9:11] == [5, 5]
+    assert decode_varints(data).tolist() == values.tolist()
+
+
+def test_varint_empty():
+    data, sizes = encode_varints(np.zeros(0, dtype=np.int64))
+    assert data == b'' and len(sizes) == 0
+    assert len(decode_varints(data)) == 0
+
+
+def test_store_lookup(tmp_path):
+    lines = {
+        42: [(41.0082, 28.9784), (41.0090, 28.9801), (41.0075, 28.9760)],
+        7: [(39.9334, 32.8597), (39.9336, 32.8601)],
+        -3: [(-33.8688, -151.2093)],
+        100: [],
+    }
+    filename = tmp_path / 'streets.geom'
+    writer = GeometryWriter(filename, batch_size=2)
+    for way_id, coords in lines.items():
+        writer.add(way_id, coords)
+    assert len(writer) == 4
+    writer.close()
+
+    with GeometryStore(filename) as store:
+        assert len(store) == 4
+        assert list(store) == [-3, 7, 42, 100]
+        for way_id, coords in lines.items():
+            assert store.get(way_id) == pytest.approx(coords, abs=1e-7)
+        assert store.get_e7(42)[0].tolist() == [410082000, 289784000]
+        assert 5 not in store
+        with pytest.raises(KeyError):
+            store.get(5)
+
+
+def test_merge_stores(tmp_path):
+    sources = []
+    for part, way_ids in enumerate([[1, 3], [2]]):
+        sources.append(tmp_path / f'part{part}.geom')
+        writer = GeometryWriter(sources[-1])
+        for way_id in way_ids:
+            writer.add(way_id, [(40 + way_id / 10, 30.0), (40.0, 30 + way_id / 10)])
+        writer.close()
+
+    assert merge_geometry_stores(sources, tmp_path / 'merged.geom') == 3
+    with GeometryStore(tmp_path / 'merged.geom') as store:
+        assert list(store) == [1, 2, 3]
+        assert store.get(2) == pytest.approx([(40.2, 30.0), (40.0, 30.2)])
+
+
+def test_not_a_store(tmp_path):
+    (tmp_path / 'bad.geom').write_bytes(b'nope')
+    (tmp_path / 'bad.geom.idx').write_bytes(b'nope')
+    with pytest.raises(ValueError):
+        GeometryStore(tmp_path / 'bad.geom')
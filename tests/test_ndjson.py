@@ -0,0 +1,56 @@
+from src.utils.ndjson import NDJSONWriterPool, dump_record, iter_ndjson, merge_ndjson
+
+
+def write(path, records):
+    path.write_text(''.join(dump_record(record) for record in records), encoding='utf-8')
+    return path
+
+
+def test_dump_record():
+    assert dump_record({'name': 'Üsküdar', 'id': 1}) == '{"name":"Üsküdar","id":1}\n'
+
+
+def test_merge_ordering(tmp_path):
+    sources = [
+        write(tmp_path / 'a.ndjson', [{'_seq': 1}, {'_seq': 4}, {'_seq': 9}]),
+        write(tmp_path / 'b.ndjson', [{'_seq': 2}, {'_seq': 3}]),
+        write(tmp_path / 'c.ndjson', []),
+        write(tmp_path / 'd.ndjson', [{'_seq': 0}, {'_seq': 10}]),
+    ]
+    target = tmp_path / 'merged.ndjson'
+
+    def strip(record):
+        return {'id': record.pop('_seq')}
+
+    assert merge_ndjson(sources, target, key=lambda record: record['_seq'], transform=strip) == 7
+    assert [record['id'] for record in iter_ndjson(target)] == [0, 1, 2, 3, 4, 9, 10]
+
+
+def test_merge_keeps_source_order_of_equal_keys(tmp_path):
+    sources = [
+        write(tmp_path / 'a.ndjson', [{'k': 1, 'src': 'a'}, {'k': 2, 'src': 'a'}]),
+        write(tmp_path / 'b.ndjson', [{'k': 1, 'src': 'b'}]),
+    ]
+    merge_ndjson(sources, tmp_path / 'merged.ndjson', key=lambda record: record['k'])
+    assert [record['src'] for record in iter_ndjson(tmp_path / 'merged.ndjson')] == ['a', 'b', 'a']
+
+
+def test_writer_pool_reopens_closed_files(tmp_path):
+    pool = NDJSONWriterPool(max_open_files=2)
+    paths = [tmp_path / f'{name}.ndjson' for name in 'xyz']
+    for i in range(9):
+        pool.write(paths[i % 3], {'i': i})
+        assert len(pool._files) <= 2
+    pool.close()
+
+    for n, path in enumerate(paths):
+        assert [record['i'] for record in iter_ndjson(path)] == [n, n + 3, n + 6]
+    assert set(pool.counts.values()) == {3}
+
+
+def test_writer_pool_truncates_on_first_write(tmp_path):
+    path = write(tmp_path / 'old.ndjson', [{'stale': True}])
+    pool = NDJSONWriterPool()
+    pool.write(path, {'fresh': True})
+    pool.close()
+    assert list(iter_ndjson(path)) == [{'fresh': True}]
@@ -0,0 +1,71 @@
+import time
+
+from src.utils import overpass_cache
+from src.utils.overpass_cache import OverpassCache, normalize_query
+
+URL = 'https://overpass-api.de/api/interpreter'
+
+
+def test_normalize_query():
+    assert normalize_query('  [out:json];\n  node["name"="A  B"]\n\t(1,2,3,4);  out; ') == \
+        '[out:json]; node["name"="A  B"] (1,2,3,4); out;'
+
+
+def test_round_trip(tmp_path):
+    cache = OverpassCache(tmp_path)
+    data = b'{"elements": []}' * 1000
+    assert cache.get(URL, 'out;') is None
+    cache.put(URL, 'out;', data, kind='admin')
+    assert cache.get(URL, '  out;\n', kind='admin') == data
+    assert cache.get('https://mirror.example/api/interpreter', 'out;') is None
+    assert len(cache) == 1 and cache.size() < len(data)
+    cache.close()
+
+
+def test_discarded_writer_leaves_no_entry(tmp_path):
+    cache = OverpassCache(tmp_path)
+    writer = cache.writer(URL, 'out;')
+    writer.write(b'{"elements": [')
+    writer.discard()
+    assert cache.get(URL, 'out;') is None
+    assert list(tmp_path.rglob('*.tmp')) == []
+    cache.close()
+
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(overpass_cache.time, 'time', lambda: now[0])
+    cache = OverpassCache(tmp_path, ttls={'admin': 100, 'poi': 10})
+    cache.put(URL, 'admin;', b'a', kind='admin')
+    cache.put(URL, 'poi;', b'p', kind='poi')
+
+    now[0] += 50
+    assert cache.get(URL, 'admin;', kind='admin') == b'a'
+    assert cache.get(URL, 'poi;', kind='poi') is None  # Expired entries are dropped on lookup
+    assert len(cache) == 1
+
+    now[0] += 60
+    assert cache.prune() == 1
+    assert len(cache) == 0 and list(tmp_path.rglob('*.z')) == []
+    cache.close()
+
+
+def test_lru_eviction(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(overpass_cache.time, 'time', lambda: now[0])
+    cache = OverpassCache(tmp_path)
+    for name in 'abc':
+        now[0] += 1
+        cache.put(URL, name, name.encode() * 100)
+    entry_size = cache.size() // 3
+
+    now[0] += 1
+    assert cache.get(URL, 'a') is not None  # 'b' is now the least recently used
+    cache.max_bytes = 3 * entry_size
+    now[0] += 1
+    cache.put(URL, 'd', b'd' * 100)
+
+    assert cache.get(URL, 'b') is None
+    assert all(cache.get(URL, name) is not None for name in 'acd')
+    assert cache.size() <= cache.max_bytes
+    cache.close()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+
+import overpy
+import pytest
+
+from src.utils.endpoint_pool import Endpoint, EndpointPool, TokenBucket
+from src.utils.overpass_client import OverpassClient
+
+BODY = json.dumps({
+    'version': 0.6,
+    'elements': [{'type': 'node', 'id': 1, 'lat': 41.0, 'lon': 29.0, 'tags': {'name': 'A'}}]
+}).encode()
+
+STATUS_FREE = "Rate limit: 2\n2 slots available now.\n"
+
+
+class StubResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = body.decode()
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class StubSession:
+    """Answers the queries in turn with the given (status, body, headers), the last one forever"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.posts = 0
+        self.status_requests = 0
+
+    def post(self, url, data=None, timeout=None, stream=False):
+        answer = self.answers[min(self.posts, len(self.answers) - 1)]
+        self.posts += 1
+        return StubResponse(*answer)
+
+    def get(self, url, timeout=None):
+        self.status_requests += 1
+        return StubResponse(200, STATUS_FREE.encode())
+
+    def close(self):
+        pass
+
+
+def stub_endpoint(name, *answers, rate=0):
+    endpoint = Endpoint(f'https://{name}.test/api/interpreter', slots=1, rate=rate)
+    endpoint.session.close()
+    endpoint.session = StubSession(*answers)
+    return endpoint
+
+
+def make_client(*endpoints, max_retries=3):
+    return OverpassClient(pool=EndpointPool(list(endpoints)), cache=False,
+                          max_retries=max_retries, retry_delay=0)
+
+
+def test_bucket_burst_then_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=2)
+        burst = [await bucket.acquire() for _ in range(2)]
+        return burst, await bucket.acquire()
+
+    burst, waited = asyncio.run(scenario())
+    assert max(burst) < 0.01
+    assert 1 / 20 - 0.005 <= waited < 1 / 20 + 0.1
+
+
+def test_bucket_waits_after_drain():
+    async def scenario():
+        bucket = TokenBucket(rate=10, capacity=4)
+        bucket.tokens = 0.5
+        bucket.updated = time.monotonic()
+        partial = await bucket.acquire()
+        bucket.drain()
+        return partial, await bucket.acquire()
+
+    partial, drained = asyncio.run(scenario())
+    # Sleeps may overrun on a busy machine, but never end early
+    assert (1 - 0.5) / 10 - 0.005 <= partial < (1 - 0.5) / 10 + 0.1
+    assert 1 / 10 - 0.005 <= drained < 1 / 10 + 0.1
+
+
+def test_retries_a_429_on_the_same_endpoint():
+    endpoint = stub_endpoint('single', (429, b''), (200, BODY))
+    client = make_client(endpoint)
+    try:
+        result = client.query_sync('node(1); out;')
+    finally:
+        client.close()
+    assert [node.tags['name'] for node in result.nodes] == ['A']
+    assert endpoint.session.posts == 2
+    # Without a Retry-After the wait comes from /api/status
+    assert endpoint.session.status_requests == 1
+    assert endpoint.failures == 0
+
+
+def test_fails_over_to_a_mirror_after_a_429():
+    primary = stub_endpoint('primary', (429, b'', {'Retry-After': '30'}), rate=0.001)
+    mirror = stub_endpoint('mirror', (200, BODY))
+    client = make_client(primary, mirror)
+    try:
+        start = time.monotonic()
+        result = client.query_sync('node(1); out;')
+        elapsed = time.monotonic() - start
+    finally:
+        client.close()
+    assert len(result.nodes) == 1
+    assert primary.session.posts == 1 and mirror.session.posts == 1
+    # The query did not wait for the Retry-After; the primary cools down for it instead
+    assert elapsed < 5
+    assert primary.cooldown_until >= start + 30
+    assert primary.bucket.tokens < 1
+
+
+def test_gives_up_after_max_retries():
+    endpoint = stub_endpoint('busy', (429, b'', {'Retry-After': '0'}))
+    client = make_client(endpoint, max_retries=3)
+    try:
+        with pytest.raises(overpy.exception.OverpassTooManyRequests):
+            client.query_sync('node(1); out;')
+    finally:
+        client.close()
+    assert endpoint.session.posts == 3
+
+
+def test_bad_request_is_not_retried():
+    endpoint = stub_endpoint('syntax', (400, b'<p><strong>Error</strong>: line 1: parse error</p>'))
+    mirror = stub_endpoint('syntax-mirror', (200, BODY))
+    client = make_client(endpoint, mirror)
+    try:
+        with pytest.raises(overpy.exception.OverpassBadRequest):
+            client.query_sync('node(1) out;')
+    finally:
+        client.close()
+    assert endpoint.session.posts + mirror.session.posts == 1
@@ -0,0 +1,71 @@
+import json
+
+import overpy
+import pytest
+
+from src.utils.overpass_stream import NodeCoordinates, iter_elements
+
+ELEMENTS = [
+    {'type': 'node', 'id': 1, 'lat': 41.0, 'lon': 29.0, 'tags': {'name': 'Kadıköy İskelesi'}},
+    {'type': 'way', 'id': 2, 'nodes': [1, 3], 'tags': {'highway': 'residential', 'note': 'a ] b'}},
+    {'type': 'relation', 'id': 3, 'members': [], 'tags': {'name': '"quoted" {braces}'}},
+]
+
+
+def response(elements=ELEMENTS, remark=None) -> bytes:
+    body = {'version': 0.6, 'osm3s': {'copyright': 'ODbL'}, 'elements': elements}
+    if remark is not None:
+        body['remark'] = remark
+    return json.dumps(body, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 10_000])
+def test_elements_split_across_chunks(size):
+    # Small chunk sizes also split multi-byte UTF-8 characters
+    assert list(iter_elements(chunked(response(), size))) == ELEMENTS
+
+
+def test_empty_element_list():
+    assert list(iter_elements([response([])])) == []
+
+
+def test_runtime_error_remark_after_elements():
+    data = response(remark='runtime error: Query timed out in "query" at line 3 after 180 seconds.')
+    elements = []
+    with pytest.raises(overpy.exception.OverpassRuntimeError):
+        for element in iter_elements(chunked(data, 5)):
+            elements.append(element)
+    assert elements == ELEMENTS
+
+
+def test_runtime_remark():
+    with pytest.raises(overpy.exception.OverpassRuntimeRemark):
+        list(iter_elements([response(remark='runtime remark: Timeout is limited')]))
+
+
+def test_remark_without_elements():
+    data = json.dumps({'remark': 'runtime error: out of memory'}).encode()
+    with pytest.raises(overpy.exception.OverpassRuntimeError):
+        list(iter_elements([data]))
+
+
+def test_truncated_response():
+    data = response()
+    with pytest.raises(ValueError):
+        list(iter_elements(chunked(data[:len(data) // 2], 16)))
+    with pytest.raises(ValueError):
+        list(iter_elements([b'{"version": 0.6}']))
+
+
+def test_node_coordinates_keep_first():
+    nodes = NodeCoordinates()
+    nodes.add(5, 41.0, 29.0)
+    nodes.add(2, 40.0, 28.0)
+    nodes.add(5, 0.0, 0.0)
+    lats, lons = nodes.lookup([2, 9, 5])
+    assert lats.tolist() == [40.0, 41.0]
+    assert lons.tolist() == [28.0, 29.0]
@@ -0,0 +1,71 @@
+import asyncio
+
+import overpy
+import pytest
+
+from src.utils.overpass_tiles import Tile, TilePlanner, TileTooLarge, too_large
+
+
+class FakeClient:
+    """Answers tile queries with the elements whose point lies in the tile"""
+
+    def __init__(self, points, fail_above=None):
+        self.points = points
+        self.fail_above = fail_above
+        self.queries = []
+
+    async def stream(self, query, consume, kind='query', give_up=None):
+        tile = query
+        self.queries.append(tile)
+        inside = [
+            {'type': 'node', 'id': i, 'lat': lat, 'lon': lon}
+            for i, (lat, lon) in enumerate(self.points)
+            if tile.south <= lat < tile.north and tile.west <= lon < tile.east
+        ]
+        if self.fail_above is not None and len(inside) > self.fail_above:
+            raise overpy.exception.OverpassRuntimeError(msg='runtime error: Query timed out')
+        return consume(iter(inside))
+
+
+def run(planner, client, bounds=(0, 0, 4, 4)):
+    return asyncio.run(planner.run(client, bounds, lambda tile: tile,
+                                   lambda elements: [element['id'] for element in elements]))
+
+
+def test_split_quadrants():
+    quadrants = Tile(0, 0, 4, 8).split()
+    assert quadrants == [Tile(0, 0, 2, 4, 1), Tile(0, 4, 2, 8, 1), Tile(2, 0, 4, 4, 1), Tile(2, 4, 4, 8, 1)]
+    assert Tile(41, 28.5, 41.5, 29).bbox() == '(41.0000000,28.5000000,41.5000000,29.0000000)'
+
+
+def test_small_region_is_one_tile():
+    client = FakeClient([(1, 1), (3, 3)])
+    assert run(TilePlanner(max_elements=10, max_depth=3), client) == [[0, 1]]
+    assert len(client.queries) == 1
+
+
+def test_split_on_element_limit():
+    # Three points in the south-west quadrant, one in the north-east
+    client = FakeClient([(0.5, 0.5), (1.5, 0.5), (0.5, 1.5), (3, 3)])
+    results = run(TilePlanner(max_elements=2, max_depth=2), client)
+    assert results == [[0], [2], [1], [], [], [], [3]]
+    assert [tile.depth for tile in client.queries].count(2) == 4
+
+
+def test_split_on_timeout():
+    client = FakeClient([(0.5, 0.5), (3, 3), (3, 1)], fail_above=1)
+    assert run(TilePlanner(max_elements=None, max_depth=2), client) == [[0], [], [2], [1]]
+
+
+def test_gives_up_at_max_depth():
+    client = FakeClient([(0.1, 0.1)] * 3, fail_above=1)
+    with pytest.raises(overpy.exception.OverpassRuntimeError):
+        run(TilePlanner(max_elements=None, max_depth=1), client)
+    assert max(tile.depth for tile in client.queries) == 1
+
+
+def test_too_large():
+    assert too_large(TileTooLarge('many'))
+    assert too_large(overpy.exception.OverpassRuntimeError(msg='runtime error: Query run out of memory'))
+    assert not too_large(overpy.exception.OverpassRuntimeError(msg='runtime error: open64 failed'))
+    assert not too_large(overpy.exception.OverpassGatewayTimeout())
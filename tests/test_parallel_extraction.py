@@ -0,0 +1,32 @@
+import pytest
+
+import extract_from_pbf
+from src.utils.pbf_blocks import PBFBlocks
+from .conftest import read_outputs
+
+
+def extract(pbf_file, output_dir, output_format, workers):
+    output_dir.mkdir()
+    output = extract_from_pbf.make_output(output_format, output_dir)
+    handler = extract_from_pbf.run_extraction(str(pbf_file), workers=workers, output=output,
+                                              scratch_dir=output_dir)
+    extract_from_pbf.write_outputs(handler, output, output_dir, str(pbf_file))
+    return handler
+
+
+@pytest.mark.parametrize('output_format', ['json', 'ndjson', 'parquet'])
+def test_parallel_output_matches_single_process(tmp_path, sample_pbf, output_format):
+    # More block ranges than workers, so records of one city come from several parts
+    assert len(PBFBlocks(sample_pbf).split(2 * extract_from_pbf.RANGES_PER_WORKER)) > 2
+
+    single = extract(sample_pbf, tmp_path / 'single', output_format, workers=1)
+    parallel = extract(sample_pbf, tmp_path / 'parallel', output_format, workers=2)
+
+    assert read_outputs(tmp_path / 'parallel') == read_outputs(tmp_path / 'single')
+    assert parallel.stats['streets'] == single.stats['streets'] == 6000
+    assert parallel.stats['pois'] == single.stats['pois'] == 2700
+    for osm_type in ('nodes', 'ways', 'relations'):
+        assert parallel.stats[osm_type] == single.stats[osm_type]
+    # Neither the shared location index nor the worker parts are left behind
+    assert sorted(path.name for path in (tmp_path / 'parallel').iterdir()) == \
+        sorted(path.name for path in (tmp_path / 'single').iterdir())
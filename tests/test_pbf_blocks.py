@@ -0,0 +1,39 @@
+import osmium
+import pytest
+
+from src.utils.pbf_blocks import PBFBlocks, count_elements
+
+
+@pytest.fixture
+def pbf_file(tmp_path):
+    filename = tmp_path / 'sample.osm.pbf'
+    writer = osmium.SimpleWriter(str(filename))
+    for i in range(1, 20001):
+        writer.add_node(osmium.osm.mutable.Node(id=i * 7, location=(29 + i / 1e5, 41 + i / 1e5)))
+    for i in range(1, 3001):
+        writer.add_way(osmium.osm.mutable.Way(id=i, nodes=[i * 7, i * 7 + 7], tags={'highway': 'service'}))
+    for i in range(1, 11):
+        writer.add_relation(osmium.osm.mutable.Relation(id=i, members=[('w', i, 'outer')]))
+    writer.close()
+    return filename
+
+
+def test_count_elements(pbf_file):
+    blocks = PBFBlocks(pbf_file)
+    assert len(blocks) > 1
+    totals = {'nodes': 0, 'ways': 0, 'relations': 0}
+    for _, _, data in blocks.segments(0, 64 * 1024):
+        for osm_type, count in count_elements(data).items():
+            totals[osm_type] += count
+    assert totals == {'nodes': 20000, 'ways': 3000, 'relations': 10}
+
+
+def test_split(pbf_file):
+    blocks = PBFBlocks(pbf_file)
+    ranges = blocks.split(3)
+    assert 1 < len(ranges) <= 3
+    assert ranges[0][0] == blocks.blocks[0].offset and ranges[-1][1] == blocks.end
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    counts = [count_elements(data) for start, end in ranges
+              for _, _, data in blocks.segments(start, end=end)]
+    assert sum(count['nodes'] for count in counts) == 20000
@@ -0,0 +1,107 @@
+import socket
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import overpy
+import pytest
+import requests
+
+from config import CONFIG
+from src.utils.retry_policy import (
+    FATAL, RATE_LIMITED, TRANSIENT, RetryPolicy, classify, parse_retry_after, parse_status, status_url
+)
+
+STATUS_FREE = """Connected as: 1234
+Current time: 2026-10-17T10:00:00Z
+Announced endpoint: none
+Rate limit: 2
+2 slots available now.
+Currently running queries (pid, space limit, time limit, start time):
+"""
+
+STATUS_BUSY = """Connected as: 1234
+Current time: 2026-10-17T10:00:00Z
+Announced endpoint: none
+Rate limit: 2
+Slot available after: 2026-10-17T10:00:41Z, in 41 seconds.
+Slot available after: 2026-10-17T10:00:12Z, in 12 seconds.
+Currently running queries (pid, space limit, time limit, start time):
+"""
+
+
+@pytest.mark.parametrize('error, expected', [
+    (overpy.exception.OverpassTooManyRequests(), RATE_LIMITED),
+    (overpy.exception.OverpassGatewayTimeout(), TRANSIENT),
+    (overpy.exception.OverpassRuntimeError(msg='runtime error: Query timed out'), TRANSIENT),
+    (overpy.exception.OverpassUnknownHTTPStatusCode(503), TRANSIENT),
+    (overpy.exception.OverpassUnknownHTTPStatusCode(408), TRANSIENT),
+    (overpy.exception.OverpassUnknownHTTPStatusCode(403), FATAL),
+    (overpy.exception.OverpassBadRequest('node(;out;', ['parse error']), FATAL),
+    (requests.exceptions.ConnectionError(), TRANSIENT),
+    (socket.timeout(), TRANSIENT),
+    (FileNotFoundError(), FATAL),
+    (ValueError('bad json'), FATAL),
+    (KeyError('id'), FATAL),
+])
+def test_classify(error, expected):
+    assert classify(error) == expected
+
+
+def test_classify_uses_last_error_of_max_retries():
+    error = overpy.exception.MaxRetriesReached(2, [ValueError(), overpy.exception.OverpassTooManyRequests()])
+    assert classify(error) == RATE_LIMITED
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after(' 120 ') == 120.0
+    assert parse_retry_after('soon') is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(later) <= 60
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_parse_status():
+    assert parse_status(STATUS_FREE) == 0.0
+    assert parse_status(STATUS_BUSY) == 12.0
+    assert parse_status(STATUS_BUSY.replace('in 12 seconds', 'in -3 seconds')) == 0.0
+    assert parse_status("Connected as: 1234\n0 slots available now.\n") is None
+
+
+def test_status_url():
+    assert status_url('https://overpass-api.de/api/interpreter') == 'https://overpass-api.de/api/status'
+    assert status_url('http://localhost:8080/api/interpreter/') == 'http://localhost:8080/api/status'
+    assert status_url('https://example.org/query') is None
+    assert status_url('/var/lib/overpass/interpreter') is None
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_retries=3, base_delay=1, max_delay=10, seed=1)
+    transient = overpy.exception.OverpassGatewayTimeout()
+    assert policy.should_retry(0, transient)
+    assert policy.should_retry(1, transient)
+    assert not policy.should_retry(2, transient)
+    assert not policy.should_retry(0, ValueError())
+
+
+def test_max_retries_zero_is_kept(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'max_retries', 5)
+    assert RetryPolicy().max_retries == 5
+    policy = RetryPolicy(max_retries=0)
+    assert policy.max_retries == 0
+    assert not policy.should_retry(0, overpy.exception.OverpassGatewayTimeout())
+
+
+def test_wait_time():
+    policy = RetryPolicy(max_retries=3, base_delay=2, max_delay=10, seed=1)
+    limited = overpy.exception.OverpassTooManyRequests()
+    assert policy.needs_status(limited)
+    assert policy.wait_time(0, limited, STATUS_BUSY) == 10
+    assert policy.wait_time(0, limited, STATUS_FREE) == 0.0
+    limited.retry_after = 4.0
+    assert not policy.needs_status(limited)
+    assert policy.wait_time(5, limited) == 4.0
+    for attempt in range(6):
+        assert 0 <= policy.wait_time(attempt, overpy.exception.OverpassGatewayTimeout()) <= min(10, 2 * 2 ** attempt)
+    assert [policy.cooldown(failures) for failures in (1, 2, 3, 4)] == [2, 4, 8, 10]
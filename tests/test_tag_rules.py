@@ -0,0 +1,49 @@
+import pytest
+
+from config import POI_CATEGORIES
+from src.utils.tag_rules import TagRule, TagRules
+
+CATEGORIES = {
+    'healthcare': {'filters': ['amenity=hospital', 'amenity=clinic']},
+    'education': {'filters': ['amenity=school', 'building=school']},
+    'transportation': {'filters': ['railway=station', 'amenity=hospital']},
+}
+
+
+def test_match():
+    rules = TagRules(CATEGORIES)
+    assert rules.match({'amenity': 'clinic', 'name': 'X'}) == TagRule('healthcare', 'amenity', 'clinic')
+    assert rules.match([('railway', 'station')]).category == 'transportation'
+    assert rules.match({'amenity': 'cafe'}) is None
+    assert rules.match({}) is None
+
+
+def test_first_listed_filter_wins():
+    rules = TagRules(CATEGORIES)
+    # Listed under an earlier category, so not a transportation filter
+    assert rules.match({'amenity': 'hospital'}).category == 'healthcare'
+    assert rules.for_category('transportation') == [TagRule('transportation', 'railway', 'station')]
+    # With several matching tags, the filter listed first wins, whatever the tag order
+    assert rules.match({'railway': 'station', 'building': 'school'}).category == 'education'
+    assert rules.match({'building': 'school', 'amenity': 'school'}) == TagRule('education', 'amenity', 'school')
+
+
+def test_lists():
+    rules = TagRules(CATEGORIES)
+    assert len(rules) == 5
+    assert rules.keys() == ['amenity', 'building', 'railway']
+    assert rules.categories() == ['healthcare', 'education', 'transportation']
+    assert rules.tag_pairs()[0] == ('amenity', 'hospital')
+    assert rules.rules[0].overpass() == '["amenity"="hospital"]'
+
+
+@pytest.mark.parametrize('filter_str', ['amenity', 'amenity=', '=school'])
+def test_invalid_filter(filter_str):
+    with pytest.raises(ValueError):
+        TagRules({'education': {'filters': [filter_str]}})
+
+
+def test_configured_categories():
+    rules = TagRules(POI_CATEGORIES)
+    assert set(rules.categories()) <= set(POI_CATEGORIES)
+    assert all(rules.match({rule.key: rule.value}) is not None for rule in rules)
@@ -0,0 +1,143 @@
+import osmium
+import pytest
+
+import extract_from_pbf
+import update_from_osc
+from src.utils.extraction_state import ExtractionState
+from .conftest import read_outputs
+
+m = osmium.osm.mutable
+
+# A closed-way POI (100), four streets in two cities, node POIs and a
+# multipolygon POI (400)
+NODES = {
+    1: (29.000, 41.000), 2: (29.010, 41.000), 3: (29.010, 41.010), 4: (29.000, 41.010),
+    11: (29.100, 41.100), 12: (29.110, 41.100), 13: (29.200, 41.200), 14: (29.210, 41.200),
+    15: (30.100, 40.100), 16: (30.110, 40.100), 17: (30.200, 40.200), 18: (30.210, 40.200),
+    31: (29.500, 41.500), 32: (29.520, 41.500), 33: (29.520, 41.520), 34: (29.500, 41.520),
+}
+POI_NODES = {
+    21: ((29.300, 41.300), 'school', 'X'),
+    22: ((29.310, 41.310), 'bank', 'X'),
+    23: ((30.300, 40.300), 'pharmacy', 'Y'),
+    24: ((30.310, 40.310), 'school', 'Y'),
+}
+STREETS = {200: ([11, 12], 'S1', 'X'), 201: ([13, 14], 'S2', 'X'),
+           202: ([15, 16], 'S3', 'Y'), 203: ([17, 18], 'S4', 'Y')}
+
+# Creates, modifies and deletes of POIs and streets, and moved nodes of an
+# unchanged street (11) and closed-way POI (2)
+CHANGES = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <node id="2" version="2" lat="40.995" lon="29.030"/>
+    <node id="11" version="2" lat="41.105" lon="29.095"/>
+    <node id="21" version="2" lat="41.300" lon="29.300">
+      <tag k="amenity" v="bank"/><tag k="name" v="P21"/><tag k="addr:city" v="X"/>
+    </node>
+    <node id="23" version="2" lat="40.300" lon="30.300"/>
+    <way id="201" version="2">
+      <nd ref="13"/><nd ref="14"/>
+      <tag k="highway" v="residential"/><tag k="name" v="S2b"/><tag k="addr:city" v="X"/>
+    </way>
+    <way id="202" version="2">
+      <nd ref="15"/><nd ref="16"/>
+      <tag k="highway" v="residential"/><tag k="name" v="S3"/><tag k="addr:city" v="X"/>
+    </way>
+    <relation id="400" version="2">
+      <member type="way" ref="300" role="outer"/>
+      <tag k="type" v="multipolygon"/><tag k="amenity" v="school"/>
+      <tag k="name" v="Campus 2"/><tag k="addr:city" v="X"/>
+    </relation>
+  </modify>
+  <create>
+    <node id="25" version="1" lat="40.320" lon="30.320">
+      <tag k="amenity" v="hospital"/><tag k="name" v="P25"/><tag k="addr:city" v="Y"/>
+    </node>
+    <node id="41" version="1" lat="40.400" lon="30.400"/>
+    <node id="42" version="1" lat="40.400" lon="30.410"/>
+    <way id="204" version="1">
+      <nd ref="41"/><nd ref="42"/>
+      <tag k="highway" v="residential"/><tag k="name" v="S5"/><tag k="addr:city" v="Y"/>
+    </way>
+  </create>
+  <delete>
+    <node id="24" version="2" lat="40.310" lon="30.310"/>
+    <way id="203" version="2"/>
+  </delete>
+</osmChange>
+"""
+
+
+def write_base_pbf(filename):
+    writer = osmium.SimpleWriter(str(filename))
+    nodes = [m.Node(id=i, version=1, location=location) for i, location in NODES.items()]
+    nodes += [
+        m.Node(id=i, version=1, location=location,
+               tags={'amenity': amenity, 'name': f"P{i}", 'addr:city': city})
+        for i, (location, amenity, city) in POI_NODES.items()
+    ]
+    for node in sorted(nodes, key=lambda n: n.id):
+        writer.add_node(node)
+    writer.add_way(m.Way(id=100, version=1, nodes=[1, 2, 3, 4, 1],
+                         tags={'amenity': 'hospital', 'name': 'H', 'addr:city': 'X'}))
+    for way_id, (refs, name, city) in STREETS.items():
+        writer.add_way(m.Way(id=way_id, version=1, nodes=refs,
+                             tags={'highway': 'residential', 'name': name, 'addr:city': city}))
+    writer.add_way(m.Way(id=300, version=1, nodes=[31, 32, 33, 34, 31]))
+    writer.add_relation(m.Relation(id=400, version=1, members=[('w', 300, 'outer')],
+                                   tags={'type': 'multipolygon', 'amenity': 'school',
+                                         'name': 'Campus', 'addr:city': 'X'}))
+    writer.close()
+
+
+def extract(pbf_file, output_dir, output_format, **kwargs):
+    output_dir.mkdir()
+    output = extract_from_pbf.make_output(output_format, output_dir)
+    handler = extract_from_pbf.run_extraction(str(pbf_file), output=output, **kwargs)
+    extract_from_pbf.write_outputs(handler, output, output_dir, str(pbf_file))
+
+
+@pytest.mark.parametrize('output_format', ['json', 'ndjson', 'parquet'])
+def test_update_matches_full_extraction(tmp_path, output_format):
+    base = tmp_path / 'base.osm.pbf'
+    changes = tmp_path / 'changes.osc'
+    changed = tmp_path / 'changed.osm.pbf'
+    write_base_pbf(base)
+    changes.write_text(CHANGES, encoding='utf-8')
+    reader = osmium.MergeInputReader()
+    reader.add_file(str(changes))
+    writer = osmium.io.Writer(str(changed))
+    reader.apply_to_reader(osmium.io.Reader(str(base)), writer)
+    writer.close()
+
+    location_index = f"dense_file_array,{tmp_path / 'nodes.idx'}"
+    state = ExtractionState(tmp_path / 'state.sqlite')
+    try:
+        extract(base, tmp_path / 'updated', output_format,
+                location_index=location_index, state=state)
+        before = read_outputs(tmp_path / 'updated')
+        handler = update_from_osc.apply_changes([changes], state, location_index)
+        update_from_osc.rewrite_city_files(state, handler, tmp_path / 'updated', output_format)
+    finally:
+        state.close()
+    extract(changed, tmp_path / 'full', output_format)
+
+    assert handler.dirty == {'streets': {'X', 'Y'}, 'pois': {'X', 'Y'}}
+    updated, full = read_outputs(tmp_path / 'updated'), read_outputs(tmp_path / 'full')
+    assert updated == full
+    # Only their nodes moved, yet the street and the closed-way POI were recomputed
+    assert find(before, 200)['center_lon'] != find(updated, 200)['center_lon']
+    assert find(before, 100, 'way')['lat'] != find(updated, 100, 'way')['lat']
+    assert find(updated, 24, 'node') is None and find(updated, 25, 'node') is not None
+
+
+def find(outputs, osm_id, poi_type=None):
+    """The street record of a way, or with poi_type the POI record of an element"""
+    for data in outputs.values():
+        if isinstance(data, dict):
+            data = data.get('streets') or data.get('pois') or []
+        for item in data:
+            if item['id'] == osm_id and item.get('type') == poi_type:
+                return item
+    return None